@@ -0,0 +1,105 @@
+"""initial schema
+
+The tables which existed before the first migration, so that `alembic upgrade
+head` works on an empty database as well as `python -m selfassess.initdb`.
+Databases created before migrations were used should be stamped with this
+revision before upgrading.
+
+Revision ID: 0e2b7f4c9a15
+Revises: 
+Create Date: 2026-10-18 19:12:44.201733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0e2b7f4c9a15'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('word',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('word', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('word')
+    )
+    op.create_table('participant',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('token', sa.String(), nullable=False),
+        sa.Column('create_date', sa.DateTime(), nullable=False),
+        sa.Column('accept_date', sa.DateTime(), nullable=True),
+        sa.Column('withdraw_date', sa.DateTime(), nullable=True),
+        sa.Column('email', sa.String(), nullable=False),
+        sa.Column('given_name', sa.String(), nullable=True),
+        sa.Column('surname', sa.String(), nullable=True),
+        sa.Column('proof', sa.String(), nullable=True),
+        sa.Column('proof_upload_date', sa.DateTime(), nullable=True),
+        sa.Column('proof_accept_date', sa.DateTime(), nullable=True),
+        sa.Column('proof_type', sa.Enum('yki_intermediate', 'yki_advanced', 'other', 'course_english_degree', 'completed_finnish_upper_secondary', 'completed_finnish_degree', name='prooftype'), nullable=False),
+        sa.Column('proof_age', sa.Enum('lt1', 'lt3', 'lt5', 'gte5', name='proofage'), nullable=False),
+        sa.Column('cefr_proof_speaking', sa.Integer(), nullable=True),
+        sa.Column('cefr_proof_writing', sa.Integer(), nullable=True),
+        sa.Column('cefr_proof_listening_comprehension', sa.Integer(), nullable=True),
+        sa.Column('cefr_proof_reading_comprehension', sa.Integer(), nullable=True),
+        sa.Column('cefr_selfassess_speaking', sa.Integer(), nullable=True),
+        sa.Column('cefr_selfassess_writing', sa.Integer(), nullable=True),
+        sa.Column('cefr_selfassess_listening_comprehension', sa.Integer(), nullable=True),
+        sa.Column('cefr_selfassess_reading_comprehension', sa.Integer(), nullable=True),
+        sa.Column('text_on_proof', sa.String(), nullable=False),
+        sa.Column('selfassess_start_date', sa.DateTime(), nullable=True),
+        sa.Column('selfassess_finish_date', sa.DateTime(), nullable=True),
+        sa.Column('miniexam_start_date', sa.DateTime(), nullable=True),
+        sa.Column('miniexam_finish_date', sa.DateTime(), nullable=True),
+        sa.Column('next_response', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email')
+    )
+    op.create_table('response_slot',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('participant_id', sa.Integer(), nullable=True),
+        sa.Column('word_id', sa.Integer(), nullable=True),
+        sa.Column('response_order', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['participant_id'], ['participant.id'], ),
+        sa.ForeignKeyConstraint(['word_id'], ['word.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('response',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('response_slot_id', sa.Integer(), nullable=True),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.Column('rating', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['response_slot_id'], ['response_slot.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('presentation',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('response_slot_id', sa.Integer(), nullable=True),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['response_slot_id'], ['response_slot.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('session_log_entry',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('participant_id', sa.Integer(), nullable=True),
+        sa.Column('type', sa.Enum('overview_hit', 'selfassess_hit', 'selfassess_focus', 'selfassess_blur', 'miniexam_focus', 'miniexam_blur', 'miniexam_input', 'selfassess_input', name='sessionevent'), nullable=True),
+        sa.Column('payload', sa.JSON(), nullable=True),
+        sa.ForeignKeyConstraint(['participant_id'], ['participant.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('session_log_entry')
+    op.drop_table('presentation')
+    op.drop_table('response')
+    op.drop_table('response_slot')
+    op.drop_table('participant')
+    op.drop_table('word')
+    bind = op.get_bind()
+    for name in ('sessionevent', 'proofage', 'prooftype'):
+        sa.Enum(name=name).drop(bind, checkfirst=True)
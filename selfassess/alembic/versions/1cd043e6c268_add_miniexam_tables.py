@@ -1,7 +1,7 @@
 """Add miniexam tables
 
 Revision ID: 1cd043e6c268
-Revises: 
+Revises: 0e2b7f4c9a15
 Create Date: 2021-08-26 09:41:05.325234
 
 """
@@ -11,7 +11,7 @@ import sqlalchemy as sa
 
 # revision identifiers, used by Alembic.
 revision = '1cd043e6c268'
-down_revision = None
+down_revision = '0e2b7f4c9a15'
 branch_labels = None
 depends_on = None
 
@@ -0,0 +1,54 @@
+"""add composite indexes
+
+Revision ID: 3f1c2a9d7b84
+Revises: 7f55f03c3cef
+Create Date: 2026-10-18 09:12:40.518230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d7b84'
+down_revision = '7f55f03c3cef'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('participant', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_participant_token'), ['token'], unique=False)
+
+    with op.batch_alter_table('response_slot', schema=None) as batch_op:
+        batch_op.drop_index('ix_response_slot_participant_id')
+        batch_op.create_index('ix_response_slot_participant_id_response_order', ['participant_id', 'response_order', 'word_id'], unique=False)
+        batch_op.create_index('ix_response_slot_participant_id_word_id', ['participant_id', 'word_id', 'response_order'], unique=False)
+
+    with op.batch_alter_table('response', schema=None) as batch_op:
+        batch_op.drop_index('ix_response_response_slot_id')
+        batch_op.create_index('ix_response_response_slot_id_timestamp', ['response_slot_id', 'timestamp'], unique=False)
+
+    with op.batch_alter_table('miniexam_slot', schema=None) as batch_op:
+        batch_op.drop_index('ix_miniexam_slot_participant_id')
+        batch_op.create_index('ix_miniexam_slot_participant_id_word_id', ['participant_id', 'word_id'], unique=False)
+        batch_op.create_index('ix_miniexam_slot_participant_id_miniexam_order', ['participant_id', 'miniexam_order'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('miniexam_slot', schema=None) as batch_op:
+        batch_op.drop_index('ix_miniexam_slot_participant_id_miniexam_order')
+        batch_op.drop_index('ix_miniexam_slot_participant_id_word_id')
+        batch_op.create_index('ix_miniexam_slot_participant_id', ['participant_id'], unique=False)
+
+    with op.batch_alter_table('response', schema=None) as batch_op:
+        batch_op.drop_index('ix_response_response_slot_id_timestamp')
+        batch_op.create_index('ix_response_response_slot_id', ['response_slot_id'], unique=False)
+
+    with op.batch_alter_table('response_slot', schema=None) as batch_op:
+        batch_op.drop_index('ix_response_slot_participant_id_word_id')
+        batch_op.drop_index('ix_response_slot_participant_id_response_order')
+        batch_op.create_index('ix_response_slot_participant_id', ['participant_id'], unique=False)
+
+    with op.batch_alter_table('participant', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_participant_token'))
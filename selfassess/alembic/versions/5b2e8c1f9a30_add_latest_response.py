@@ -0,0 +1,55 @@
+"""add latest response
+
+Revision ID: 5b2e8c1f9a30
+Revises: a4e7d1c09b2f
+Create Date: 2026-10-18 11:24:40.118307
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b2e8c1f9a30'
+down_revision = 'a4e7d1c09b2f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('latest_response',
+    sa.Column('response_slot_id', sa.Integer(), nullable=False),
+    sa.Column('participant_id', sa.Integer(), nullable=False),
+    sa.Column('response_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['participant_id'], ['participant.id'], ),
+    sa.ForeignKeyConstraint(['response_id'], ['response.id'], ),
+    sa.ForeignKeyConstraint(['response_slot_id'], ['response_slot.id'], ),
+    sa.PrimaryKeyConstraint('response_slot_id')
+    )
+    with op.batch_alter_table('latest_response', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_latest_response_participant_id'), ['participant_id'], unique=False)
+
+    # Backfill. Each lookup is a single probe of
+    # ix_response_response_slot_id_timestamp.
+    op.execute("""
+        INSERT INTO latest_response (response_slot_id, participant_id, response_id)
+        SELECT response_slot.id, response_slot.participant_id, (
+            SELECT response.id
+            FROM response
+            WHERE response.response_slot_id = response_slot.id
+            ORDER BY response.timestamp DESC, response.id DESC
+            LIMIT 1
+        ) AS response_id
+        FROM response_slot
+        WHERE EXISTS (
+            SELECT 1 FROM response
+            WHERE response.response_slot_id = response_slot.id
+        )
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('latest_response', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_latest_response_participant_id'))
+
+    op.drop_table('latest_response')
@@ -0,0 +1,38 @@
+"""add seeded slot order
+
+Revision ID: a4e7d1c09b2f
+Revises: 3f1c2a9d7b84
+Create Date: 2026-10-18 10:02:17.264981
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4e7d1c09b2f'
+down_revision = '3f1c2a9d7b84'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('participant', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('slot_seed', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('slot_words', sa.Integer(), nullable=True))
+
+    # Slots created lazily could otherwise be created twice by concurrent
+    # requests
+    with op.batch_alter_table('response_slot', schema=None) as batch_op:
+        batch_op.drop_index('ix_response_slot_participant_id_response_order')
+        batch_op.create_index('ix_response_slot_participant_id_response_order', ['participant_id', 'response_order', 'word_id'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('response_slot', schema=None) as batch_op:
+        batch_op.drop_index('ix_response_slot_participant_id_response_order')
+        batch_op.create_index('ix_response_slot_participant_id_response_order', ['participant_id', 'response_order', 'word_id'], unique=False)
+
+    with op.batch_alter_table('participant', schema=None) as batch_op:
+        batch_op.drop_column('slot_words')
+        batch_op.drop_column('slot_seed')
@@ -0,0 +1,41 @@
+"""add participant session
+
+Revision ID: a7d2e5c8b461
+Revises: e6c4b2a9f153
+Create Date: 2026-10-18 18:02:37.915260
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d2e5c8b461'
+down_revision = 'e6c4b2a9f153'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('participant_session',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('participant_id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.Enum('selfassess', 'miniexam', 'other', name='sessionkind'), nullable=False),
+        sa.Column('start_time', sa.DateTime(), nullable=False),
+        sa.Column('end_time', sa.DateTime(), nullable=False),
+        sa.Column('response_count', sa.Integer(), nullable=False),
+        sa.Column('pc_count', sa.Integer(), nullable=False),
+        sa.Column('mobile_count', sa.Integer(), nullable=False),
+        sa.Column('tablet_count', sa.Integer(), nullable=False),
+        sa.Column('unknown_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['participant_id'], ['participant.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_participant_session_participant_id_kind_start_time', 'participant_session', ['participant_id', 'kind', 'start_time'], unique=False)
+    # Fill the table with `python -m selfassess.rebuild_sessions`
+
+
+def downgrade():
+    op.drop_index('ix_participant_session_participant_id_kind_start_time', table_name='participant_session')
+    op.drop_table('participant_session')
+    sa.Enum(name='sessionkind').drop(op.get_bind(), checkfirst=True)
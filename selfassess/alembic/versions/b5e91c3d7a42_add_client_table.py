@@ -0,0 +1,157 @@
+"""add client table
+
+Revision ID: b5e91c3d7a42
+Revises: c2d7f4a81e53
+Create Date: 2026-10-18 15:42:09.318274
+
+"""
+import hashlib
+import json
+
+from alembic import op
+import sqlalchemy as sa
+import user_agents
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e91c3d7a42'
+down_revision = 'c2d7f4a81e53'
+branch_labels = None
+depends_on = None
+
+
+session_log_entry = sa.table(
+    'session_log_entry',
+    sa.column('id', sa.Integer()),
+    sa.column('payload', sa.JSON()),
+    sa.column('client_id', sa.Integer()),
+)
+
+
+# Frozen copies of the helpers in selfassess.clients as they were when this
+# migration was written, so that later changes to them do not change what it
+# writes
+
+def ua_to_device(ua):
+    ua_parse = user_agents.parse(ua or "")
+    if ua_parse.is_tablet:
+        return "tablet"
+    elif ua_parse.is_mobile:
+        return "mobile"
+    elif ua_parse.is_pc:
+        return "pc"
+    else:
+        return "unknown"
+
+
+def client_hash(remote_addr, user_agent):
+    return hashlib.sha256(
+        json.dumps([remote_addr, user_agent]).encode("utf-8")
+    ).hexdigest()[:32]
+
+
+def client_row(remote_addr, user_agent):
+    return dict(
+        hash=client_hash(remote_addr, user_agent),
+        remote_addr=remote_addr,
+        user_agent=user_agent,
+        device=ua_to_device(user_agent),
+    )
+
+
+def decode_payload(payload):
+    # The web app stored payloads already encoded as JSON, so they come back
+    # as strings
+    if isinstance(payload, str):
+        payload = json.loads(payload)
+    if payload is None:
+        payload = {}
+    return payload.get('remote_addr'), payload.get('user_agent')
+
+
+def upgrade():
+    client = op.create_table('client',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('hash', sa.String(length=32), nullable=False),
+        sa.Column('remote_addr', sa.String(), nullable=True),
+        sa.Column('user_agent', sa.String(), nullable=True),
+        sa.Column('device', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('hash')
+    )
+    with op.batch_alter_table('session_log_entry', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('client_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_session_log_entry_client_id_client', 'client', ['client_id'], ['id'])
+
+    conn = op.get_bind()
+    entry_clients = [
+        (entry_id, decode_payload(payload))
+        for entry_id, payload in conn.execute(
+            sa.select(session_log_entry.c.id, session_log_entry.c.payload)
+        )
+    ]
+    clients = {
+        client_hash(*pair): pair
+        for _, pair in entry_clients
+    }
+    if clients:
+        op.bulk_insert(client, [
+            client_row(*pair) for pair in clients.values()
+        ])
+        ids = dict(conn.execute(sa.select(client.c.hash, client.c.id)).all())
+        conn.execute(
+            session_log_entry.update().where(
+                session_log_entry.c.id == sa.bindparam('entry_id')
+            ).values(client_id=sa.bindparam('new_client_id')),
+            [
+                {'entry_id': entry_id, 'new_client_id': ids[client_hash(*pair)]}
+                for entry_id, pair in entry_clients
+            ]
+        )
+
+    with op.batch_alter_table('session_log_entry', schema=None) as batch_op:
+        batch_op.drop_column('payload')
+
+
+def downgrade():
+    with op.batch_alter_table('session_log_entry', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('payload', sa.JSON(), nullable=True))
+
+    conn = op.get_bind()
+    client = sa.table(
+        'client',
+        sa.column('id', sa.Integer()),
+        sa.column('remote_addr', sa.String()),
+        sa.column('user_agent', sa.String()),
+    )
+    rows = [
+        {
+            'entry_id': entry_id,
+            'new_payload': json.dumps({
+                'remote_addr': remote_addr,
+                'user_agent': user_agent,
+            }),
+        }
+        for entry_id, remote_addr, user_agent in conn.execute(
+            sa.select(
+                session_log_entry.c.id,
+                client.c.remote_addr,
+                client.c.user_agent,
+            ).select_from(session_log_entry.join(
+                client, session_log_entry.c.client_id == client.c.id
+            ))
+        )
+    ]
+    if rows:
+        conn.execute(
+            session_log_entry.update().where(
+                session_log_entry.c.id == sa.bindparam('entry_id')
+            ).values(payload=sa.bindparam('new_payload')),
+            rows
+        )
+
+    with op.batch_alter_table('session_log_entry', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_session_log_entry_client_id_client', type_='foreignkey')
+        batch_op.drop_column('client_id')
+
+    op.drop_table('client')
@@ -0,0 +1,29 @@
+"""add word list version
+
+Revision ID: c2d7f4a81e53
+Revises: e81d4b6a2c57
+Create Date: 2026-10-18 16:21:40.318245
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2d7f4a81e53'
+down_revision = 'e81d4b6a2c57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    word_list_version = op.create_table('word_list_version',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(word_list_version, [{'id': 1, 'version': 1}])
+
+
+def downgrade():
+    op.drop_table('word_list_version')
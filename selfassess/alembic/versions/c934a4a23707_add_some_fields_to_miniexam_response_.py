@@ -16,9 +16,19 @@ branch_labels = None
 depends_on = None
 
 
+# PostgreSQL needs the types to exist before columns can use them. Databases
+# made with initdb already have them, with 'fi' which was added to the model
+# later without a migration.
+response_lang_enum = sa.Enum('en', 'hu', 'ru', 'fi', name='miniexamresponselanguage')
+response_type_enum = sa.Enum('trans_defn', 'topic', 'donotknow', name='miniexamresponsetype')
+
+
 def upgrade():
+    bind = op.get_bind()
+    response_lang_enum.create(bind, checkfirst=True)
+    response_type_enum.create(bind, checkfirst=True)
     # ### commands auto generated by Alembic - please adjust! ###
-    op.add_column('miniexam_response', sa.Column('response_lang', sa.Enum('en', 'hu', 'ru', name='miniexamresponselanguage'), nullable=True))
+    op.add_column('miniexam_response', sa.Column('response_lang', sa.Enum('en', 'hu', 'ru', 'fi', name='miniexamresponselanguage'), nullable=True))
     op.add_column('miniexam_response', sa.Column('response_type', sa.Enum('trans_defn', 'topic', 'donotknow', name='miniexamresponsetype'), nullable=True))
     # ### end Alembic commands ###
 
@@ -28,3 +38,6 @@ def downgrade():
     op.drop_column('miniexam_response', 'response_type')
     op.drop_column('miniexam_response', 'response_lang')
     # ### end Alembic commands ###
+    bind = op.get_bind()
+    response_type_enum.drop(bind, checkfirst=True)
+    response_lang_enum.drop(bind, checkfirst=True)
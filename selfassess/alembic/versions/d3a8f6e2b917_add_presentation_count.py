@@ -0,0 +1,30 @@
+"""add presentation count
+
+Revision ID: d3a8f6e2b917
+Revises: b5e91c3d7a42
+Create Date: 2026-10-18 16:20:51.704913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a8f6e2b917'
+down_revision = 'b5e91c3d7a42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('presentation', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('count', sa.Integer(), server_default='1', nullable=False))
+        batch_op.drop_index('ix_presentation_response_slot_id')
+        batch_op.create_index('ix_presentation_response_slot_id_timestamp', ['response_slot_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('presentation', schema=None) as batch_op:
+        batch_op.drop_index('ix_presentation_response_slot_id_timestamp')
+        batch_op.create_index('ix_presentation_response_slot_id', ['response_slot_id'], unique=False)
+        batch_op.drop_column('count')
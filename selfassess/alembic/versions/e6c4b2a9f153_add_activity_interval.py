@@ -0,0 +1,40 @@
+"""add activity interval
+
+Revision ID: e6c4b2a9f153
+Revises: d3a8f6e2b917
+Create Date: 2026-10-18 17:05:12.480391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6c4b2a9f153'
+down_revision = 'd3a8f6e2b917'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('activity_interval',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('participant_id', sa.Integer(), nullable=False),
+        sa.Column('client_id', sa.Integer(), nullable=True),
+        sa.Column('kind', sa.Enum('selfassess', 'miniexam', name='activitykind'), nullable=False),
+        sa.Column('start_time', sa.DateTime(), nullable=False),
+        sa.Column('end_time', sa.DateTime(), nullable=False),
+        sa.Column('focus_count', sa.Integer(), nullable=False),
+        sa.Column('blur_count', sa.Integer(), nullable=False),
+        sa.Column('input_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['client_id'], ['client.id'], ),
+        sa.ForeignKeyConstraint(['participant_id'], ['participant.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_activity_interval_participant_id'), 'activity_interval', ['participant_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_activity_interval_participant_id'), table_name='activity_interval')
+    op.drop_table('activity_interval')
+    sa.Enum(name='activitykind').drop(op.get_bind(), checkfirst=True)
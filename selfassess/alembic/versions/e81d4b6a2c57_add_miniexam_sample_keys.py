@@ -0,0 +1,63 @@
+"""add miniexam sample keys
+
+Revision ID: e81d4b6a2c57
+Revises: 5b2e8c1f9a30
+Create Date: 2026-10-18 12:05:13.552091
+
+"""
+import random
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e81d4b6a2c57'
+down_revision = '5b2e8c1f9a30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('latest_response', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rating', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('sample_key', sa.Float(), nullable=True))
+
+    op.execute("""
+        UPDATE latest_response SET rating = (
+            SELECT response.rating FROM response
+            WHERE response.id = latest_response.response_id
+        )
+    """)
+    conn = op.get_bind()
+    latest_response = sa.table(
+        'latest_response',
+        sa.column('response_slot_id', sa.Integer()),
+        sa.column('sample_key', sa.Float()),
+    )
+    slot_ids = [
+        slot_id for slot_id, in conn.execute(
+            sa.select(latest_response.c.response_slot_id)
+        )
+    ]
+    if slot_ids:
+        conn.execute(
+            latest_response.update().where(
+                latest_response.c.response_slot_id == sa.bindparam('slot_id')
+            ).values(sample_key=sa.bindparam('key')),
+            [{'slot_id': slot_id, 'key': random.random()} for slot_id in slot_ids]
+        )
+
+    with op.batch_alter_table('latest_response', schema=None) as batch_op:
+        batch_op.alter_column('rating', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('sample_key', existing_type=sa.Float(), nullable=False)
+        batch_op.drop_index('ix_latest_response_participant_id')
+        batch_op.create_index('ix_latest_response_participant_id_rating_sample_key', ['participant_id', 'rating', 'sample_key'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('latest_response', schema=None) as batch_op:
+        batch_op.drop_index('ix_latest_response_participant_id_rating_sample_key')
+        batch_op.create_index('ix_latest_response_participant_id', ['participant_id'], unique=False)
+        batch_op.drop_column('sample_key')
+        batch_op.drop_column('rating')
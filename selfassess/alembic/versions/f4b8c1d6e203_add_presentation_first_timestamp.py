@@ -0,0 +1,30 @@
+"""add presentation first timestamp
+
+Revision ID: f4b8c1d6e203
+Revises: a7d2e5c8b461
+Create Date: 2026-10-18 21:14:09.362184
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4b8c1d6e203'
+down_revision = 'a7d2e5c8b461'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('presentation', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('first_timestamp', sa.DateTime(), nullable=True))
+    # Rows which were already coalesced have lost their first time
+    op.execute("UPDATE presentation SET first_timestamp = timestamp")
+    with op.batch_alter_table('presentation', schema=None) as batch_op:
+        batch_op.alter_column('first_timestamp', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('presentation', schema=None) as batch_op:
+        batch_op.drop_column('first_timestamp')
@@ -0,0 +1,209 @@
+"""
+Activity intervals built from /track pings.
+
+The pages ping /track on every focus, blur and input, which used to be a
+session log row each, although all the analysis wants from them is when a
+participant was active and on what device. Instead each worker keeps an open
+interval per participant and page (self-assessment or mini-exam) and extends
+it with every ping. An interval is closed, and written as one
+activity_interval row with the number of each kind of event, once
+
+ * no ping has arrived for `gap` seconds,
+ * it has been open for `max_length` seconds, which bounds what is lost if
+   the worker dies, or
+ * a ping arrives from a different client or the worker shuts down.
+
+As long as `gap` is no longer than selfassess.sessions.SESSION_TIMEOUT,
+sessions built from intervals are the same as sessions built from pings.
+Participants' pings going to different workers just gives overlapping
+intervals.
+"""
+import asyncio
+import datetime
+import logging
+
+from sqlalchemy import insert
+
+from .clients import ClientIds, client_hash, ua_to_device
+from .database import ActivityInterval, ActivityKind, SessionEvent, SessionKind
+from .sessions import Activity
+
+
+logger = logging.getLogger(__name__)
+
+# Event type -> (page, counter)
+TRACKED_EVENTS = {
+    SessionEvent.selfassess_focus: (ActivityKind.selfassess, "focus_count"),
+    SessionEvent.selfassess_blur: (ActivityKind.selfassess, "blur_count"),
+    SessionEvent.selfassess_input: (ActivityKind.selfassess, "input_count"),
+    SessionEvent.miniexam_focus: (ActivityKind.miniexam, "focus_count"),
+    SessionEvent.miniexam_blur: (ActivityKind.miniexam, "blur_count"),
+    SessionEvent.miniexam_input: (ActivityKind.miniexam, "input_count"),
+}
+
+
+class _Interval:
+    def __init__(self, participant_id, kind, client, timestamp):
+        self.participant_id = participant_id
+        self.kind = kind
+        self.client = client
+        self.start_time = timestamp
+        self.end_time = timestamp
+        self.counts = dict.fromkeys(("focus_count", "blur_count", "input_count"), 0)
+
+    def row(self):
+        return dict(
+            participant_id=self.participant_id,
+            kind=self.kind,
+            client=self.client,
+            start_time=self.start_time,
+            end_time=self.end_time,
+            **self.counts
+        )
+
+
+async def insert_intervals(session, rows, client_ids):
+    ids = await client_ids.lookup(session, {row["client"] for row in rows})
+    await session.execute(insert(ActivityInterval.__table__).values([
+        dict(
+            {key: value for key, value in row.items() if key != "client"},
+            client_id=ids[client_hash(*row["client"])],
+        )
+        for row in rows
+    ]))
+    activity = Activity()
+    for row in rows:
+        activity.add(
+            row["participant_id"],
+            SessionKind[row["kind"].name],
+            row["start_time"],
+            row["end_time"],
+            device=ua_to_device(row["client"][1]),
+            device_count=sum(
+                row[counter]
+                for counter in ("focus_count", "blur_count", "input_count")
+            ),
+        )
+    await activity.write(session)
+    return ids
+
+
+class ActivityTracker:
+    def __init__(
+        self,
+        writer,
+        gap=60.0,
+        max_length=900.0,
+        sweep_interval=10.0,
+        max_batch=100,
+        clock=datetime.datetime.now,
+    ):
+        self.writer = writer
+        # SQLite allows 999 bound parameters per statement in older versions
+        # and an interval row has 9 of them
+        self.max_batch = max_batch
+        self.gap = datetime.timedelta(seconds=gap)
+        self.max_length = datetime.timedelta(seconds=max_length)
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self.client_ids = ClientIds()
+        self.written = 0
+        self.dropped = 0
+        self._open = {}
+        self._closed = []
+        self._stopping = None
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None
+
+    def stats(self):
+        return {
+            "open": len(self._open),
+            "written": self.written,
+            "dropped": self.dropped,
+        }
+
+    def ping(self, participant_id, event_type, remote_addr, user_agent):
+        kind, counter = TRACKED_EVENTS[event_type]
+        client = (remote_addr, user_agent)
+        now = self.clock()
+        key = (participant_id, kind)
+        interval = self._open.get(key)
+        if interval is not None and (
+            now - interval.end_time > self.gap
+            or now - interval.start_time > self.max_length
+            or interval.client != client
+        ):
+            self._close(key)
+            interval = None
+        if interval is None:
+            interval = self._open[key] = _Interval(
+                participant_id, kind, client, now
+            )
+        interval.end_time = now
+        interval.counts[counter] += 1
+
+    def _close(self, key):
+        self._closed.append(self._open.pop(key).row())
+
+    def _close_idle(self):
+        now = self.clock()
+        for key, interval in list(self._open.items()):
+            if (
+                now - interval.end_time > self.gap
+                or now - interval.start_time > self.max_length
+            ):
+                self._close(key)
+
+    async def start(self):
+        self._stopping = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """
+        Close every open interval and wait until they have been written.
+        """
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+        if self.dropped:
+            logger.warning(
+                "Activity tracker stopped: %d dropped intervals", self.dropped
+            )
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._stopping.wait(), self.sweep_interval
+                )
+            except asyncio.TimeoutError:
+                self._close_idle()
+            else:
+                for key in list(self._open):
+                    self._close(key)
+                await self._flush()
+                return
+            await self._flush()
+
+    async def _flush(self):
+        while self._closed:
+            batch = self._closed[:self.max_batch]
+            self._closed = self._closed[self.max_batch:]
+            await self._write(batch)
+
+    async def _write(self, batch):
+        try:
+            ids = await self.writer.submit(
+                insert_intervals, batch, self.client_ids
+            )
+        except Exception:
+            self.dropped += len(batch)
+            logger.exception("Failed to write %d activity intervals", len(batch))
+            return
+        self.client_ids.remember(ids)
+        self.written += len(batch)
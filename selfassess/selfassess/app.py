@@ -11,39 +11,59 @@ else:
     has_sentry = False
 
 import json
+import hashlib
 from os.path import join as pjoin
 from functools import wraps
+from collections import namedtuple
 import datetime
 from werkzeug.utils import secure_filename
 import langcodes
 
 from quart import (
     _request_ctx_stack, Quart, request, session, abort, redirect,
-    url_for, flash, make_response, Response as QuartResponse
+    url_for, flash, make_response, g, Response as QuartResponse
 )
 from quart.templating import render_template
+from quart.signals import before_render_template, template_rendered
 from werkzeug.local import LocalProxy
 from .database import (
     Participant,
     ParticipantLanguage,
     ParticipantResponseLanguage,
-    Presentation,
-    Word,
-    ResponseSlot,
     Response,
-    SessionLogEntry,
+    LatestResponse,
     SessionEvent,
     MiniexamSlot,
     MiniexamResponse,
     MiniexamResponseType,
     MiniexamResponseLanguage
 )
-from sqlalchemy import select
-from sqlalchemy import func
-from sqlalchemy.orm import joinedload
+from sqlalchemy import insert, update
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.ext.asyncio import async_scoped_session
 from .utils import get_async_session
-from .queries import recent_responses_for_participant, native_language
+from .ingest import EventQueue
+from .activity import ActivityTracker
+from .cache import TTLCache
+from .wordqueue import WordQueue
+from .writer import Writer
+from .wordlist import WordList
+from .presentations import PRESENTATION_WINDOW, add_presentation
+from .sessions import Activity
+from . import metrics
+from .slots import ensure_slot
+from .queries import (
+    miniexam_pool_sizes,
+    miniexam_pool_sample,
+    native_language,
+    participant_for_token,
+    response_at,
+    participant_position,
+    miniexam_slot_ids,
+    miniexam_word_ids,
+    participant_miniexam_query,
+    update_miniexam_responses,
+)
 from .forms import ParticipantForm, ParticipantLanguageForm, remove_empty_languages, group_languages
 import random
 from werkzeug.datastructures import ImmutableMultiDict
@@ -53,6 +73,31 @@ app.config["SERVER_NAME"] = os.environ["SERVER_NAME"]
 app.config["SECRET_KEY"] = os.environ["SECRET_KEY"]
 app.config["UPLOAD_DIR"] = os.environ["UPLOAD_DIR"]
 app.config["CONTACT_EMAIL"] = os.environ["CONTACT_EMAIL"]
+# Capped at selfassess.ingest.MAX_BATCH
+app.config["TRACK_BATCH_SIZE"] = int(os.environ.get("TRACK_BATCH_SIZE", 200))
+app.config["TRACK_BATCH_DELAY"] = float(os.environ.get("TRACK_BATCH_DELAY", 1.0))
+# /track pings are coalesced into activity intervals which end after this
+# many seconds without one or once they are this long (see selfassess.activity)
+app.config["ACTIVITY_GAP"] = float(os.environ.get("ACTIVITY_GAP", 60))
+app.config["ACTIVITY_MAX_LENGTH"] = float(os.environ.get("ACTIVITY_MAX_LENGTH", 900))
+# Also log every /track ping to the session log, for debugging
+app.config["TRACK_RAW_EVENTS"] = bool(int(os.environ.get("TRACK_RAW_EVENTS", 0)))
+app.config["PARTICIPANT_CACHE_SIZE"] = int(os.environ.get("PARTICIPANT_CACHE_SIZE", 1024))
+app.config["PARTICIPANT_CACHE_TTL"] = float(os.environ.get("PARTICIPANT_CACHE_TTL", 300))
+app.config["WORD_QUEUE_SIZE"] = int(os.environ.get("WORD_QUEUE_SIZE", 50))
+# Seconds between checks for changes to the word list
+app.config["WORD_LIST_CHECK_INTERVAL"] = float(os.environ.get("WORD_LIST_CHECK_INTERVAL", 5))
+# Default number of upcoming words sent to the client by /selfassess/batch
+app.config["SELFASSESS_BATCH_SIZE"] = int(os.environ.get("SELFASSESS_BATCH_SIZE", 20))
+# Ratings sent to /selfassess/batch timed more than this many seconds ahead of
+# the server's clock, or older than CLIENT_TIME_MAX_AGE seconds, are rejected
+app.config["CLIENT_TIME_TOLERANCE"] = float(os.environ.get("CLIENT_TIME_TOLERANCE", 60))
+app.config["CLIENT_TIME_MAX_AGE"] = float(os.environ.get("CLIENT_TIME_MAX_AGE", 7 * 24 * 60 * 60))
+# Seconds within which showing a word again updates its latest presentation
+# rather than adding another
+app.config["PRESENTATION_WINDOW"] = float(os.environ.get("PRESENTATION_WINDOW", PRESENTATION_WINDOW))
+# Bearer token needed to read /metrics, which is disabled when not set
+app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")
 
 
 if has_sentry:
@@ -62,45 +107,168 @@ if has_sentry:
 
 USER_SESSION_KEY = "user_id"
 current_user = LocalProxy(lambda: _get_user())
+# token -> participant id, shared between requests in this worker
+participant_ids = TTLCache(
+    maxsize=app.config["PARTICIPANT_CACHE_SIZE"],
+    ttl=app.config["PARTICIPANT_CACHE_TTL"],
+)
 
 
 def scopefunc():
     return id(_request_ctx_stack.top)
 
 
+async_session = get_async_session()
 dbsess = async_scoped_session(
-    get_async_session(),
+    async_session,
     scopefunc=scopefunc
 )
+writer = Writer(get_async_session(writer=True))
+event_queue = EventQueue(
+    writer,
+    max_batch=app.config["TRACK_BATCH_SIZE"],
+    max_delay=app.config["TRACK_BATCH_DELAY"],
+)
+activity = ActivityTracker(
+    writer,
+    gap=app.config["ACTIVITY_GAP"],
+    max_length=app.config["ACTIVITY_MAX_LENGTH"],
+)
+word_list = WordList(check_interval=app.config["WORD_LIST_CHECK_INTERVAL"])
+word_queue = WordQueue(
+    async_session,
+    word_list,
+    size=app.config["WORD_QUEUE_SIZE"],
+    low_water=app.config["WORD_QUEUE_SIZE"] // 5,
+)
+
+
+request_metrics = metrics.RequestMetrics()
+metrics.install_sql_timing()
+before_render_template.connect(metrics.template_started, app)
+template_rendered.connect(metrics.template_finished, app)
+
+
+@app.before_request
+async def start_request_metrics():
+    request_metrics.start_request()
+
+
+@app.after_request
+async def finish_request_metrics(response):
+    if request.url_rule is not None:
+        route = request.url_rule.rule
+    else:
+        route = "unmatched"
+    request_metrics.finish_request(
+        route, request.method, str(response.status_code)
+    )
+    return response
+
+
+@app.route("/metrics")
+async def metrics_endpoint():
+    token = app.config["METRICS_TOKEN"]
+    if not token:
+        abort(404)
+    if request.headers.get("Authorization") != f"Bearer {token}":
+        abort(401)
+    return QuartResponse(
+        request_metrics.render(),
+        mimetype="text/plain; version=0.0.4"
+    )
+
+
+@app.before_serving
+async def start_writer():
+    await writer.start()
+
+
+@app.before_serving
+async def load_word_list():
+    async with async_session() as session:
+        await word_list.get(session)
+
+
+@app.before_serving
+async def start_event_queue():
+    await event_queue.start()
+
+
+@app.before_serving
+async def start_activity_tracker():
+    await activity.start()
+
+
+@app.after_serving
+async def stop_event_queue():
+    await event_queue.stop()
+
+
+@app.after_serving
+async def stop_activity_tracker():
+    await activity.stop()
+
+
+@app.after_serving
+async def stop_word_queue():
+    await word_queue.close()
+
+
+@app.after_serving
+async def stop_writer():
+    await writer.stop()
+
+
+@app.after_serving
+async def close_db_connections():
+    # Pooled aiosqlite connections each have a thread which would otherwise
+    # keep the process alive
+    await async_session.kw["bind"].dispose()
+    await writer.session_factory.kw["bind"].dispose()
 
 
 def add_event(participant, event_type):
-    dbsess.add(SessionLogEntry(
+    event_queue.put(dict(
         participant_id=participant.id,
         type=event_type,
         timestamp=datetime.datetime.now(),
-        payload=json.dumps({
-            "remote_addr": request.remote_addr,
-            "user_agent": request.headers.get('User-Agent'),
-        })
+        remote_addr=request.remote_addr,
+        user_agent=request.headers.get('User-Agent'),
     ))
 
 
 async def participant_by_token(token):
+    participant_id = participant_ids.get(token)
+    if participant_id is not None:
+        # Primary key lookup, which is answered from the identity map if the
+        # participant has already been loaded during this request
+        res = await dbsess.get(Participant, participant_id)
+        if res is not None and res.token == token:
+            return res
+        participant_ids.invalidate(token)
     res = (await dbsess.execute(
-        select(Participant).
-        filter_by(token=token)
+        participant_for_token(token)
     )).scalars().first()
     if res is None:
         return None
+    participant_ids[token] = res.id
     return res
 
 
+def forget_user(participant):
+    participant_ids.invalidate(participant.token)
+    g.pop("user", None)
+
+
 async def _get_user():
+    if "user" in g:
+        return g.user
     session_id = session.get(USER_SESSION_KEY)
     if session_id is None:
         return None
-    return await participant_by_token(session_id)
+    g.user = await participant_by_token(session_id)
+    return g.user
 
 
 def user_required(func):
@@ -146,16 +314,8 @@ async def start(token):
     return redirect(request.args.get("next", url_for("overview", token=token)))
 
 
-_total_words = None
-
-
 async def get_total_words():
-    global _total_words
-    if _total_words is None:
-        _total_words = (await dbsess.execute(
-            select(func.count()).select_from(Word)
-        )).scalars().first()
-    return _total_words
+    return (await word_list.get(dbsess)).count
 
 
 @app.route("/")
@@ -236,6 +396,7 @@ async def terms():
             user = await current_user
             user.withdraw_date = datetime.datetime.now()
             await dbsess.commit()
+            forget_user(user)
             del session[USER_SESSION_KEY]
             return redirect(url_for("withdrawn"))
         elif all_checked:
@@ -255,6 +416,57 @@ async def terms():
         return await render_template("terms.html")
 
 
+def hash_static_files(static_folder):
+    """
+    A short hash of the contents of each static file. They are added to the
+    files' URLs so that browsers and the service worker only fetch them again
+    after they change.
+    """
+    hashes = {}
+    for filename in sorted(os.listdir(static_folder)):
+        with open(pjoin(static_folder, filename), "rb") as inf:
+            hashes[filename] = hashlib.sha256(inf.read()).hexdigest()[:12]
+    return hashes
+
+
+static_hashes = hash_static_files(app.static_folder)
+static_version = hashlib.sha256(
+    json.dumps(static_hashes, sort_keys=True).encode("utf-8")
+).hexdigest()[:12]
+# Cached by the service worker as soon as it is installed
+PRECACHE_STATIC = [
+    "htmx.js",
+    "selfassess.js",
+    "scale_explain.svg",
+    "icon192.png",
+    "icon512.png",
+]
+
+
+@app.template_global()
+def static_url(filename):
+    return url_for("static", filename=filename, v=static_hashes.get(filename))
+
+
+@app.route("/sw.js")
+async def service_worker():
+    # Served from the root rather than /static so it controls the whole site
+    resp = QuartResponse(
+        (await render_template(
+            "sw.js",
+            version=static_version,
+            precache=[static_url(filename) for filename in PRECACHE_STATIC],
+            static_prefix=app.static_url_path + "/",
+            batch_url=url_for("selfassess_batch"),
+        )),
+        mimetype="application/javascript"
+    )
+    # Browsers check for a new version on every navigation anyway, but make
+    # sure no cache in between serves an old one
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
 @app.route("/manifest.webmanifest")
 @user_required
 async def manifest():
@@ -360,27 +572,31 @@ async def ajax_redirect(url):
         return redirect(url)
 
 
-async def get_miniexam_questions(user):
-    grouped = {}
-    for response, in (await dbsess.execute(recent_responses_for_participant(user))):
-        grouped.setdefault(response.rating, []).append(response.slot.word_id)
+async def get_miniexam_questions(session, participant_id):
+    """
+    Pick MINIEXAM_QUESTIONS_PER_RATING words for each rating the participant
+    used, making up for any ratings with too few words from the others.
+    """
+    pool_sizes = (await session.execute(
+        miniexam_pool_sizes(participant_id)
+    )).all()
 
-    num_groups = len(grouped)
+    num_groups = len(pool_sizes)
     miniexam_questions = num_groups * MINIEXAM_QUESTIONS_PER_RATING
     word_ids = []
     grouped_sorted = sorted(
-        grouped.values(),
-        key=lambda response_slots: len(response_slots)
+        pool_sizes,
+        key=lambda rating_popsize: rating_popsize[1]
     )
-    for idx, response_slot in enumerate(grouped_sorted):
-        popsize = len(response_slot)
+    for idx, (rating, popsize) in enumerate(grouped_sorted):
         if popsize < MINIEXAM_QUESTIONS_PER_RATING:
-            word_ids.extend(response_slot)
-            miniexam_questions -= popsize
+            sampsize = popsize
         else:
             sampsize = miniexam_questions // (num_groups - idx)
-            word_ids.extend(random.sample(response_slot, sampsize))
-            miniexam_questions -= sampsize
+        word_ids.extend((await session.execute(
+            miniexam_pool_sample(participant_id, rating, sampsize)
+        )).scalars())
+        miniexam_questions -= sampsize
     random.shuffle(word_ids)
     return word_ids
 
@@ -388,31 +604,231 @@ async def get_miniexam_questions(user):
 MINIEXAM_QUESTIONS_PER_RATING = 20
 
 
-async def finalise_selfassess(user):
-    user.selfassess_finish_date = datetime.datetime.now()
-    for idx, word_id in enumerate((await get_miniexam_questions(user))):
-        dbsess.add(MiniexamSlot(
+async def update_participant(session, participant_id, values):
+    await session.execute(
+        update(Participant)
+        .where(Participant.id == participant_id)
+        .values(**values)
+    )
+
+
+class PositionChanged(Exception):
+    """
+    The participant's position moved on, e.g. in another tab, between a
+    request reading it and writing its changes.
+    """
+
+
+async def update_position(session, participant_id, expected, values):
+    """
+    Apply `values` to a participant only if their (next_response, undo) is
+    still `expected`, as a single conditional UPDATE. Of several requests
+    which read the same position, only the first to commit can move it on, so
+    the others raise PositionChanged and their transactions are rolled back.
+    """
+    next_response, undo = expected
+    result = await session.execute(
+        update(Participant)
+        .where(
+            (Participant.id == participant_id)
+            & (Participant.next_response == next_response)
+            & (Participant.undo == undo)
+        )
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        raise PositionChanged()
+
+
+def set_saved(participant, values):
+    """
+    Apply changes which the writer has committed to a participant loaded in
+    this request without marking them as changes to flush.
+    """
+    for key, value in values.items():
+        set_committed_value(participant, key, value)
+
+
+async def save_participant(participant, **values):
+    await writer.submit(update_participant, participant.id, values)
+    set_saved(participant, values)
+
+
+async def queued_slot_id(session, participant_id, response_order, queued_word):
+    """
+    Get the slot id of a queued word, creating the slot first if the
+    participant has a seeded word order and it does not exist yet.
+    """
+    if queued_word.slot_id is not None:
+        return queued_word.slot_id
+    return await ensure_slot(
+        session, participant_id, response_order, queued_word.word_id
+    )
+
+
+async def add_response(session, participant_id, response_slot_id, timestamp, rating):
+    """
+    Add a response and make it the latest one for its slot in the same
+    transaction.
+    """
+    response = Response(
+        response_slot_id=response_slot_id,
+        timestamp=timestamp,
+        rating=rating,
+    )
+    session.add(response)
+    latest = await session.get(LatestResponse, response_slot_id)
+    if latest is None:
+        session.add(LatestResponse(
+            response_slot_id=response_slot_id,
+            participant_id=participant_id,
+            response=response,
+            rating=rating,
+            sample_key=random.random(),
+        ))
+    else:
+        # Changing the rating after an undo keeps the sample key, which is
+        # independent of the rating, so the samples stay uniform
+        latest.response = response
+        latest.rating = rating
+
+
+async def write_miniexam_slots(session, participant_id, finish_date):
+    word_ids = await get_miniexam_questions(session, participant_id)
+    session.add_all([
+        MiniexamSlot(
             miniexam_order=idx,
-            participant=user,
+            participant_id=participant_id,
             word_id=word_id
-        ))
-    await dbsess.commit()
+        )
+        for idx, word_id in enumerate(word_ids)
+    ])
+    await update_participant(
+        session, participant_id, dict(selfassess_finish_date=finish_date)
+    )
+
+
+async def write_miniexam_responses(session, participant_id, rows, finish_date):
+    if rows:
+        await session.execute(insert(MiniexamResponse.__table__), rows)
+    await update_participant(
+        session, participant_id, dict(miniexam_finish_date=finish_date)
+    )
+
+
+async def finalise_selfassess(user):
+    finish_date = datetime.datetime.now()
+    await writer.submit(write_miniexam_slots, user.id, finish_date)
+    set_saved(user, dict(selfassess_finish_date=finish_date))
+
+
+async def write_selfassess_step(
+    session, participant_id, expected, changes, rating, presentation,
+    finish_date
+):
+    """
+    Write everything one /selfassess request changes in one transaction: the
+    changes to the participant such as their new position, the response to
+    the current word, the presentation of the next word and, after the last
+    word, the mini-exam. If `expected` is given, the participant is only
+    changed if their position is still the one it was checked against.
+    Returns the ids of the slots used by response order.
+    """
+    if expected is not None:
+        await update_position(session, participant_id, expected, changes)
+    elif changes:
+        await update_participant(session, participant_id, changes)
+    slot_ids = {}
+
+    async def slot_id_at(response_order, queued_word):
+        if response_order not in slot_ids:
+            slot_ids[response_order] = await queued_slot_id(
+                session, participant_id, response_order, queued_word
+            )
+        return slot_ids[response_order]
+
+    activity = Activity()
+    if rating is not None:
+        response_order, queued_word, timestamp, value = rating
+        slot_id = await slot_id_at(response_order, queued_word)
+        await add_response(session, participant_id, slot_id, timestamp, value)
+        activity.response(participant_id, timestamp)
+    if presentation is not None:
+        response_order, queued_word, timestamp = presentation
+        slot_id = await slot_id_at(response_order, queued_word)
+        await add_presentation(
+            session, slot_id, timestamp, app.config["PRESENTATION_WINDOW"]
+        )
+        activity.presentation(participant_id, timestamp)
+    await activity.write(session)
+    if finish_date is not None:
+        await write_miniexam_slots(session, participant_id, finish_date)
+    return slot_ids
+
+
+def remember_slot(user, response_order, queued_word, slot_id):
+    if queued_word.slot_id is None:
+        word_queue.remember_slot(user.id, response_order, slot_id)
+
+
+def word_idx(next_response, undo):
+    """
+    The response order of the word to show, which after an undo is the one
+    before next_response.
+    """
+    if undo:
+        return next_response - 1
+    else:
+        return next_response
+
+
+def current_word_idx(user):
+    return word_idx(user.next_response, user.undo)
+
+
+async def start_selfassess(user):
+    if user.selfassess_start_date is None:
+        await save_participant(
+            user, selfassess_start_date=datetime.datetime.now()
+        )
+
+
+async def flash_finished():
+    await flash(
+        "Self assessment finished. "
+        "Well done! Now proceed to the mini-exam."
+    )
+
+
+async def finish_selfassess(user):
+    if user.selfassess_finish_date is None:
+        await finalise_selfassess(user)
+    await flash_finished()
+
+
+async def flash_duplicate_response():
+    await flash(
+        "You already gave a response for that word. "
+        "The new response was discarded. "
+        "Please use only a single tab/window."
+    )
 
 
 @app.route("/selfassess", methods=['GET', 'POST'])
 @user_required
 async def selfassess():
     user = await current_user
-    if user.selfassess_start_date is None:
-        user.selfassess_start_date = datetime.datetime.now()
-        await dbsess.commit()
     total_words = await get_total_words()
-
-    def effective_cur_word_idx():
-        if user.undo:
-            return user.next_response - 1
-        else:
-            return user.next_response
+    now = datetime.datetime.now()
+    # Everything this request changes is written in one transaction once we
+    # know what to show next
+    changes = {}
+    if user.selfassess_start_date is None:
+        changes["selfassess_start_date"] = now
+    rating = None
+    # The position which a POST is checked against
+    expected = None
 
     if request.method == 'POST':
         form = await request.form
@@ -421,89 +837,294 @@ async def selfassess():
             batch_target = int(form["count"])
         else:
             batch_target = None
+        expected = (user.next_response, user.undo)
         if "undo" in form:
-            user.undo = True
-            await dbsess.commit()
+            changes["undo"] = True
         else:
-            rating = int(form["rating"])
             word_id = int(form["word_id"])
-            response_slot = (await dbsess.execute(
-                select(ResponseSlot)
-                .filter_by(
-                    word_id=word_id,
-                    participant_id=user.id,
-                )
-            )).scalars().first()
-            if response_slot.response_order != effective_cur_word_idx():
-                await flash(
-                    "You already gave a response for that word. "
-                    "The new response was discarded. "
-                    "Please use only a single tab/window."
-                )
+            # Each word appears once in a participant's order, so checking the
+            # word at the current position is the same as checking the slot
+            # of the posted word is at the current position
+            response_order = current_word_idx(user)
+            cur_word = await word_queue.get(dbsess, user, response_order)
+            if cur_word is None or cur_word.word_id != word_id:
+                await flash_duplicate_response()
                 return await ajax_redirect(url_for("overview"))
+            rating = (response_order, cur_word, now, int(form["rating"]))
             if user.undo:
-                user.undo = False
+                changes["undo"] = False
             else:
                 batch_complete += 1
-                user.next_response += 1
-            dbsess.add(
-                Response(
-                    response_slot_id=response_slot.id,
-                    timestamp=datetime.datetime.now(),
-                    rating=rating,
-                )
-            )
-            await dbsess.commit()
+                changes["next_response"] = user.next_response + 1
     else:
         batch_complete = 0
         if "count" in request.args:
             batch_target = int(request.args["count"])
         else:
             batch_target = None
-    if batch_target is not None and batch_complete >= batch_target:
+    batch_finished = batch_target is not None and batch_complete >= batch_target
+    response_order = word_idx(
+        changes.get("next_response", user.next_response),
+        changes.get("undo", user.undo)
+    )
+    next_word = None
+    if not batch_finished:
+        next_word = await word_queue.get(dbsess, user, response_order)
+    presentation = None
+    finish_date = None
+    if next_word is not None:
+        presentation = (response_order, next_word, now)
+    elif not batch_finished and user.selfassess_finish_date is None:
+        finish_date = now
+    if changes or rating or presentation or finish_date:
+        try:
+            slot_ids = await writer.submit(
+                write_selfassess_step, user.id, expected, changes, rating,
+                presentation, finish_date
+            )
+        except PositionChanged:
+            await flash_duplicate_response()
+            return await ajax_redirect(url_for("overview"))
+        for step in (rating, presentation):
+            if step is not None:
+                remember_slot(user, step[0], step[1], slot_ids[step[0]])
+        if finish_date is not None:
+            changes["selfassess_finish_date"] = finish_date
+        set_saved(user, changes)
+
+    if batch_finished:
         await flash(
             f"Batch of {batch_target} finished."
         )
         return await ajax_redirect(url_for("overview"))
-    next_response_slot = (await dbsess.execute(
-        select(ResponseSlot).where(
-            (ResponseSlot.response_order == effective_cur_word_idx())
-            & (ResponseSlot.participant_id == user.id)
-        ).options(joinedload(ResponseSlot.word))
-    )).scalars().first()
-    if next_response_slot is None:
+    if next_word is None:
         # Done
-        if user.selfassess_finish_date is None:
-            await finalise_selfassess(user)
-        await flash(
-            "Self assessment finished. "
-            "Well done! Now proceed to the mini-exam."
-        )
+        await flash_finished()
         return await ajax_redirect(url_for("overview"))
     if request.headers.get("HX-Request"):
         template = "selfassess_ajax.html"
     else:
         template = "selfassess.html"
-    dbsess.add(
-        Presentation(
-            response_slot_id=next_response_slot.id,
-            timestamp=datetime.datetime.now()
-        )
-    )
-    await dbsess.commit()
     return await render_template(
         template,
-        word=next_response_slot.word.word,
-        word_id=next_response_slot.word.id,
-        cur_word_idx=effective_cur_word_idx() + 1,
+        word=next_word.word,
+        word_id=next_word.word_id,
+        cur_word_idx=current_word_idx(user) + 1,
         total_words=total_words,
         batch_complete=batch_complete,
         batch_target=batch_target,
         undo=user.undo,
-        show_undo_button=not user.undo and effective_cur_word_idx() > 0,
+        show_undo_button=not user.undo and current_word_idx(user) > 0,
     )
 
 
+BatchRating = namedtuple(
+    "BatchRating",
+    ["word_id", "rating", "presented_at", "answered_at", "undo"]
+)
+
+
+def to_client_time(timestamp):
+    return int(timestamp.timestamp() * 1000)
+
+
+def from_client_time(millis, now):
+    """
+    Convert a time sent by the client, which keeps it in step with the
+    server's clock, raising ValueError if it is in the future or implausibly
+    old.
+    """
+    if millis is None:
+        return None
+    timestamp = datetime.datetime.fromtimestamp(millis / 1000)
+    if not (
+        now - datetime.timedelta(seconds=app.config["CLIENT_TIME_MAX_AGE"])
+        <= timestamp
+        <= now + datetime.timedelta(seconds=app.config["CLIENT_TIME_TOLERANCE"])
+    ):
+        raise ValueError(f"Client time {timestamp} is too far from {now}")
+    return timestamp
+
+
+def parse_batch_ratings(records):
+    if not isinstance(records, list):
+        abort(400)
+    now = datetime.datetime.now()
+    ratings = []
+    for record in records:
+        try:
+            rating = BatchRating(
+                word_id=int(record["word_id"]),
+                rating=int(record["rating"]),
+                presented_at=from_client_time(record.get("presented_at"), now),
+                answered_at=from_client_time(record["answered_at"], now),
+                undo=bool(record.get("undo", False)),
+            )
+        except (KeyError, TypeError, ValueError, OverflowError, OSError):
+            abort(400)
+        if not 1 <= rating.rating <= 5:
+            abort(400)
+        if (
+            rating.presented_at is not None
+            and rating.presented_at > rating.answered_at
+        ):
+            abort(400)
+        ratings.append(rating)
+    return ratings
+
+
+async def write_ratings(session, participant_id, expected, rows, position):
+    await update_position(session, participant_id, expected, position)
+    slot_ids = {}
+    activity = Activity()
+    for response_order, queued_word, rating in rows:
+        slot_id = slot_ids.get(response_order)
+        if slot_id is None:
+            slot_id = slot_ids[response_order] = await queued_slot_id(
+                session, participant_id, response_order, queued_word
+            )
+        if rating.presented_at is not None:
+            await add_presentation(
+                session,
+                slot_id,
+                rating.presented_at,
+                app.config["PRESENTATION_WINDOW"]
+            )
+            activity.presentation(participant_id, rating.presented_at)
+        await add_response(
+            session, participant_id, slot_id, rating.answered_at, rating.rating
+        )
+        activity.response(participant_id, rating.answered_at)
+    await activity.write(session)
+    return slot_ids
+
+
+async def apply_batch(user, ratings):
+    """
+    Check that a batch of ratings follows on from the participant's position
+    with the same rules as selfassess() and write them all in one
+    transaction. Returns False, writing nothing, if they do not. A batch which
+    has already been written, e.g. because the client retried after losing
+    the response, is recognised by its first answer time and ignored.
+    """
+    first = ratings[0]
+
+    async def already_written(session):
+        return (await session.execute(
+            response_at(user.id, first.word_id, first.answered_at)
+        )).first() is not None
+
+    if await already_written(dbsess):
+        return True
+    next_response = user.next_response
+    undo = user.undo
+    rows = []
+    for rating in ratings:
+        if rating.undo:
+            if undo or next_response == 0:
+                return False
+            undo = True
+        response_order = next_response - 1 if undo else next_response
+        queued_word = await word_queue.get(dbsess, user, response_order)
+        if queued_word is None or queued_word.word_id != rating.word_id:
+            return False
+        rows.append((response_order, queued_word, rating))
+        if undo:
+            undo = False
+        else:
+            next_response += 1
+    position = dict(next_response=next_response, undo=undo)
+    try:
+        slot_ids = await writer.submit(
+            write_ratings, user.id, (user.next_response, user.undo), rows,
+            position
+        )
+    except PositionChanged:
+        # Possibly by the same batch sent twice at once. This request's
+        # session could still be reading from before that was committed, so
+        # take the position the batch left the participant at from a new one.
+        async with async_session() as session:
+            if not await already_written(session):
+                return False
+            position = (await session.execute(
+                participant_position(user.id)
+            )).one()._asdict()
+        set_saved(user, position)
+        return True
+    for response_order, queued_word, _ in rows:
+        remember_slot(user, response_order, queued_word, slot_ids[response_order])
+    set_saved(user, position)
+    return True
+
+
+async def batch_state(user, size):
+    position = current_word_idx(user)
+    # Include the previous word so the client can undo straight away
+    start = max(position - 1, 0)
+    words = []
+    for response_order in range(start, position + size):
+        queued_word = await word_queue.get(dbsess, user, response_order)
+        if queued_word is None:
+            break
+        words.append(dict(word_id=queued_word.word_id, word=queued_word.word))
+    if start + len(words) <= position:
+        return None
+    return dict(
+        start=start,
+        position=position,
+        undo=user.undo,
+        total_words=await get_total_words(),
+        words=words,
+        now=to_client_time(datetime.datetime.now()),
+    )
+
+
+@app.route("/selfassess/batch", methods=['GET', 'POST'])
+@user_required
+async def selfassess_batch():
+    """
+    JSON API behind static/selfassess.js, which shows words from a local
+    buffer and sends the ratings in the background.
+
+    GET returns the participant's position, the words from the one before it
+    to `k` words after it and the server's time. POST takes an array of
+    records
+
+        {word_id, rating, presented_at, answered_at, undo}
+
+    with the times in milliseconds since the epoch by the server's clock,
+    which the client estimates from the time sent with each state. This way a
+    batch which is sent again keeps the same times. presented_at is null for
+    a word whose presentation was already recorded by selfassess(), and undo
+    is true to take back the previous rating first. They are checked and
+    written in order, in one transaction, and the response is the same as for
+    GET. A batch with times in the future or more than CLIENT_TIME_MAX_AGE
+    seconds ago is rejected with status 400. Either way, the response is
+    instead {redirect} if the participant should be sent elsewhere, with
+    status 409 if the ratings were discarded.
+    """
+    user = await current_user
+    await start_selfassess(user)
+    size = max(min(
+        request.args.get("k", app.config["SELFASSESS_BATCH_SIZE"], type=int),
+        app.config["WORD_QUEUE_SIZE"]
+    ), 1)
+    if request.method == 'POST':
+        ratings = parse_batch_ratings(await request.get_json(force=True))
+        if ratings and not await apply_batch(user, ratings):
+            await flash_duplicate_response()
+            return dict(redirect=url_for("overview")), 409
+        batch_target = request.args.get("done_batch", type=int)
+        if batch_target is not None:
+            await flash(f"Batch of {batch_target} finished.")
+            return dict(redirect=url_for("overview"))
+    state = await batch_state(user, size)
+    if state is None:
+        await finish_selfassess(user)
+        return dict(redirect=url_for("overview"))
+    return state
+
+
 @app.route("/echobody", methods=['POST'])
 async def echo_body():
     data = await request.data
@@ -588,27 +1209,28 @@ async def user_languages(dbsess, user):
 async def miniexam():
     user = await current_user
     if user.miniexam_start_date is None:
-        user.miniexam_start_date = datetime.datetime.now()
-        await dbsess.commit()
+        await save_participant(
+            user, miniexam_start_date=datetime.datetime.now()
+        )
     if request.method == 'POST':
-        data = await request.data
         form = await request.form
         zipped = zip(
             form.getlist("word_id", type=int),
             form.getlist("defn_type"),
             form.getlist("response"),
         )
+        slot_ids = {}
+        for word_id, slot_id in await dbsess.execute(miniexam_slot_ids(user)):
+            slot_ids.setdefault(word_id, slot_id)
+        timestamp = datetime.datetime.now()
+        rows = []
         for word_id, defn_type, response in zipped:
-            miniexam_slot = (await dbsess.execute(
-                select(MiniexamSlot).where(
-                    MiniexamSlot.participant_id == user.id,
-                    MiniexamSlot.word_id == word_id,
-                )
-            )).scalars().first()
+            if word_id not in slot_ids:
+                abort(400)
             response_type, response_lang = decode_defn_type(defn_type)
-            dbsess.add(MiniexamResponse(
-                miniexam_slot_id=miniexam_slot.id,
-                timestamp=datetime.datetime.now(),
+            rows.append(dict(
+                miniexam_slot_id=slot_ids[word_id],
+                timestamp=timestamp,
                 response_lang=response_lang,
                 response_type=response_type,
                 response=(
@@ -617,8 +1239,11 @@ async def miniexam():
                     else ""
                 ),
             ))
-        user.miniexam_finish_date = datetime.datetime.now()
-        await dbsess.commit()
+        finish_date = datetime.datetime.now()
+        await writer.submit(
+            write_miniexam_responses, user.id, rows, finish_date
+        )
+        set_saved(user, dict(miniexam_finish_date=finish_date))
         await flash(
             "Thanks for completing the mini-exam. "
             "You're all done. "
@@ -626,13 +1251,10 @@ async def miniexam():
         )
         return redirect(url_for("overview"))
     else:
-        words = (await dbsess.execute(
-            select(Word).join(MiniexamSlot).where(
-                MiniexamSlot.participant_id == user.id
-            ).order_by(
-                MiniexamSlot.miniexam_order
-            )
-        )).scalars()
+        word_ids = (await dbsess.execute(
+            miniexam_word_ids(user)
+        )).scalars().all()
+        words = await word_list.entries(dbsess, word_ids)
         languages = await user_languages(dbsess, user)
         return await render_template(
             "miniexam.html",
@@ -649,36 +1271,40 @@ async def fixup_miniexam():
             return redirect(url_for("start", token=request.args["token"], next=request.path))
         else:
             abort(401)
-    user = (await dbsess.execute(select(Participant).filter_by(id=user.id).options(
-        joinedload(Participant.miniexam_slots).options(
-            joinedload(MiniexamSlot.word),
-            joinedload(MiniexamSlot.responses)
-        ),
-    ))).scalars().first()
+    user = (await dbsess.execute(
+        participant_miniexam_query(user)
+    )).scalars().first()
     if user.miniexam_fixup_date is None:
         user.miniexam_fixup_date = datetime.datetime.now()
         await dbsess.commit()
     if request.method == 'POST':
         form = await request.form
-        resp_info = {
-            k: (t, r)
-            for k, t, r in zip(
-                form.getlist("resp_id", type=int),
-                form.getlist("defn_type"),
-                form.getlist("response"),
-            )
+        # Only allow updating this participant's own responses, which are
+        # already loaded
+        own_resp_ids = {
+            resp.id
+            for slot in user.miniexam_slots
+            for resp in slot.responses
         }
-        resps = (await dbsess.execute(
-            select(MiniexamResponse).
-            filter(MiniexamResponse.id.in_(resp_info.keys()))
-        )).scalars()
-        for resp in resps:
-            defn_type, resp_text = resp_info[resp.id]
+        timestamp = datetime.datetime.now()
+        rows = []
+        for resp_id, defn_type, resp_text in zip(
+            form.getlist("resp_id", type=int),
+            form.getlist("defn_type"),
+            form.getlist("response"),
+        ):
+            if resp_id not in own_resp_ids:
+                continue
             response_type, response_lang = decode_defn_type(defn_type)
-            resp.timestamp = datetime.datetime.now()
-            resp.response_lang = response_lang
-            resp.response_type = response_type
-            resp.response = resp_text
+            rows.append(dict(
+                resp_id=resp_id,
+                timestamp=timestamp,
+                response_lang=response_lang,
+                response_type=response_type,
+                response=resp_text,
+            ))
+        if rows:
+            await dbsess.execute(update_miniexam_responses(), rows)
         await dbsess.commit()
         await flash(
             "Thank you very much for providing the missing data."
@@ -722,8 +1348,14 @@ async def track():
         event_type = SessionEvent.miniexam_input
     else:
         abort(404)
-    add_event(user, event_type)
-    await dbsess.commit()
+    activity.ping(
+        user.id,
+        event_type,
+        request.remote_addr,
+        request.headers.get('User-Agent'),
+    )
+    if app.config["TRACK_RAW_EVENTS"]:
+        add_event(user, event_type)
     return "yep"
 
 
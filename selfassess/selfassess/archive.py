@@ -0,0 +1,323 @@
+"""
+Cold storage for the session log and presentations.
+
+session_log_entry and presentation only ever grow and only the exports read
+them, so old rows can be moved out of the live database into Parquet files:
+
+    ARCHIVE_DIR/<table>/participant_id=<id>/month=<YYYY-MM>/<run>.parquet
+
+Every run writes new files rather than changing existing ones. Rows are only
+deleted from the database once their file is in place, so if a run is
+interrupted between the two the next one writes the same rows again, and
+until the rows are deleted they are in both places. Rows keep their ids, and
+readers drop the duplicates of an archived row, both in other files and
+still in the database, by its id together with its timestamp. The id alone
+is not enough since SQLite hands the id of a deleted newest row out again.
+
+The exports read the archive in ARCHIVE_DIR, if set, along with the database
+(see selfassess.export.utils).
+
+    $ python -m selfassess.archive --before 2022-01-01
+    $ python -m selfassess.archive --completed
+"""
+import datetime
+import functools
+import glob
+import os
+from itertools import groupby
+
+import click
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import delete, select, true
+
+from .database import (
+    Client, Participant, Presentation, ResponseSlot, SessionEvent,
+    SessionLogEntry
+)
+from .utils import get_session
+
+
+# Rows deleted per transaction so that the website is never kept waiting
+# for the write lock for long
+DELETE_CHUNK = 500
+# Pages freed per incremental vacuum step
+VACUUM_PAGES = 1000
+
+SESSION_LOG_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("participant_id", pa.int64()),
+    ("timestamp", pa.timestamp("us")),
+    ("type", pa.string()),
+    ("client_id", pa.int64()),
+    ("device", pa.string()),
+])
+PRESENTATION_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("participant_id", pa.int64()),
+    ("response_slot_id", pa.int64()),
+    ("timestamp", pa.timestamp("us")),
+    ("count", pa.int64()),
+    ("first_timestamp", pa.timestamp("us")),
+])
+
+
+def session_log_query(participant_id, condition):
+    return select(
+        SessionLogEntry.id,
+        SessionLogEntry.participant_id,
+        SessionLogEntry.timestamp,
+        SessionLogEntry.type,
+        SessionLogEntry.client_id,
+        Client.device,
+    ).outerjoin(Client, SessionLogEntry.client_id == Client.id).where(
+        (SessionLogEntry.participant_id == participant_id) & condition
+    ).order_by(SessionLogEntry.timestamp)
+
+
+def presentation_query(participant_id, condition):
+    return select(
+        Presentation.id,
+        ResponseSlot.participant_id,
+        Presentation.response_slot_id,
+        Presentation.timestamp,
+        Presentation.count,
+        Presentation.first_timestamp,
+    ).join(ResponseSlot).where(
+        (ResponseSlot.participant_id == participant_id) & condition
+    ).order_by(Presentation.timestamp)
+
+
+def session_log_row(row):
+    row = row._asdict()
+    row["type"] = row["type"].name
+    return row
+
+
+def presentation_row(row):
+    return row._asdict()
+
+
+# name -> (model, query, row conversion, schema)
+TABLES = {
+    "session_log_entry": (
+        SessionLogEntry, session_log_query, session_log_row, SESSION_LOG_SCHEMA
+    ),
+    "presentation": (
+        Presentation, presentation_query, presentation_row, PRESENTATION_SCHEMA
+    ),
+}
+
+
+def partition_dir(archive_dir, table, participant_id, month):
+    return os.path.join(
+        archive_dir,
+        table,
+        f"participant_id={participant_id}",
+        f"month={month}",
+    )
+
+
+def write_partition(archive_dir, table, schema, run, participant_id, month, rows):
+    path = partition_dir(archive_dir, table, participant_id, month)
+    os.makedirs(path, exist_ok=True)
+    dest = os.path.join(path, f"{run}.parquet")
+    tmp = dest + ".tmp"
+    columns = {name: [row[name] for row in rows] for name in schema.names}
+    pq.write_table(
+        pa.Table.from_pydict(columns, schema=schema),
+        tmp,
+        compression="zstd",
+    )
+    os.replace(tmp, dest)
+
+
+def delete_rows(session, model, ids):
+    for start in range(0, len(ids), DELETE_CHUNK):
+        session.execute(
+            delete(model).where(model.id.in_(ids[start:start + DELETE_CHUNK]))
+        )
+        session.commit()
+
+
+def archive_participant(session, archive_dir, run, participant_id, condition):
+    """
+    Archive a participant's rows matching `condition`, which takes the
+    timestamp column. Returns {table: rows archived}.
+    """
+    counts = {}
+    for table, (model, query, to_row, schema) in TABLES.items():
+        rows = [
+            to_row(row)
+            for row in session.execute(
+                query(participant_id, condition(model.timestamp))
+            )
+        ]
+        for month, month_rows in groupby(
+            rows, lambda row: row["timestamp"].strftime("%Y-%m")
+        ):
+            month_rows = list(month_rows)
+            write_partition(
+                archive_dir, table, schema, run, participant_id, month,
+                month_rows
+            )
+            delete_rows(session, model, [row["id"] for row in month_rows])
+        counts[table] = len(rows)
+    return counts
+
+
+def incremental_vacuum(session, enable=False):
+    """
+    Give the space freed by archiving back to the filesystem a step at a time
+    so the website is never locked out for long. SQLite databases need
+    auto_vacuum=INCREMENTAL for this, which `enable` sets up with a one-off
+    full VACUUM.
+    """
+    engine = session.get_bind()
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.connect().execution_options(
+        isolation_level="AUTOCOMMIT"
+    ) as conn:
+        mode = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+        if mode != 2:
+            if not enable:
+                print(
+                    "Not vacuuming: run once with --enable-incremental-vacuum "
+                    "to give the freed space back"
+                )
+                return
+            conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.exec_driver_sql("VACUUM")
+            return
+        while conn.exec_driver_sql("PRAGMA freelist_count").scalar():
+            # The sqlite3 module only steps the pragma once, which frees a
+            # single page, so run it once per page
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            for _ in range(VACUUM_PAGES):
+                conn.exec_driver_sql("PRAGMA incremental_vacuum(1)")
+            conn.exec_driver_sql("COMMIT")
+
+
+class Archive:
+    """
+    Reads a participant's archived rows back as (transient, never added to a
+    session) model objects for the exports.
+    """
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+
+    def _read(self, table, participant_id):
+        if self.archive_dir is None:
+            return []
+        paths = sorted(glob.glob(os.path.join(
+            partition_dir(self.archive_dir, table, participant_id, "*"),
+            "*.parquet",
+        )))
+        rows = {}
+        for path in paths:
+            columns = pq.read_table(path).to_pydict()
+            for values in zip(*columns.values()):
+                row = dict(zip(columns, values))
+                rows[row["id"], row["timestamp"]] = row
+        return sorted(rows.values(), key=lambda row: row["timestamp"])
+
+    @functools.lru_cache(maxsize=64)
+    def session_log_entries(self, participant_id):
+        return [
+            SessionLogEntry(
+                id=row["id"],
+                participant_id=row["participant_id"],
+                timestamp=row["timestamp"],
+                type=SessionEvent[row["type"]],
+                client_id=row["client_id"],
+                client=(
+                    Client(id=row["client_id"], device=row["device"])
+                    if row["client_id"] is not None
+                    else None
+                ),
+            )
+            for row in self._read("session_log_entry", participant_id)
+        ]
+
+    @functools.lru_cache(maxsize=64)
+    def presentations(self, participant_id):
+        """
+        {response slot id: [Presentation]}
+        """
+        result = {}
+        for row in self._read("presentation", participant_id):
+            result.setdefault(row["response_slot_id"], []).append(Presentation(
+                id=row["id"],
+                response_slot_id=row["response_slot_id"],
+                timestamp=row["timestamp"],
+                # Archived before presentations were coalesced
+                count=row.get("count", 1),
+                first_timestamp=row.get("first_timestamp", row["timestamp"]),
+            ))
+        return result
+
+
+def get_archive():
+    return Archive(os.environ.get("ARCHIVE_DIR"))
+
+
+@click.command()
+@click.option("--archive-dir", envvar="ARCHIVE_DIR", required=True)
+@click.option(
+    "--before",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    help="Archive rows from before this date",
+)
+@click.option(
+    "--completed",
+    is_flag=True,
+    help="Archive all rows of participants who have finished the mini-exam",
+)
+@click.option("--enable-incremental-vacuum", is_flag=True)
+def main(archive_dir, before, completed, enable_incremental_vacuum):
+    """
+    Move old session log entries and presentations into Parquet files in
+    ARCHIVE_DIR.
+    """
+    if before is None and not completed:
+        raise click.UsageError("Give --before and/or --completed")
+    session = get_session()
+    run = datetime.datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    completed_ids = set()
+    if completed:
+        completed_ids = {
+            participant_id for participant_id, in session.execute(
+                select(Participant.id).where(
+                    Participant.miniexam_finish_date.isnot(None)
+                )
+            )
+        }
+    participant_ids = [
+        participant_id for participant_id,
+        in session.execute(select(Participant.id).order_by(Participant.id))
+    ]
+    session.commit()
+    totals = dict.fromkeys(TABLES, 0)
+    for participant_id in participant_ids:
+        if participant_id in completed_ids:
+            def condition(timestamp):
+                return true()
+        elif before is not None:
+            def condition(timestamp):
+                return timestamp < before
+        else:
+            continue
+        counts = archive_participant(
+            session, archive_dir, run, participant_id, condition
+        )
+        for table, count in counts.items():
+            totals[table] += count
+    for table, count in totals.items():
+        print(f"{table}: archived {count} rows")
+    incremental_vacuum(session, enable_incremental_vacuum)
+
+
+if __name__ == "__main__":
+    main()
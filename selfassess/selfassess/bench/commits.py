@@ -0,0 +1,137 @@
+"""
+Count the database commits made by each kind of /selfassess request and time
+them.
+
+Participants rate all their words one after the other, sometimes undoing, so
+every commit made while a request is being handled belongs to it. With SQLite
+in WAL mode and synchronous=NORMAL (the default, see selfassess.utils) a
+commit writes to the WAL without an fsync. Run with SQLITE_SYNCHRONOUS=FULL to
+see the cost when every commit is an fsync.
+"""
+import asyncio
+import random
+import time
+
+import click
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .load import WORD_ID_RE
+from .utils import (
+    add_bench_participant,
+    bench_env,
+    create_bench_db,
+    percentile,
+    scratch_db_path,
+    urlencoded,
+)
+
+
+class CommitCounter:
+    def __init__(self):
+        self.commits = 0
+
+    def __call__(self, conn):
+        self.commits += 1
+
+
+class RequestStats:
+    def __init__(self):
+        self.timings = {}
+        self.commits = {}
+
+    def record(self, kind, elapsed, commits):
+        self.timings.setdefault(kind, []).append(elapsed)
+        self.commits[kind] = self.commits.get(kind, 0) + commits
+
+    def print(self):
+        print("{:<18} {:>8} {:>15} {:>9} {:>9}".format(
+            "request", "count", "commits/request", "p50 ms", "p95 ms"
+        ))
+        for kind, timings in self.timings.items():
+            print("{:<18} {:>8} {:>15.2f} {:>9.1f} {:>9.1f}".format(
+                kind,
+                len(timings),
+                self.commits[kind] / len(timings),
+                percentile(timings, 50) * 1000,
+                percentile(timings, 95) * 1000,
+            ))
+
+
+async def timed(stats, counter, client, kind, method, path, pairs=None):
+    headers = {"HX-Request": "true"}
+    data = None
+    if pairs is not None:
+        data, form_headers = urlencoded(pairs)
+        headers.update(form_headers)
+    before = counter.commits
+    start = time.perf_counter()
+    resp = await client.open(path, method=method, data=data, headers=headers)
+    body = await resp.get_data(as_text=True)
+    stats.record(kind, time.perf_counter() - start, counter.commits - before)
+    return body
+
+
+async def rate_all(app, stats, counter, token, rng, undo_rate):
+    client = app.test_client()
+    await client.get(f"/start/{token}")
+    body = await timed(
+        stats, counter, client, "first GET", "GET", "/selfassess"
+    )
+    while True:
+        match = WORD_ID_RE.search(body)
+        if match is None:
+            break
+        if rng.random() < undo_rate and 'name="undo"' in body:
+            body = await timed(
+                stats, counter, client, "undo POST", "POST", "/selfassess",
+                [("complete", 0), ("undo", "true")]
+            )
+            match = WORD_ID_RE.search(body)
+        body = await timed(
+            stats, counter, client, "rating POST", "POST", "/selfassess",
+            [
+                ("complete", 0),
+                ("rating", rng.randint(1, 5)),
+                ("word_id", match.group(1)),
+            ]
+        )
+
+
+async def run(app, tokens, seed, undo_rate):
+    stats = RequestStats()
+    counter = CommitCounter()
+    event.listen(Engine, "commit", counter)
+    try:
+        async with app.test_app():
+            for idx, token in enumerate(tokens):
+                await rate_all(
+                    app, stats, counter, token,
+                    random.Random(f"{seed}-{idx}"), undo_rate
+                )
+    finally:
+        event.remove(Engine, "commit", counter)
+    return stats
+
+
+@click.command()
+@click.option("--participants", type=int, default=5)
+@click.option("--words", type=int, default=100)
+@click.option("--undo-rate", type=float, default=0.1)
+@click.option("--seed", default="0")
+@click.option("--db", help="Scratch database path or URL to create")
+def main(participants, words, undo_rate, seed, db):
+    bench_env(db or scratch_db_path())
+    session = create_bench_db(words)
+    tokens = [
+        add_bench_participant(session, words).token
+        for _ in range(participants)
+    ]
+    session.commit()
+    from ..app import app
+    stats = asyncio.run(run(app, tokens, seed, undo_rate))
+    stats.print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,446 @@
+"""
+Load test the web app with many simulated participants at once.
+
+Each participant logs in with /start/<token>, rates every word with
+/selfassess in bursts, sometimes undoing a rating, sends /track pings while
+doing so and finally submits the mini-exam. With --batch K they instead rate
+through /selfassess/batch like static/selfassess.js, fetching K words ahead
+and sending each burst of ratings in one request.
+
+By default the participants run in-process against app.test_client() on a
+scratch database. To load test a real deployment, start it against the
+database given with --db, e.g.
+
+    SERVER_NAME=localhost:8000 \\
+    ASYNC_DATABASE_URL=sqlite+aiosqlite:////tmp/load.db \\
+        hypercorn --workers 2 -b localhost:8000 selfassess.app:app
+
+and pass --url http://localhost:8000 --db /tmp/load.db. The database is
+created if it does not exist and new participants are added to it on every
+run.
+
+The results can be saved with --json and compared against an earlier run with
+--baseline, which fails if the p95 latency of any route got worse by more than
+--tolerance.
+"""
+import asyncio
+import json
+import logging
+import random
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.error import HTTPError
+from urllib.request import build_opener, HTTPRedirectHandler, Request
+
+import click
+from sqlalchemy import select, func
+
+from .utils import (
+    add_bench_participant,
+    bench_env,
+    create_bench_db,
+    percentile,
+    scratch_db_path,
+    urlencoded,
+)
+
+
+WORD_ID_RE = re.compile(r'name="word_id" value="(\d+)"')
+TRACK_EVENTS = ["selfassessinput", "selfassesswindowfocus", "selfassesswindowblur"]
+
+
+class Stats:
+    def __init__(self):
+        self.timings = {}
+        self.errors = {}
+        self.lock_errors = 0
+
+    def record(self, route, elapsed, ok):
+        self.timings.setdefault(route, []).append(elapsed)
+        if not ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    def summary(self, wall_time):
+        routes = {}
+        for route, timings in sorted(self.timings.items()):
+            routes[route] = {
+                "count": len(timings),
+                "errors": self.errors.get(route, 0),
+                "p50_ms": percentile(timings, 50) * 1000,
+                "p95_ms": percentile(timings, 95) * 1000,
+                "p99_ms": percentile(timings, 99) * 1000,
+            }
+        num_requests = sum(len(timings) for timings in self.timings.values())
+        return {
+            "routes": routes,
+            "requests": num_requests,
+            "wall_time_s": wall_time,
+            "throughput_rps": num_requests / wall_time if wall_time else 0,
+            "lock_errors": self.lock_errors,
+        }
+
+
+class LockErrorCounter(logging.Handler):
+    """
+    Counts "database is locked" errors logged by the in-process app.
+    """
+    def __init__(self, stats):
+        super().__init__(logging.ERROR)
+        self.stats = stats
+
+    def emit(self, record):
+        if record.exc_info and "database is locked" in str(record.exc_info[1]):
+            self.stats.lock_errors += 1
+
+
+class TestClientDriver:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    async def request(self, method, path, pairs=None, headers=None, json_body=None):
+        headers = dict(headers or {})
+        data = None
+        if pairs is not None:
+            data, form_headers = urlencoded(pairs)
+            headers.update(form_headers)
+        elif json_body is not None:
+            data = json.dumps(json_body)
+            headers["Content-Type"] = "application/json"
+        resp = await self.client.open(
+            path, method=method, data=data, headers=headers
+        )
+        return resp.status_code, await resp.get_data(as_text=True)
+
+
+class _NoRedirect(HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpDriver:
+    """
+    Drives a running server with urllib in a thread pool so no extra
+    dependencies are needed. Cookies are handled here rather than with
+    http.cookiejar, which rejects the Domain=localhost cookies a local server
+    sends.
+    """
+    def __init__(self, base_url, executor):
+        self.base_url = base_url.rstrip("/")
+        self.executor = executor
+        self.opener = build_opener(_NoRedirect())
+        self.cookies = SimpleCookie()
+
+    def _save_cookies(self, headers):
+        for header in headers.get_all("Set-Cookie") or []:
+            self.cookies.load(header)
+
+    def _request(self, method, path, pairs, headers, json_body):
+        data = None
+        headers = dict(headers or {})
+        if pairs is not None:
+            data, form_headers = urlencoded(pairs)
+            data = data.encode("utf-8")
+            headers.update(form_headers)
+        elif json_body is not None:
+            data = json.dumps(json_body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        if self.cookies:
+            headers["Cookie"] = "; ".join(
+                f"{name}={morsel.value}"
+                for name, morsel in self.cookies.items()
+            )
+        req = Request(
+            self.base_url + path, data=data, headers=headers, method=method
+        )
+        try:
+            with self.opener.open(req) as resp:
+                self._save_cookies(resp.headers)
+                return resp.status, resp.read().decode("utf-8")
+        except HTTPError as exc:
+            self._save_cookies(exc.headers)
+            return exc.code, exc.read().decode("utf-8", "replace")
+
+    async def request(self, method, path, pairs=None, headers=None, json_body=None):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor, self._request, method, path, pairs, headers,
+            json_body
+        )
+
+
+async def timed(
+    stats, driver, route, method, path, pairs=None, headers=None,
+    json_body=None
+):
+    start = time.perf_counter()
+    try:
+        status, body = await driver.request(
+            method, path, pairs, headers, json_body
+        )
+    except Exception:
+        logging.exception("Request to %s failed", path)
+        stats.record(route, time.perf_counter() - start, False)
+        return None, ""
+    stats.record(route, time.perf_counter() - start, status < 400)
+    return status, body
+
+
+async def think(rng, mean):
+    if mean > 0:
+        await asyncio.sleep(rng.expovariate(1 / mean))
+
+
+async def track(stats, driver, rng, opts):
+    if rng.random() < opts["track_rate"]:
+        await timed(
+            stats, driver, "/track", "POST", "/track",
+            [("event", rng.choice(TRACK_EVENTS))]
+        )
+
+
+async def rate_words(stats, driver, body, rng, opts):
+    htmx = {"HX-Request": "true"}
+    while True:
+        for _ in range(opts["burst"]):
+            match = WORD_ID_RE.search(body)
+            if match is None:
+                break
+            word_id = match.group(1)
+            await track(stats, driver, rng, opts)
+            if rng.random() < opts["undo_rate"] and 'name="undo"' in body:
+                _, body = await timed(
+                    stats, driver, "/selfassess undo", "POST", "/selfassess",
+                    [("complete", 0), ("undo", "true")], htmx
+                )
+                match = WORD_ID_RE.search(body)
+                if match is None:
+                    break
+                word_id = match.group(1)
+            await think(rng, opts["think"])
+            _, body = await timed(
+                stats, driver, "/selfassess POST", "POST", "/selfassess",
+                [
+                    ("complete", 0),
+                    ("rating", rng.randint(1, 5)),
+                    ("word_id", word_id),
+                ],
+                htmx
+            )
+        if WORD_ID_RE.search(body) is None:
+            break
+        await think(rng, opts["pause"])
+
+
+async def rate_words_batched(stats, driver, rng, opts):
+    path = f"/selfassess/batch?k={opts['batch']}"
+    status, body = await timed(
+        stats, driver, "/selfassess/batch GET", "GET", path
+    )
+    # The first word's presentation was recorded by GET /selfassess
+    presented_at = None
+    while status == 200:
+        state = json.loads(body)
+        if "redirect" in state:
+            break
+        words = {
+            state["start"] + idx: word
+            for idx, word in enumerate(state["words"])
+        }
+        position = state["position"]
+        can_undo = not state["undo"] and position > 0
+        records = []
+        while position in words and len(records) < opts["burst"]:
+            await track(stats, driver, rng, opts)
+            undo = can_undo and rng.random() < opts["undo_rate"]
+            if undo:
+                position -= 1
+            await think(rng, opts["think"])
+            # Distinct answer times, since they identify a retried batch
+            answered_at = max(int(time.time() * 1000), (presented_at or 0) + 1)
+            records.append(dict(
+                word_id=words[position]["word_id"],
+                rating=rng.randint(1, 5),
+                presented_at=presented_at,
+                answered_at=answered_at,
+                undo=undo,
+            ))
+            presented_at = answered_at
+            position += 1
+            can_undo = not undo
+        status, body = await timed(
+            stats, driver, "/selfassess/batch POST", "POST", path,
+            json_body=records
+        )
+        await think(rng, opts["pause"])
+
+
+async def participant_flow(stats, driver, token, rng, opts):
+    await timed(stats, driver, "/start", "GET", f"/start/{token}")
+    _, body = await timed(stats, driver, "/selfassess GET", "GET", "/selfassess")
+    if opts["batch"]:
+        await rate_words_batched(stats, driver, rng, opts)
+    else:
+        await rate_words(stats, driver, body, rng, opts)
+    _, body = await timed(stats, driver, "/miniexam GET", "GET", "/miniexam")
+    pairs = []
+    for word_id in WORD_ID_RE.findall(body):
+        pairs.extend((
+            ("word_id", word_id),
+            ("defn_type", "definition_en"),
+            ("response", f"answer {word_id}"),
+        ))
+    if pairs:
+        await timed(stats, driver, "/miniexam POST", "POST", "/miniexam", pairs)
+
+
+def seed_participants(session, count, num_words):
+    tokens = [
+        add_bench_participant(session, num_words).token
+        for _ in range(count)
+    ]
+    session.commit()
+    return tokens
+
+
+def open_bench_db(num_words):
+    from sqlalchemy import inspect
+
+    from ..database import Word
+    from ..utils import get_session
+
+    session = get_session()
+    if inspect(session.get_bind()).has_table("word"):
+        num_words = session.execute(
+            select(func.count()).select_from(Word)
+        ).scalar()
+        return session, num_words
+    return create_bench_db(num_words), num_words
+
+
+async def run_flows(stats, drivers, tokens, seed, opts):
+    await asyncio.gather(*(
+        participant_flow(
+            stats, driver, token, random.Random(f"{seed}-{idx}"), opts
+        )
+        for idx, (driver, token) in enumerate(zip(drivers, tokens))
+    ))
+
+
+async def run_in_process(stats, tokens, seed, opts):
+    from ..app import app
+
+    handler = LockErrorCounter(stats)
+    app.logger.addHandler(handler)
+    try:
+        async with app.test_app():
+            drivers = [TestClientDriver(app) for _ in tokens]
+            start = time.perf_counter()
+            await run_flows(stats, drivers, tokens, seed, opts)
+            return time.perf_counter() - start
+    finally:
+        app.logger.removeHandler(handler)
+
+
+async def run_http(stats, url, tokens, seed, opts):
+    with ThreadPoolExecutor(max_workers=len(tokens)) as executor:
+        drivers = [HttpDriver(url, executor) for _ in tokens]
+        start = time.perf_counter()
+        await run_flows(stats, drivers, tokens, seed, opts)
+        return time.perf_counter() - start
+
+
+def print_summary(summary, http):
+    print("{:<24} {:>7} {:>7} {:>9} {:>9} {:>9}".format(
+        "route", "count", "errors", "p50 ms", "p95 ms", "p99 ms"
+    ))
+    for route, row in summary["routes"].items():
+        print("{:<24} {:>7} {:>7} {:>9.1f} {:>9.1f} {:>9.1f}".format(
+            route, row["count"], row["errors"],
+            row["p50_ms"], row["p95_ms"], row["p99_ms"]
+        ))
+    print()
+    print("{} requests in {:.1f}s: {:.1f} requests/s".format(
+        summary["requests"], summary["wall_time_s"], summary["throughput_rps"]
+    ))
+    if http:
+        print(
+            "SQLite lock errors: see the server log "
+            "(counted as errors above)"
+        )
+    else:
+        print("SQLite lock errors:", summary["lock_errors"])
+
+
+def compare(summary, baseline, tolerance):
+    regressed = False
+    for route, row in summary["routes"].items():
+        if route not in baseline["routes"]:
+            continue
+        before = baseline["routes"][route]["p95_ms"]
+        after = row["p95_ms"]
+        ratio = after / before if before else 1
+        flag = ""
+        if ratio > tolerance:
+            flag = " REGRESSION"
+            regressed = True
+        print(f"{route}: p95 {before:.1f}ms -> {after:.1f}ms ({ratio:.2f}x){flag}")
+    return regressed
+
+
+@click.command()
+@click.option("--participants", type=int, default=20)
+@click.option("--words", type=int, default=60, help="Size of a new word list")
+@click.option("--burst", type=int, default=10, help="Ratings between pauses")
+@click.option("--undo-rate", type=float, default=0.05)
+@click.option("--track-rate", type=float, default=0.5, help="/track pings per rating")
+@click.option("--think", type=float, default=0, help="Mean seconds before each rating")
+@click.option("--pause", type=float, default=0, help="Mean seconds between bursts")
+@click.option("--batch", type=int, default=0, help="Rate through /selfassess/batch fetching this many words ahead")
+@click.option("--seed", default="0")
+@click.option("--db", help="Database path or URL to create or add participants to")
+@click.option("--url", help="Base URL of a running server to load test instead")
+@click.option("--json", "json_path", type=click.Path(), help="Save the results here")
+@click.option("--baseline", type=click.File("r"), help="Results of an earlier run to compare with")
+@click.option("--tolerance", type=float, default=1.25)
+def main(
+    participants, words, burst, undo_rate, track_rate, think, pause, batch,
+    seed, db, url, json_path, baseline, tolerance
+):
+    if url is not None and db is None:
+        raise click.UsageError("--url needs the --db the server is using")
+    bench_env(db or scratch_db_path())
+    session, num_words = open_bench_db(words)
+    random.seed(seed)
+    tokens = seed_participants(session, participants, num_words)
+    opts = dict(
+        burst=burst,
+        undo_rate=undo_rate,
+        track_rate=track_rate,
+        think=think,
+        pause=pause,
+        batch=batch,
+    )
+    stats = Stats()
+    if url is None:
+        wall_time = asyncio.run(run_in_process(stats, tokens, seed, opts))
+    else:
+        wall_time = asyncio.run(run_http(stats, url, tokens, seed, opts))
+    summary = stats.summary(wall_time)
+    summary["settings"] = dict(
+        opts, participants=participants, words=num_words, url=url
+    )
+    print_summary(summary, url is not None)
+    if json_path is not None:
+        with open(json_path, "w") as outf:
+            json.dump(summary, outf, indent=2)
+    if baseline is not None:
+        print()
+        if compare(summary, json.load(baseline), tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
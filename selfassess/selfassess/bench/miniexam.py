@@ -0,0 +1,110 @@
+"""
+Time mini-exam submission and fix-up for exams of different lengths.
+"""
+import asyncio
+import time
+
+import click
+from sqlalchemy import select
+
+from .utils import (
+    add_bench_participant,
+    bench_env,
+    create_bench_db,
+    scratch_db_path,
+    summarise_ms,
+    urlencoded,
+)
+
+
+def add_miniexam_participant(session, num_words, questions):
+    from ..database import MiniexamSlot
+
+    participant = add_bench_participant(session, num_words)
+    session.execute(
+        MiniexamSlot.__table__.insert(),
+        [
+            dict(
+                participant_id=participant.id,
+                word_id=word_id,
+                miniexam_order=idx
+            )
+            for idx, word_id in enumerate(range(1, questions + 1))
+        ]
+    )
+    session.commit()
+    return participant
+
+
+def response_ids(session, participant):
+    from ..database import MiniexamResponse, MiniexamSlot
+
+    return session.execute(
+        select(MiniexamResponse.id)
+        .join(MiniexamSlot)
+        .filter(MiniexamSlot.participant_id == participant.id)
+    ).scalars().all()
+
+
+async def time_exam(app, session, num_words, questions):
+    participant = add_miniexam_participant(session, num_words, questions)
+    client = app.test_client()
+    await client.get(f"/start/{participant.token}")
+    pairs = []
+    for word_id in range(1, questions + 1):
+        pairs.extend((
+            ("word_id", word_id),
+            ("defn_type", "definition_en"),
+            ("response", f"answer {word_id}"),
+        ))
+    data, headers = urlencoded(pairs)
+    start = time.perf_counter()
+    resp = await client.post("/miniexam", data=data, headers=headers)
+    submit_time = time.perf_counter() - start
+    assert resp.status_code == 302, resp.status_code
+
+    pairs = []
+    for resp_id in response_ids(session, participant):
+        pairs.extend((
+            ("resp_id", resp_id),
+            ("defn_type", "topic_fi"),
+            ("response", f"fixed {resp_id}"),
+        ))
+    data, headers = urlencoded(pairs)
+    start = time.perf_counter()
+    resp = await client.post("/fixup-miniexam", data=data, headers=headers)
+    fixup_time = time.perf_counter() - start
+    assert resp.status_code == 302, resp.status_code
+    return submit_time, fixup_time
+
+
+async def run(app, session, num_words, questions, repeats):
+    async with app.test_app():
+        for num_questions in questions:
+            submit_times = []
+            fixup_times = []
+            for _ in range(repeats):
+                submit_time, fixup_time = await time_exam(
+                    app, session, num_words, num_questions
+                )
+                submit_times.append(submit_time)
+                fixup_times.append(fixup_time)
+            print(f"{num_questions} questions")
+            print("\tsubmit: " + summarise_ms(submit_times))
+            print("\tfix-up: " + summarise_ms(fixup_times))
+
+
+@click.command()
+@click.option("--questions", type=int, multiple=True, default=[100, 500])
+@click.option("--repeats", type=int, default=10)
+@click.option("--db", help="Scratch database path or URL to create")
+def main(questions, repeats, db):
+    bench_env(db or scratch_db_path())
+    num_words = max(questions)
+    session = create_bench_db(num_words)
+    from ..app import app
+    asyncio.run(run(app, session, num_words, questions, repeats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Helpers for the benchmarks, which run the web app in-process against a scratch
+SQLite database.
+
+The benchmarks need the same environment as the web app (see devenv.sh), but
+DATABASE_URL and ASYNC_DATABASE_URL are replaced with the scratch database.
+Where a benchmark takes --db it can be either the path of an SQLite database or
+a database URL, e.g. of a PostgreSQL database from selfassess.pg_scratch.
+"""
+import datetime
+import os
+import statistics
+import tempfile
+from urllib.parse import urlencode
+
+import shortuuid
+
+
+def bench_url(db):
+    if "://" in db:
+        return db
+    return f"sqlite:///{db}"
+
+
+def bench_env(db):
+    """
+    Point both the CLI session helpers and the already imported web app at
+    the database `db`, a path or URL.
+    """
+    from ..app import async_session, writer
+    from ..utils import async_database_url, create_db_engine
+
+    os.environ["DATABASE_URL"] = bench_url(db)
+    os.environ["ASYNC_DATABASE_URL"] = async_database_url(bench_url(db))
+    async_session.configure(bind=create_db_engine(
+        os.environ["ASYNC_DATABASE_URL"],
+        is_async=True
+    ))
+    writer.session_factory.configure(bind=create_db_engine(
+        os.environ["ASYNC_DATABASE_URL"],
+        is_async=True,
+        writer=True
+    ))
+
+
+def scratch_db_path():
+    fd, path = tempfile.mkstemp(prefix="selfassess-bench-", suffix=".db")
+    os.close(fd)
+    os.remove(path)
+    return path
+
+
+def create_bench_db(num_words):
+    """
+    Create the schema and a word list of `num_words` made up words in the
+    database given by DATABASE_URL.
+    """
+    from ..database import Base, Word
+    from ..utils import get_session
+    from ..wordlist import bump_word_list_version
+
+    session = get_session()
+    Base.metadata.create_all(session.get_bind())
+    session.execute(
+        Word.__table__.insert(),
+        [{"word": f"sana{idx}"} for idx in range(num_words)]
+    )
+    bump_word_list_version(session)
+    session.commit()
+    return session
+
+
+def add_bench_participant(session, num_words, **kwargs):
+    from ..database import Participant, ParticipantLanguage
+    from ..quali import ProofAge, ProofType
+    from ..slots import assign_seed
+
+    today = datetime.date.today()
+    token = shortuuid.uuid()
+    participant = Participant(
+        token=token,
+        create_date=datetime.datetime.now(),
+        accept_date=datetime.datetime.now(),
+        email=f"{token}@example.com",
+        accept_deadline=today + datetime.timedelta(days=4),
+        complete_deadline=today + datetime.timedelta(weeks=3),
+        proof_type=ProofType.other,
+        proof_age=ProofAge.lt1,
+        next_response=0,
+        undo=False,
+        **kwargs
+    )
+    session.add(participant)
+    session.add(ParticipantLanguage(
+        participant=participant,
+        language="en",
+        level=7,
+        primary_native=True
+    ))
+    session.flush()
+    assign_seed(session, participant, num_words)
+    return participant
+
+
+def urlencoded(pairs):
+    return (
+        urlencode(pairs),
+        {"Content-Type": "application/x-www-form-urlencoded"}
+    )
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return float("nan")
+    idx = min(int(round(pct / 100 * (len(values) - 1))), len(values) - 1)
+    return values[idx]
+
+
+def summarise_ms(timings):
+    return "mean {:.1f}ms median {:.1f}ms min {:.1f}ms".format(
+        statistics.mean(timings) * 1000,
+        statistics.median(timings) * 1000,
+        min(timings) * 1000,
+    )
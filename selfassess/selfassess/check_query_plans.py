@@ -0,0 +1,168 @@
+"""
+Run EXPLAIN QUERY PLAN on every query the web app and reporting tools issue
+and fail if any of them has to scan a whole table.
+
+By default the check runs against a fresh in-memory database built from the
+models. Pass --db to check a real database, e.g. after running the alembic
+migrations, so that the indexes created by the migrations are checked too.
+This can also be a PostgreSQL database. Since PostgreSQL prefers sequential
+scans of small tables, they are disabled for the check, so any which remain
+could not have been done with an index.
+"""
+import datetime
+import enum
+import re
+import sys
+from types import SimpleNamespace
+
+import click
+from sqlalchemy import create_engine
+
+from . import queries
+from .database import Base, SessionKind
+from .utils import create_db_engine
+
+
+USER = SimpleNamespace(id=1)
+
+
+# (name, statement, reason a full scan is acceptable or None)
+def plan_queries():
+    return [
+        ("participant_for_token", queries.participant_for_token("token"), None),
+        ("word_list_version", queries.word_list_version(), None),
+        ("all_words", queries.all_words(), "loads the whole word list once per worker and change"),
+        ("upcoming_response_slots", queries.upcoming_response_slots(1, 0, 50), None),
+        ("response_slot_id_at", queries.response_slot_id_at(1, 0), None),
+        ("response_at", queries.response_at(1, 1, datetime.datetime(2021, 1, 1)), None),
+        ("participant_position", queries.participant_position(1), None),
+        ("latest_presentation", queries.latest_presentation(1), None),
+        ("response_since", queries.response_since(1, datetime.datetime(2021, 1, 1)), None),
+        ("sessions_between", queries.sessions_between(1, SessionKind.selfassess, datetime.datetime(2021, 1, 1), datetime.datetime(2021, 1, 2)), None),
+        ("lock_participants", queries.lock_participants([1, 2]), None),
+        ("miniexam_slot_ids", queries.miniexam_slot_ids(USER), None),
+        ("miniexam_word_ids", queries.miniexam_word_ids(USER), None),
+        ("participant_miniexam_query", queries.participant_miniexam_query(USER), None),
+        ("miniexam_pool_sizes", queries.miniexam_pool_sizes(1), None),
+        ("miniexam_pool_sample", queries.miniexam_pool_sample(1, 1, 20), None),
+        ("native_language", queries.native_language(USER), None),
+        ("latest_selfassess_response", queries.latest_selfassess_response(USER), None),
+        (
+            "recent_responses",
+            queries.recent_responses(),
+            "exports every participant's responses"
+        ),
+        (
+            "recent_responses_for_participant",
+            queries.recent_responses_for_participant(USER),
+            None
+        ),
+        (
+            "participant_timeline_query",
+            queries.participant_timeline_query(),
+            "reporting tools load every participant"
+        ),
+    ]
+
+
+def explain(conn, stmt):
+    if conn.dialect.name == "postgresql":
+        # The PostgreSQL dialect cannot render every type, e.g. datetimes, as
+        # a literal, so pass the parameters separately
+        compiled = stmt.compile(
+            dialect=conn.dialect,
+            compile_kwargs={"render_postcompile": True}
+        )
+        # Bypassing the types' bind processing means enums need converting
+        # to their names by hand
+        params = {
+            key: value.name if isinstance(value, enum.Enum) else value
+            for key, value in compiled.params.items()
+        }
+        return [
+            row[0]
+            for row in conn.exec_driver_sql(
+                "EXPLAIN " + str(compiled), params
+            )
+        ]
+    compiled = stmt.compile(
+        dialect=conn.dialect,
+        compile_kwargs={"literal_binds": True}
+    )
+    return [
+        row[-1]
+        for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled))
+    ]
+
+
+PG_SEQ_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+def scanned_table(detail):
+    match = PG_SEQ_SCAN.search(detail)
+    if match is not None:
+        return match.group(1)
+    bits = detail.split()
+    if not bits or bits[0] != "SCAN":
+        return None
+    # SQLite < 3.36 says SCAN TABLE x while newer versions say SCAN x
+    if len(bits) > 2 and bits[1] == "TABLE":
+        return bits[2]
+    elif len(bits) > 1:
+        return bits[1]
+    return None
+
+
+def scanned_tables(plan, tables):
+    result = []
+    for detail in plan:
+        if scanned_table(detail) in tables:
+            result.append(detail.strip())
+    return result
+
+
+def check_plans(engine, verbose=False):
+    tables = set(Base.metadata.tables)
+    failures = []
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.exec_driver_sql("SET enable_seqscan = off")
+        for name, stmt, allowed in plan_queries():
+            plan = explain(conn, stmt)
+            scans = scanned_tables(plan, tables)
+            if verbose:
+                print(name)
+                for detail in plan:
+                    print("\t" + detail)
+            if not scans:
+                status = "ok"
+            elif allowed is not None:
+                status = f"scan allowed ({allowed})"
+            else:
+                status = "FAIL"
+                failures.append((name, scans))
+            print(f"{name}: {status}")
+    return failures
+
+
+@click.command()
+@click.option("--db", help="SQLAlchemy URL of database to check")
+@click.option("--verbose/--quiet")
+def main(db, verbose):
+    if db is None:
+        engine = create_engine("sqlite://", future=True)
+        Base.metadata.create_all(engine)
+    else:
+        engine = create_db_engine(db, read_only=True)
+    failures = check_plans(engine, verbose=verbose)
+    if failures:
+        print()
+        for name, scans in failures:
+            print(f"{name} falls back to a scan:")
+            for detail in scans:
+                print("\t" + detail)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
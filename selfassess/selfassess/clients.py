@@ -0,0 +1,106 @@
+"""
+Deduplicated clients for the session log.
+
+Every session log entry used to carry a JSON payload repeating the request's
+User-Agent and remote address. Instead each distinct pair is stored once in
+the client table, along with the device class parsed from the User-Agent, and
+entries refer to it by id. Rows are found by a hash of the pair, which has a
+unique index so that workers adding the same client at once end up sharing a
+row. Each worker remembers the ids it has seen so the usual case is a
+dictionary lookup.
+"""
+import hashlib
+import json
+
+import user_agents
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .cache import TTLCache
+from .database import Client
+
+
+# Both skip rows which conflict with one added by another worker, rather
+# than failing the whole statement
+DIALECT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def ua_to_device(ua):
+    ua_parse = user_agents.parse(ua or "")
+    if ua_parse.is_tablet:
+        return "tablet"
+    elif ua_parse.is_mobile:
+        return "mobile"
+    elif ua_parse.is_pc:
+        return "pc"
+    else:
+        return "unknown"
+
+
+def client_hash(remote_addr, user_agent):
+    return hashlib.sha256(
+        json.dumps([remote_addr, user_agent]).encode("utf-8")
+    ).hexdigest()[:32]
+
+
+def client_row(remote_addr, user_agent):
+    return dict(
+        hash=client_hash(remote_addr, user_agent),
+        remote_addr=remote_addr,
+        user_agent=user_agent,
+        device=ua_to_device(user_agent),
+    )
+
+
+class ClientIds:
+    def __init__(self, maxsize=4096, ttl=3600):
+        # Ids never change so the TTL only lets rarely seen clients go
+        self._ids = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def _select(self, session, hashes):
+        return dict((await session.execute(
+            select(Client.hash, Client.id).where(Client.hash.in_(hashes))
+        )).all())
+
+    async def lookup(self, session, clients):
+        """
+        Get {hash: client id} for an iterable of (remote_addr, user_agent)
+        pairs, adding any which are new. Ids of new rows are only remembered
+        once they are passed to `remember` after the transaction has been
+        committed.
+        """
+        by_hash = {client_hash(*client): client for client in clients}
+        ids = {}
+        missing = []
+        for digest in by_hash:
+            client_id = self._ids.get(digest)
+            if client_id is None:
+                missing.append(digest)
+            else:
+                ids[digest] = client_id
+        if not missing:
+            return ids
+        ids.update(await self._select(session, missing))
+        new = [
+            client_row(*by_hash[digest])
+            for digest in missing
+            if digest not in ids
+        ]
+        if new:
+            dialect = (await session.connection()).dialect.name
+            await session.execute(
+                DIALECT_INSERTS[dialect](Client.__table__)
+                .values(new)
+                .on_conflict_do_nothing(index_elements=["hash"])
+            )
+            ids.update(await self._select(
+                session, [row["hash"] for row in new]
+            ))
+        return ids
+
+    def remember(self, ids):
+        for digest, client_id in ids.items():
+            self._ids[digest] = client_id
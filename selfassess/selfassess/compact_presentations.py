@@ -0,0 +1,42 @@
+import click
+from sqlalchemy import func, select
+
+from .database import Participant, Presentation
+from .presentations import PRESENTATION_WINDOW, compact
+from .utils import get_session
+
+
+@click.command()
+@click.option(
+    "--window",
+    type=float,
+    default=PRESENTATION_WINDOW,
+    help="Seconds. Should match the web app's PRESENTATION_WINDOW.",
+)
+@click.argument("email", nargs=-1)
+def main(window, email):
+    """
+    Coalesce the repeated presentations written before the web app did so
+    itself. Without any emails, do this for every participant.
+    """
+    session = get_session()
+    query = select(Participant.id, Participant.email).order_by(Participant.id)
+    if email:
+        query = query.where(Participant.email.in_(email))
+    participants = session.execute(query).all()
+    before = session.execute(
+        select(func.count()).select_from(Presentation)
+    ).scalar()
+    deleted = 0
+    for participant_id, participant_email in participants:
+        participant_deleted = compact(session, participant_id, window)
+        # One transaction per participant so the website is not held up
+        session.commit()
+        if participant_deleted:
+            print(f"{participant_email}: removed {participant_deleted} presentations")
+        deleted += participant_deleted
+    print(f"Presentations: {before} -> {before - deleted}")
+
+
+if __name__ == "__main__":
+    main()
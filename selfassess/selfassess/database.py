@@ -1,5 +1,6 @@
 from sqlalchemy import (
-    Column, Date, DateTime, Enum, ForeignKey, func, Integer, String, JSON, Boolean
+    Column, Date, DateTime, Enum, Float, ForeignKey, func, Integer, String,
+    Boolean, Index
 )
 from sqlalchemy.orm import declarative_base, relationship
 import enum
@@ -38,7 +39,7 @@ class Participant(Base):
     __tablename__ = "participant"
 
     id = Column(Integer, primary_key=True)
-    token = Column(String, nullable=False)
+    token = Column(String, nullable=False, index=True)
     create_date = Column(DateTime, nullable=False)
     accept_date = Column(DateTime)
     accept_deadline = Column(Date, nullable=False)
@@ -71,6 +72,10 @@ class Participant(Base):
     complete_deadline = Column(Date, nullable=False)
     next_response = Column(Integer, default=0)
     undo = Column(Boolean, default=False)
+    # When set, the word order comes from selfassess.slots rather than
+    # having every ResponseSlot created up front
+    slot_seed = Column(Integer)
+    slot_words = Column(Integer)
 
     response_slots = relationship(
         "ResponseSlot",
@@ -86,6 +91,16 @@ class Participant(Base):
         "SessionLogEntry",
         back_populates="participant"
     )
+    activity_intervals = relationship(
+        "ActivityInterval",
+        back_populates="participant",
+        order_by="ActivityInterval.start_time"
+    )
+    participant_sessions = relationship(
+        "ParticipantSession",
+        back_populates="participant",
+        order_by="ParticipantSession.start_time"
+    )
     languages = relationship(
         "ParticipantLanguage",
         back_populates="participant"
@@ -133,11 +148,40 @@ class Word(Base):
     )
 
 
+class WordListVersion(Base):
+    """
+    A single row whose version is increased by every change to the word list,
+    so the web app's workers know to reload their copy of it (see
+    selfassess.wordlist).
+    """
+    __tablename__ = "word_list_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+
+
 class ResponseSlot(Base):
     __tablename__ = "response_slot"
+    __table_args__ = (
+        # Together with the implicit rowid these cover every column so
+        # looking up a slot never touches the table itself
+        Index(
+            "ix_response_slot_participant_id_response_order",
+            "participant_id",
+            "response_order",
+            "word_id",
+            unique=True
+        ),
+        Index(
+            "ix_response_slot_participant_id_word_id",
+            "participant_id",
+            "word_id",
+            "response_order"
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
-    participant_id = Column(Integer, ForeignKey('participant.id'), nullable=False, index=True)
+    participant_id = Column(Integer, ForeignKey('participant.id'), nullable=False)
     word_id = Column(Integer, ForeignKey('word.id'), nullable=False)
     response_order = Column(Integer, nullable=False)
 
@@ -149,9 +193,16 @@ class ResponseSlot(Base):
 
 class Response(Base):
     __tablename__ = "response"
+    __table_args__ = (
+        Index(
+            "ix_response_response_slot_id_timestamp",
+            "response_slot_id",
+            "timestamp"
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
-    response_slot_id = Column(Integer, ForeignKey('response_slot.id'), nullable=False, index=True)
+    response_slot_id = Column(Integer, ForeignKey('response_slot.id'), nullable=False)
     timestamp = Column(DateTime, nullable=False)
     rating = Column(Integer, nullable=False)
 
@@ -161,20 +212,77 @@ class Response(Base):
         return f"<Response @{self.timestamp!r}>"
 
 
+class LatestResponse(Base):
+    """
+    The most recent response for each response slot which has one. Kept up to
+    date whenever a response is added so reading a participant's current
+    ratings does not need to rank every response ever given.
+
+    Each row also gets a random sample key when it is created. The rows of a
+    participant with a given rating ordered by sample key are a uniform random
+    sample of the words they gave that rating, so the mini-exam questions can
+    be read off the index.
+    """
+    __tablename__ = "latest_response"
+    __table_args__ = (
+        Index(
+            "ix_latest_response_participant_id_rating_sample_key",
+            "participant_id",
+            "rating",
+            "sample_key"
+        ),
+    )
+
+    response_slot_id = Column(Integer, ForeignKey('response_slot.id'), primary_key=True)
+    participant_id = Column(Integer, ForeignKey('participant.id'), nullable=False)
+    response_id = Column(Integer, ForeignKey('response.id'), nullable=False)
+    # Copied from the response
+    rating = Column(Integer, nullable=False)
+    sample_key = Column(Float, nullable=False)
+
+    slot = relationship("ResponseSlot")
+    response = relationship("Response")
+
+
 class Presentation(Base):
     __tablename__ = "presentation"
+    __table_args__ = (
+        Index(
+            "ix_presentation_response_slot_id_timestamp",
+            "response_slot_id",
+            "timestamp"
+        ),
+    )
+
     id = Column(Integer, primary_key=True)
-    response_slot_id = Column(Integer, ForeignKey('response_slot.id'), nullable=False, index=True)
+    response_slot_id = Column(Integer, ForeignKey('response_slot.id'), nullable=False)
     timestamp = Column(DateTime, nullable=False)
+    # Number of times the word was shown which were coalesced into this row
+    # (see selfassess.presentations)
+    count = Column(Integer, nullable=False, default=1, server_default="1")
+    # When the first of them was shown. timestamp is the latest.
+    first_timestamp = Column(DateTime, nullable=False)
 
     slot = relationship("ResponseSlot", back_populates="presentations")
 
 
 class MiniexamSlot(Base):
     __tablename__ = "miniexam_slot"
+    __table_args__ = (
+        Index(
+            "ix_miniexam_slot_participant_id_word_id",
+            "participant_id",
+            "word_id"
+        ),
+        Index(
+            "ix_miniexam_slot_participant_id_miniexam_order",
+            "participant_id",
+            "miniexam_order"
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
-    participant_id = Column(Integer, ForeignKey('participant.id'), nullable=False, index=True)
+    participant_id = Column(Integer, ForeignKey('participant.id'), nullable=False)
     word_id = Column(Integer, ForeignKey('word.id'), nullable=False, index=True)
     miniexam_order = Column(Integer, nullable=False)
 
@@ -224,6 +332,20 @@ class SessionEvent(enum.Enum):
     selfassess_input = 8
 
 
+class Client(Base):
+    """
+    A distinct (remote address, User-Agent) pair seen in the session log (see
+    selfassess.clients).
+    """
+    __tablename__ = "client"
+
+    id = Column(Integer, primary_key=True)
+    hash = Column(String(32), nullable=False, unique=True)
+    remote_addr = Column(String)
+    user_agent = Column(String)
+    device = Column(String, nullable=False)
+
+
 class SessionLogEntry(Base):
     __tablename__ = "session_log_entry"
 
@@ -231,9 +353,111 @@ class SessionLogEntry(Base):
     participant_id = Column(Integer, ForeignKey('participant.id'), nullable=False, index=True)
     timestamp = Column(DateTime, nullable=False)
     type = Column(Enum(SessionEvent), nullable=False)
-    payload = Column(JSON)
+    client_id = Column(Integer, ForeignKey('client.id', name='fk_session_log_entry_client_id_client'))
 
     participant = relationship(
         "Participant",
         back_populates="session_log_entries"
     )
+    client = relationship("Client")
+
+
+@enum.unique
+class ActivityKind(enum.Enum):
+    selfassess = 1
+    miniexam = 2
+
+
+class ActivityInterval(Base):
+    """
+    A stretch of activity on the self-assessment or mini-exam page, as
+    reported to /track, with no long gaps between the events (see
+    selfassess.activity).
+    """
+    __tablename__ = "activity_interval"
+
+    id = Column(Integer, primary_key=True)
+    participant_id = Column(Integer, ForeignKey('participant.id'), nullable=False, index=True)
+    client_id = Column(Integer, ForeignKey('client.id'))
+    kind = Column(Enum(ActivityKind), nullable=False)
+    start_time = Column(DateTime, nullable=False)
+    end_time = Column(DateTime, nullable=False)
+    focus_count = Column(Integer, nullable=False, default=0)
+    blur_count = Column(Integer, nullable=False, default=0)
+    input_count = Column(Integer, nullable=False, default=0)
+
+    participant = relationship(
+        "Participant",
+        back_populates="activity_intervals"
+    )
+    client = relationship("Client")
+
+    @property
+    def event_count(self):
+        return self.focus_count + self.blur_count + self.input_count
+
+
+# As given by selfassess.clients.ua_to_device
+DEVICES = ("pc", "mobile", "tablet", "unknown")
+
+
+@enum.unique
+class SessionKind(enum.Enum):
+    selfassess = 1
+    miniexam = 2
+    # The overview page
+    other = 3
+
+
+class ParticipantSession(Base):
+    """
+    A summary of a stretch of a participant's activity of one kind with no
+    gaps longer than the session timeout, kept up to date as the activity is
+    written (see selfassess.sessions).
+    """
+    __tablename__ = "participant_session"
+    __table_args__ = (
+        Index(
+            "ix_participant_session_participant_id_kind_start_time",
+            "participant_id",
+            "kind",
+            "start_time",
+        ),
+    )
+
+    id = Column(Integer, primary_key=True)
+    participant_id = Column(Integer, ForeignKey('participant.id'), nullable=False)
+    kind = Column(Enum(SessionKind), nullable=False)
+    start_time = Column(DateTime, nullable=False)
+    end_time = Column(DateTime, nullable=False)
+    response_count = Column(Integer, nullable=False, default=0)
+    # The number of events from each kind of device
+    pc_count = Column(Integer, nullable=False, default=0)
+    mobile_count = Column(Integer, nullable=False, default=0)
+    tablet_count = Column(Integer, nullable=False, default=0)
+    unknown_count = Column(Integer, nullable=False, default=0)
+
+    participant = relationship(
+        "Participant",
+        back_populates="participant_sessions"
+    )
+
+    @property
+    def time(self):
+        return self.end_time - self.start_time
+
+    @property
+    def device_counts(self):
+        return {device: getattr(self, f"{device}_count") for device in DEVICES}
+
+    @property
+    def device(self):
+        """
+        The device most of the session's events came from, with ties going to
+        the first in DEVICES.
+        """
+        counts = self.device_counts
+        device = max(DEVICES, key=counts.get)
+        if not counts[device]:
+            return "unknown"
+        return device
@@ -4,8 +4,12 @@ import numpy
 import pandas
 from selfassess.utils import get_session
 from selfassess.quali import CEFR_SKILLS
-from .utils import get_participant_sessions
+from .utils import slot_presentations
+from selfassess.database import SessionKind
 from selfassess.queries import participant_timeline_query
+from selfassess.sessions import (
+    SessionsOutOfDate, session_index, sessions_of_kind
+)
 from datetime import timedelta
 from pandas.core.dtypes.dtypes import CategoricalDtype
 
@@ -135,7 +139,7 @@ def main(db_out, which, marking, use_original_ids):
     # Inefficient ORM usage here
     # -- but there are 15 items and this runs as a batch job
     ddb_conn = setup_duckdb(db_out)
-    sqlite_sess = get_session()
+    sqlite_sess = get_session(read_only=True)
     participants = sqlite_sess.execute(participant_timeline_query()).scalars()
     mark_lookups = {}
     for annotator_num, mark_info in enumerate(marking, start=1):
@@ -165,17 +169,17 @@ def main(db_out, which, marking, use_original_ids):
             continue
         if use_original_ids:
             pid = participant.id
-        selfassess_sessions = get_participant_sessions(
+        selfassess_sessions = sessions_of_kind(
             participant,
-            only_selfassess=True
+            SessionKind.selfassess
         )
-        first_date = selfassess_sessions[0]["first_timestamp"].date() if selfassess_sessions else None
-        miniexam_sessions = get_participant_sessions(
+        first_date = selfassess_sessions[0].start_time.date() if selfassess_sessions else None
+        miniexam_sessions = sessions_of_kind(
             participant,
-            only_miniexam=True
+            SessionKind.miniexam
         )
         miniexam_time_secs = int(sum((
-            miniexam_session["time"].total_seconds()
+            miniexam_session.time.total_seconds()
             for miniexam_session
             in miniexam_sessions
         )) + 0.5)
@@ -210,22 +214,34 @@ def main(db_out, which, marking, use_original_ids):
         )
         response_vals = []
         word_rating = {}
-        for selfassess_session in selfassess_sessions:
-            session_date = selfassess_session["first_timestamp"].date()
+        # The latest response to each word by session
+        session_responses = [[] for _ in selfassess_sessions]
+        for response in sorted((
+            slot.responses[-1]
+            for slot in participant.response_slots
+            if slot.responses
+        ), key=lambda response: response.timestamp):
+            try:
+                idx = session_index(selfassess_sessions, response.timestamp)
+            except SessionsOutOfDate as exc:
+                raise click.ClickException(f"{participant.email}: {exc}")
+            session_responses[idx].append(response)
+        for selfassess_session, responses in zip(
+            selfassess_sessions, session_responses
+        ):
+            session_date = selfassess_session.start_time.date()
             ddb_conn.execute(
                 "insert into selfassess_session values (?, ?, ?, ?, ?)",
                 [
                     session_id,
                     pid,
-                    selfassess_session["device"],
-                    int(selfassess_session["time"].total_seconds() + 0.5),
+                    selfassess_session.device,
+                    int(selfassess_session.time.total_seconds() + 0.5),
                     (session_date - first_date).days
                 ]
             )
-            for response in selfassess_session["response"]:
-                if not getattr(response, "is_latest", False):
-                    continue
-                presentation_timestamp = response.slot.presentations[-1].timestamp
+            for response in responses:
+                presentation_timestamp = slot_presentations(response.slot)[-1].timestamp
                 rt = int((response.timestamp - presentation_timestamp) / timedelta(microseconds=1) + 0.5)
                 response_vals.append((
                     session_id,
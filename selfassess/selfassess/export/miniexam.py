@@ -9,7 +9,7 @@ from selfassess.utils import get_session
 @click.argument("outf", type=click.Path())
 @click.argument("email", nargs=-1)
 def main(outf, email):
-    session = get_session()
+    session = get_session(read_only=True)
     rows = []
     for em in email:
         participant = session.query(Participant).filter_by(email=em).first()
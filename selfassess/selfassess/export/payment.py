@@ -4,7 +4,7 @@ from pandas import DataFrame
 from selfassess.utils import get_session
 from selfassess.database import Participant
 from selfassess.queries import participant_timeline_query
-from .utils import get_participant_sessions
+from selfassess.sessions import SessionsOutOfDate, check_sessions, merge_sessions
 
 
 @click.command()
@@ -20,7 +20,7 @@ def main(csvout, include_email):
 
     Period of the task to be done
     """
-    sqlite_sess = get_session()
+    sqlite_sess = get_session(read_only=True)
     participants = sqlite_sess.execute(participant_timeline_query()).scalars()
     names = []
     surnames = []
@@ -30,14 +30,18 @@ def main(csvout, include_email):
     for participant in participants:
         if include_email and participant.email not in include_email:
             continue
+        try:
+            check_sessions(participant)
+        except SessionsOutOfDate as exc:
+            raise click.ClickException(f"{participant.email}: {exc}")
         names.append(participant.given_name)
         surnames.append(participant.surname)
         email.append(participant.email)
         time = (
             sum((
-                part_session["time"].total_seconds()
-                for part_session
-                in get_participant_sessions(participant)
+                (end_time - start_time).total_seconds()
+                for start_time, end_time
+                in merge_sessions(participant.participant_sessions)
             ))
         ) / (60 * 60)
         period_start.append(participant.accept_date.date().isoformat())
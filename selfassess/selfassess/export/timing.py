@@ -1,29 +1,39 @@
 import click
 from pandas import DataFrame
 
-from selfassess.export.utils import get_participant_sessions
+from selfassess.database import SessionKind
 from selfassess.queries import participant_timeline_query
+from selfassess.sessions import (
+    SessionsOutOfDate, session_index, sessions_of_kind
+)
 from selfassess.utils import get_session
 
 
 @click.command()
 @click.argument("dfout")
 def main(dfout):
-    sqlite_sess = get_session()
+    sqlite_sess = get_session(read_only=True)
     participants = sqlite_sess.execute(participant_timeline_query()).scalars()
     pids = []
     sids = []
     times = []
     for participant in participants:
-        selfassess_sessions = get_participant_sessions(
+        selfassess_sessions = sessions_of_kind(
             participant,
-            only_selfassess=True
+            SessionKind.selfassess
         )
-        for sid, session in enumerate(selfassess_sessions):
-            for response in session["response"]:
-                pids.append(participant.id)
-                sids.append(sid)
-                times.append(response.timestamp)
+        for timestamp in sorted(
+            response.timestamp
+            for slot in participant.response_slots
+            for response in slot.responses
+        ):
+            try:
+                sid = session_index(selfassess_sessions, timestamp)
+            except SessionsOutOfDate as exc:
+                raise click.ClickException(f"{participant.email}: {exc}")
+            pids.append(participant.id)
+            sids.append(sid)
+            times.append(timestamp)
     df = DataFrame({
         "pids": pids,
         "sids": sids,
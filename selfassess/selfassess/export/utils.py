@@ -1,22 +1,13 @@
-import json
-import user_agents
 from statistics import mode
-from selfassess.database import Presentation, Response, SessionLogEntry, SessionEvent
+from selfassess.archive import get_archive
+from selfassess.database import (
+    ActivityInterval, Presentation, Response, SessionKind, SessionLogEntry
+)
+from selfassess.sessions import SESSION_TIMEOUT, event_kind
 
 
-SESSION_TIMEOUT = 300
-
-
-def ua_to_device(ua):
-    ua_parse = user_agents.parse(ua)
-    if ua_parse.is_tablet:
-        return "tablet"
-    elif ua_parse.is_mobile:
-        return "mobile"
-    elif ua_parse.is_pc:
-        return "pc"
-    else:
-        return "unknown"
+# Rows moved out of the database by selfassess.archive
+archive = get_archive()
 
 
 def gather_timestamped(objs):
@@ -30,40 +21,69 @@ def gather_timestamped(objs):
     return objs_timestamped
 
 
+def not_archived(rows, archived):
+    """
+    Drop the database rows which an archive run has already written but not
+    yet deleted.
+    """
+    if not archived:
+        return list(rows)
+    archived_keys = {(row.id, row.timestamp) for row in archived}
+    return [
+        row for row in rows
+        if (row.id, row.timestamp) not in archived_keys
+    ]
+
+
+def session_log_entries(participant):
+    """
+    All of a participant's session log entries, including archived ones.
+    """
+    archived = archive.session_log_entries(participant.id)
+    return archived + not_archived(participant.session_log_entries, archived)
+
+
+def slot_presentations(slot):
+    """
+    All of a response slot's presentations in order, including archived
+    ones.
+    """
+    archived = archive.presentations(slot.participant_id).get(slot.id, [])
+    return sorted(
+        archived + not_archived(slot.presentations, archived),
+        key=lambda presentation: presentation.timestamp
+    )
+
+
 def gather_events(
     participant,
     only_selfassess=False,
     only_miniexam=False
 ):
+    if only_selfassess:
+        kinds = {SessionKind.selfassess}
+    elif only_miniexam:
+        kinds = {SessionKind.miniexam}
+    else:
+        kinds = set(SessionKind)
     events = []
-    for session_log_entry in participant.session_log_entries:
-        if (
-            (
-                only_selfassess and
-                session_log_entry.type not in (
-                    SessionEvent.selfassess_hit,
-                    SessionEvent.selfassess_focus,
-                    SessionEvent.selfassess_blur,
-                    SessionEvent.selfassess_input
-                )
-            )
-            or
-            (
-                only_miniexam and
-                session_log_entry.type not in (
-                    SessionEvent.miniexam_blur,
-                    SessionEvent.miniexam_focus,
-                    SessionEvent.miniexam_input
-                )
-            )
-        ):
-            continue
-        events.append((session_log_entry.timestamp, session_log_entry))
-    if not only_miniexam:
+    for session_log_entry in session_log_entries(participant):
+        if event_kind(session_log_entry) in kinds:
+            events.append((session_log_entry.timestamp, session_log_entry))
+    for interval in participant.activity_intervals:
+        if event_kind(interval) in kinds:
+            events.append((interval.start_time, interval))
+    if SessionKind.selfassess in kinds:
         for slot in participant.response_slots:
             events.extend(gather_timestamped(slot.responses))
-            events.extend(gather_timestamped(slot.presentations))
-    events.sort()
+            events.extend(
+                (presentation.first_timestamp, presentation)
+                for presentation in slot_presentations(slot)
+            )
+    # A response and the presentation of the next word can share a
+    # timestamp, and the objects themselves are not comparable. The sort is
+    # stable so a slot's events stay ahead of the next slot's.
+    events.sort(key=lambda event: event[0])
     return events
 
 
@@ -103,11 +123,26 @@ def events_to_sessions(events):
             sessions[-1]["first_timestamp"] = timestamp
         if isinstance(event, Response):
             sessions[-1]["response"].append(event)
-        elif isinstance(event, SessionLogEntry):
-            device = ua_to_device(json.loads(event.payload)["user_agent"])
-            sessions[-1]["devices"].append(device)
-        last_timestamp = timestamp
-    end_session(timestamp)
+        elif isinstance(event, Presentation):
+            # Coalesced from the times the word was shown from its first
+            # timestamp until its latest
+            timestamp = max(timestamp, event.timestamp)
+        elif isinstance(event, (SessionLogEntry, ActivityInterval)):
+            # Parsed once per client when it was first seen
+            if event.client is not None:
+                device = event.client.device
+            else:
+                device = "unknown"
+            if isinstance(event, ActivityInterval):
+                # Counts as the pings it stands for, and the participant was
+                # active until its end
+                sessions[-1]["devices"].extend([device] * event.event_count)
+                timestamp = max(timestamp, event.end_time)
+            else:
+                sessions[-1]["devices"].append(device)
+        if last_timestamp is None or timestamp > last_timestamp:
+            last_timestamp = timestamp
+    end_session(last_timestamp)
     return sessions
 
 
@@ -121,3 +156,18 @@ def get_participant_sessions(
         only_selfassess=only_selfassess,
         only_miniexam=only_miniexam
     ))
+
+
+def get_participant_sessions_by_kind(participant):
+    """
+    {SessionKind: sessions} as kept in the participant_session table (see
+    selfassess.sessions).
+    """
+    return {
+        kind: events_to_sessions([
+            (timestamp, event)
+            for timestamp, event in gather_events(participant)
+            if event_kind(event) == kind
+        ])
+        for kind in SessionKind
+    }
@@ -2,6 +2,7 @@ import click
 import random
 from .utils import get_session
 from .database import ResponseSlot, Word, Participant
+from .wordlist import bump_word_list_version
 from sqlalchemy import func
 
 
@@ -36,6 +37,7 @@ def main(extra_words):
                 participant=participant,
                 word=word_row
             ))
+    bump_word_list_version(session)
     session.commit()
 
 
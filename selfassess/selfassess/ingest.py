@@ -0,0 +1,172 @@
+"""
+Write-behind ingestion of session log entries.
+
+The /track endpoint is hit on every focus/blur/input in the browser, so rather
+than committing each event on its own, events are put on an in-process queue
+and a background task writes them out with multi-row INSERTs whenever either
+enough of them have built up or the oldest one has waited long enough. The
+INSERTs are run by the worker's selfassess.writer.Writer along with its other
+writes. Each event's remote address and User-Agent are swapped for the id of
+its row in the client table (see selfassess.clients) on the way in.
+"""
+import asyncio
+import datetime
+import logging
+
+from sqlalchemy import insert
+
+from .clients import ClientIds, client_hash, ua_to_device
+from .database import SessionLogEntry
+from .sessions import SESSION_EVENT_KINDS, Activity
+
+
+logger = logging.getLogger(__name__)
+
+# SQLite allows 999 bound parameters per statement in older versions, and a
+# session log row, like the client row which may be added for it, has 4
+MAX_BATCH = 999 // 4
+
+
+async def insert_events(session, rows, client_ids):
+    ids = await client_ids.lookup(session, {
+        (row["remote_addr"], row["user_agent"]) for row in rows
+    })
+    await session.execute(insert(SessionLogEntry.__table__).values([
+        dict(
+            participant_id=row["participant_id"],
+            type=row["type"],
+            timestamp=row["timestamp"],
+            client_id=ids[client_hash(row["remote_addr"], row["user_agent"])],
+        )
+        for row in rows
+    ]))
+    activity = Activity()
+    for row in rows:
+        activity.add(
+            row["participant_id"],
+            SESSION_EVENT_KINDS[row["type"]],
+            row["timestamp"],
+            device=ua_to_device(row["user_agent"]),
+        )
+    await activity.write(session)
+    return ids
+
+
+class EventQueue:
+    def __init__(
+        self,
+        writer,
+        max_batch=200,
+        max_delay=1.0,
+        max_size=10000,
+        late_after=10.0,
+    ):
+        self.writer = writer
+        if max_batch > MAX_BATCH:
+            logger.warning(
+                "Event batch size %d is over the limit of %d; using %d",
+                max_batch,
+                MAX_BATCH,
+                MAX_BATCH
+            )
+        self.max_batch = min(max_batch, MAX_BATCH)
+        self.max_delay = max_delay
+        self.max_size = max_size
+        self.late_after = datetime.timedelta(seconds=late_after)
+        self.client_ids = ClientIds()
+        self.written = 0
+        self.dropped = 0
+        self.late = 0
+        self._queue = None
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "written": self.written,
+            "dropped": self.dropped,
+            "late": self.late,
+        }
+
+    def put(self, row):
+        if self._queue is None:
+            self.dropped += 1
+            logger.warning("Event queue not running; dropped event")
+            return
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """
+        Stop accepting events and wait until everything already queued has
+        been written.
+        """
+        if self._task is None:
+            return
+        queue = self._queue
+        self._queue = None
+        await queue.put(None)
+        await self._task
+        self._task = None
+        if self.dropped or self.late:
+            logger.warning(
+                "Event queue stopped: %d dropped and %d late events",
+                self.dropped,
+                self.late
+            )
+
+    async def _next_batch(self, queue):
+        loop = asyncio.get_event_loop()
+        row = await queue.get()
+        if row is None:
+            return [], True
+        batch = [row]
+        deadline = loop.time() + self.max_delay
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                row = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if row is None:
+                return batch, True
+            batch.append(row)
+        return batch, False
+
+    async def _run(self):
+        queue = self._queue
+        done = False
+        while not done:
+            batch, done = await self._next_batch(queue)
+            if batch:
+                await self._flush(batch)
+
+    async def _flush(self, batch):
+        try:
+            ids = await self.writer.submit(
+                insert_events, batch, self.client_ids
+            )
+        except Exception:
+            self.dropped += len(batch)
+            logger.exception("Failed to write %d session events", len(batch))
+            return
+        self.client_ids.remember(ids)
+        now = datetime.datetime.now()
+        self.written += len(batch)
+        self.late += sum((
+            1
+            for row in batch
+            if now - row["timestamp"] > self.late_after
+        ))
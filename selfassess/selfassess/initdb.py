@@ -1,6 +1,7 @@
 import click
 from .database import Word
 from .utils import get_session
+from .wordlist import bump_word_list_version
 
 
 def create_db(session):
@@ -22,6 +23,7 @@ def main(word_list):
         if not word:
             continue
         session.add(Word(word=word))
+    bump_word_list_version(session)
     session.commit()
 
 
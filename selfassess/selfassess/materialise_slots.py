@@ -0,0 +1,26 @@
+import click
+
+from .database import Participant
+from .slots import materialise
+from .utils import get_session
+
+
+@click.command()
+@click.argument("email", nargs=-1)
+def main(email):
+    """
+    Create all response slots for participants with a seeded word order.
+    Without any emails, do this for every such participant.
+    """
+    session = get_session()
+    query = session.query(Participant).filter(Participant.slot_seed.isnot(None))
+    if email:
+        query = query.filter(Participant.email.in_(email))
+    for participant in query:
+        created = materialise(session, participant)
+        print(f"{participant.email}: created {created} slots")
+    session.commit()
+
+
+if __name__ == "__main__":
+    main()
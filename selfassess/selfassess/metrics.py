@@ -0,0 +1,175 @@
+"""
+In-process request metrics in the Prometheus text format.
+
+For every request the wall time, the number of SQL statements and the time
+spent in them, and the template rendering time are recorded into histograms
+labelled by route and method. The figures are per worker process, so with
+several hypercorn workers each scrape of /metrics reports on the worker which
+happened to serve it.
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+TIME_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames, buckets):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [count per bucket (+Inf last), sum]
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def _labelstr(self, labels, extra=()):
+        pairs = list(zip(self.labelnames, labels)) + list(extra)
+        return ",".join(
+            '{}="{}"'.format(
+                name,
+                str(value).replace("\\", "\\\\").replace('"', '\\"')
+            )
+            for name, value in pairs
+        )
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append("{}_bucket{{{}}} {}".format(
+                    self.name,
+                    self._labelstr(labels, [("le", bound)]),
+                    cumulative
+                ))
+            labelstr = self._labelstr(labels)
+            lines.append(f"{self.name}_sum{{{labelstr}}} {total}")
+            lines.append(f"{self.name}_count{{{labelstr}}} {cumulative}")
+        return lines
+
+
+class _RequestTimer:
+    __slots__ = ("start", "sql_statements", "sql_time", "render_time", "render_start")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_statements = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+        self.render_start = None
+
+
+_current = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    def __init__(self, prefix="selfassess"):
+        labelnames = ("route", "method")
+        self.duration = Histogram(
+            f"{prefix}_request_duration_seconds",
+            "Wall time to handle a request",
+            labelnames + ("status",),
+            TIME_BUCKETS
+        )
+        self.sql_statements = Histogram(
+            f"{prefix}_request_sql_statements",
+            "SQL statements executed per request",
+            labelnames,
+            COUNT_BUCKETS
+        )
+        self.sql_time = Histogram(
+            f"{prefix}_request_sql_duration_seconds",
+            "Time spent executing SQL per request",
+            labelnames,
+            TIME_BUCKETS
+        )
+        self.render_time = Histogram(
+            f"{prefix}_request_render_duration_seconds",
+            "Time spent rendering templates per request",
+            labelnames,
+            TIME_BUCKETS
+        )
+
+    def start_request(self):
+        _current.set(_RequestTimer())
+
+    def finish_request(self, route, method, status):
+        timer = _current.get()
+        if timer is None:
+            return
+        _current.set(None)
+        labels = (route, method)
+        self.duration.observe(
+            labels + (status,), time.perf_counter() - timer.start
+        )
+        self.sql_statements.observe(labels, timer.sql_statements)
+        self.sql_time.observe(labels, timer.sql_time)
+        self.render_time.observe(labels, timer.render_time)
+
+    def render(self):
+        lines = []
+        for histogram in (
+            self.duration,
+            self.sql_statements,
+            self.sql_time,
+            self.render_time,
+        ):
+            lines.extend(histogram.render())
+        return "\n".join(lines) + "\n"
+
+
+def template_started(sender, **extra):
+    timer = _current.get()
+    if timer is not None:
+        timer.render_start = time.perf_counter()
+
+
+def template_finished(sender, **extra):
+    timer = _current.get()
+    if timer is not None and timer.render_start is not None:
+        timer.render_time += time.perf_counter() - timer.render_start
+        timer.render_start = None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timer = _current.get()
+    if timer is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timer = _current.get()
+    starts = conn.info.get("query_start")
+    if timer is not None and starts:
+        timer.sql_statements += 1
+        timer.sql_time += time.perf_counter() - starts.pop()
+
+
+def install_sql_timing():
+    """
+    Time every statement of every engine, including async engines, whose
+    statements run on their underlying sync engine. Statements run outside of
+    a request are ignored.
+    """
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
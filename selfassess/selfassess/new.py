@@ -9,6 +9,7 @@ from .database import (
     Participant, ParticipantLanguage, Word, ResponseSlot, ProofAge, ProofType
 )
 from .app import app
+from .slots import assign_seed
 import asyncio
 from sqlalchemy import select
 import random
@@ -163,13 +164,7 @@ def prompts(email):
     return years_in_finland, native_lang_obj, other_langs, proof_type, proof_age, text_on_proof, cefrs
 
 
-@click.command()
-@click.argument("email")
-@click.option("--days", type=int, default=4)
-def main(email, days):
-    years_in_finland, native_lang, other_langs, proof_type, proof_age, text_on_proof, cefrs = prompts(email)
-    session = get_session()
-    token = shortuuid.uuid()
+def deadlines(days):
     create_datetime = datetime.datetime.now()
     accept_deadline = (
         create_datetime + datetime.timedelta(days=days)
@@ -177,66 +172,134 @@ def main(email, days):
     complete_deadline = (
         create_datetime + datetime.timedelta(weeks=3)
     ).date()
-    with session.begin():
-        participant = Participant(
-            token=token,
-            create_date=create_datetime,
-            accept_date=None,
-            email=email,
-            accept_deadline=accept_deadline,
-            complete_deadline=complete_deadline,
-            proof_type=proof_type,
-            proof_age=proof_age,
-            text_on_proof=text_on_proof,
-            lived_in_finland=years_in_finland,
-            **{
-                f"cefr_{type}_{skill}": level
-                for type, skill, level in cefrs
-            }
-        )
-        session.add(participant)
+    return create_datetime, accept_deadline, complete_deadline
+
+
+def add_participant(
+    session,
+    email,
+    days,
+    years_in_finland,
+    native_lang,
+    other_langs,
+    proof_type,
+    proof_age,
+    text_on_proof,
+    cefrs
+):
+    create_datetime, accept_deadline, complete_deadline = deadlines(days)
+    participant = Participant(
+        token=shortuuid.uuid(),
+        create_date=create_datetime,
+        accept_date=None,
+        email=email,
+        accept_deadline=accept_deadline,
+        complete_deadline=complete_deadline,
+        proof_type=proof_type,
+        proof_age=proof_age,
+        text_on_proof=text_on_proof,
+        lived_in_finland=years_in_finland,
+        **{
+            f"cefr_{type}_{skill}": level
+            for type, skill, level in cefrs
+        }
+    )
+    session.add(participant)
+    participant_language = ParticipantLanguage(
+        participant=participant,
+        language=native_lang.language,
+        level=7,
+        primary_native=True
+    )
+    session.add(participant_language)
+    for other_lang, cefr in other_langs:
         participant_language = ParticipantLanguage(
             participant=participant,
-            language=native_lang.language,
-            level=7,
-            primary_native=True
+            language=other_lang.language,
+            level=cefr,
         )
         session.add(participant_language)
-        for other_lang, cefr in other_langs:
-            participant_language = ParticipantLanguage(
-                participant=participant,
-                language=other_lang.language,
-                level=cefr,
-            )
-            session.add(participant_language)
-        word_ids = [
-            word_id for (word_id,) in session.execute(select(Word.id)).all()
-        ]
-        random.shuffle(word_ids)
-        for idx, word_id in enumerate(word_ids):
-            session.add(ResponseSlot(
-                response_order=idx,
-                participant=participant,
-                word_id=word_id
-            ))
-
-    async def get_link():
+    return participant
+
+
+def shuffled_slot_rows(participant_id, word_ids):
+    word_ids = list(word_ids)
+    random.shuffle(word_ids)
+    for idx, word_id in enumerate(word_ids):
+        yield dict(
+            response_order=idx,
+            participant_id=participant_id,
+            word_id=word_id
+        )
+
+
+SLOT_INSERT_CHUNK = 20000
+
+
+def insert_slots(session, rows):
+    """
+    Insert response slot rows with executemany in chunks, bypassing the ORM.
+    """
+    insert = ResponseSlot.__table__.insert()
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= SLOT_INSERT_CHUNK:
+            session.execute(insert, chunk)
+            chunk = []
+    if chunk:
+        session.execute(insert, chunk)
+
+
+def get_links(tokens):
+    async def get_links():
         async with app.app_context():
-            return url_for(
-                "start",
-                token=token,
-                _external=True,
-                _scheme="https" if not app.debug else "http"
-            )
+            return [
+                url_for(
+                    "start",
+                    token=token,
+                    _external=True,
+                    _scheme="https" if not app.debug else "http"
+                )
+                for token in tokens
+            ]
     loop = asyncio.get_event_loop()
-    link = loop.run_until_complete(get_link())
-    print(EMAIL_TEMPLATE.render(
-        email=email,
+    return loop.run_until_complete(get_links())
+
+
+def render_invitation(participant, days, link):
+    return EMAIL_TEMPLATE.render(
+        email=participant.email,
         begin_days=days,
         link=link,
-        accept_deadline=accept_deadline.strftime('%A %d/%m/%Y'),
-        complete_deadline=complete_deadline.strftime('%A %d/%m/%Y'),
-    ))
+        accept_deadline=participant.accept_deadline.strftime('%A %d/%m/%Y'),
+        complete_deadline=participant.complete_deadline.strftime('%A %d/%m/%Y'),
+    )
+
+
+@click.command()
+@click.argument("email")
+@click.option("--days", type=int, default=4)
+@click.option(
+    "--materialise/--seeded",
+    help="Create every response slot now rather than using a seeded word order"
+)
+def main(email, days, materialise):
+    fields = prompts(email)
+    session = get_session()
+    with session.begin():
+        participant = add_participant(session, email, days, *fields)
+        if materialise:
+            word_ids = [
+                word_id for (word_id,) in session.execute(select(Word.id)).all()
+            ]
+            session.flush()
+            insert_slots(session, shuffled_slot_rows(participant.id, word_ids))
+        else:
+            assign_seed(session, participant)
+
+    link, = get_links([participant.token])
+    print(render_invitation(participant, days, link))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,139 @@
+"""
+Enroll a whole cohort of participants from a CSV or JSONL file in one
+transaction and print all of their invitation emails.
+
+Each record has the same fields that `selfassess.new` prompts for:
+
+ * email
+ * years_in_finland
+ * native_language: ISO alpha2 code
+ * other_languages: e.g. "fr:b2;de:none" in CSV or a list of
+   {"language": ..., "level": ...} objects in JSONL
+ * proof_type, proof_age: names from selfassess.quali
+ * text_on_proof: with \\n for line breaks
+ * proof_speaking, proof_writing, ..., selfassess_reading_comprehension:
+   CEFR level as a1-c2 or 1-6
+"""
+import csv
+import json
+import sys
+
+import click
+from sqlalchemy import select, func
+
+from .database import ProofAge, ProofType, Word
+from .new import (
+    add_participant,
+    convert_cefr,
+    convert_lang,
+    get_links,
+    insert_slots,
+    render_invitation,
+    shuffled_slot_rows,
+)
+from .quali import CEFR_SKILLS
+from .slots import assign_seed
+from .utils import get_session
+
+
+def read_records(inf, fmt):
+    if fmt == "jsonl":
+        for line in inf:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    else:
+        yield from csv.DictReader(inf)
+
+
+def parse_other_languages(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = [
+            dict(zip(("language", "level"), bit.split(":", 1)))
+            for bit in value.split(";")
+            if bit.strip()
+        ]
+    return [
+        (
+            convert_lang(lang["language"]),
+            convert_cefr(str(lang["level"]), allow_none=True)
+        )
+        for lang in value
+    ]
+
+
+def parse_record(record):
+    text_on_proof = record.get("text_on_proof") or ""
+    cefrs = []
+    for type in ("proof", "selfassess"):
+        for skill in CEFR_SKILLS:
+            level = convert_cefr(str(record[f"{type}_{skill}"]), max_level=6)
+            cefrs.append((type, skill, level))
+    return record["email"].strip(), (
+        int(record["years_in_finland"]),
+        convert_lang(record["native_language"]),
+        parse_other_languages(record.get("other_languages")),
+        ProofType[record["proof_type"].strip()],
+        ProofAge[record["proof_age"].strip()],
+        text_on_proof.replace("\\n", "\n"),
+        cefrs,
+    )
+
+
+@click.command()
+@click.argument("participants", type=click.File("r"))
+@click.option("--format", "fmt", type=click.Choice(["csv", "jsonl"]))
+@click.option("--days", type=int, default=4)
+@click.option(
+    "--materialise/--seeded",
+    help="Create every response slot now rather than using a seeded word order"
+)
+def main(participants, fmt, days, materialise):
+    if fmt is None:
+        fmt = "jsonl" if participants.name.endswith(".jsonl") else "csv"
+    parsed = []
+    errors = False
+    for idx, record in enumerate(read_records(participants, fmt), start=1):
+        try:
+            parsed.append(parse_record(record))
+        except Exception as exc:
+            print(f"Record {idx}: {exc!r}", file=sys.stderr)
+            errors = True
+    if errors:
+        print("Exiting. Nothing was inserted.", file=sys.stderr)
+        sys.exit(-1)
+
+    session = get_session()
+    with session.begin():
+        new_participants = [
+            add_participant(session, email, days, *fields)
+            for email, fields in parsed
+        ]
+        session.flush()
+        if materialise:
+            word_ids = [
+                word_id for (word_id,) in session.execute(select(Word.id)).all()
+            ]
+            for participant in new_participants:
+                insert_slots(
+                    session,
+                    shuffled_slot_rows(participant.id, word_ids)
+                )
+        else:
+            num_words = session.execute(
+                select(func.count()).select_from(Word)
+            ).scalar()
+            for participant in new_participants:
+                assign_seed(session, participant, num_words)
+    print(f"Inserted {len(new_participants)} participants", file=sys.stderr)
+
+    links = get_links([participant.token for participant in new_participants])
+    for participant, link in zip(new_participants, links):
+        print(render_invitation(participant, days, link))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Run a throwaway local PostgreSQL server without Docker, e.g. to run the
+checks and benchmarks against PostgreSQL as well as SQLite:
+
+    python -m selfassess.pg_scratch -- sh -c '
+        python -m selfassess.initdb wordlist.txt &&
+        python -m selfassess.check_query_plans --db $DATABASE_URL &&
+        python -m selfassess.bench.load --db $DATABASE_URL'
+
+The command is run with DATABASE_URL and ASYNC_DATABASE_URL pointing at a new
+empty database, which is deleted afterwards. They must still be set to
+something beforehand, since importing the selfassess package sets up the
+website. Without a command the URLs are
+printed and the server is left running until it is stopped with Ctrl+C.
+
+Needs the pgserver package, which bundles the PostgreSQL binaries, as well as
+psycopg2 and asyncpg (the pg_scratch and postgresql extras).
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+from .utils import async_database_url
+
+
+@click.command()
+@click.argument("command", nargs=-1)
+@click.option("--database", default="selfassess")
+def main(command, database):
+    try:
+        import pgserver
+    except ImportError:
+        print(
+            "pg_scratch needs pgserver: poetry install --extras pg_scratch "
+            "--extras postgresql",
+            file=sys.stderr
+        )
+        sys.exit(-1)
+    with tempfile.TemporaryDirectory(prefix="selfassess-pg-") as pgdata:
+        server = pgserver.get_server(pgdata, cleanup_mode="stop")
+        try:
+            server.psql(f"CREATE DATABASE {database};")
+            url = server.get_uri(database).replace(
+                "postgresql://", "postgresql+psycopg2://", 1
+            )
+            env = dict(
+                os.environ,
+                DATABASE_URL=url,
+                ASYNC_DATABASE_URL=async_database_url(url),
+            )
+            if command:
+                returncode = subprocess.call(command, env=env)
+            else:
+                print(f"export DATABASE_URL='{env['DATABASE_URL']}'")
+                print(f"export ASYNC_DATABASE_URL='{env['ASYNC_DATABASE_URL']}'")
+                print("Press Ctrl+C to stop", file=sys.stderr)
+                returncode = 0
+                try:
+                    while True:
+                        time.sleep(3600)
+                except KeyboardInterrupt:
+                    pass
+        finally:
+            server.cleanup()
+    sys.exit(returncode)
+
+
+if __name__ == "__main__":
+    main()
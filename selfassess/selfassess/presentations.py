@@ -0,0 +1,141 @@
+"""
+Coalescing of repeated presentations.
+
+Reloading the page, going back and forth and htmx retries all render the
+same word again, and each render used to add a presentation row. Now when a
+slot's word is shown again within `window` seconds of its latest
+presentation, and there has been no response to it in between, that
+presentation is moved on to the new time and its count increased instead.
+The latest presentation of a slot, which is what the reaction times are
+measured from, is the same either way. The time of the first is kept as
+first_timestamp, so the sessions still start when the word was first shown.
+
+compact() applies the same rule to the presentations written before this.
+"""
+import bisect
+import datetime
+from itertools import groupby
+
+from sqlalchemy import bindparam, delete, select, update
+
+from .database import Presentation, Response, ResponseSlot
+from .queries import latest_presentation, response_since
+
+
+# Seconds
+PRESENTATION_WINDOW = 60.0
+DELETE_CHUNK = 500
+
+
+async def add_presentation(session, response_slot_id, timestamp, window):
+    latest = (await session.execute(
+        latest_presentation(response_slot_id)
+    )).first()
+    if (
+        latest is not None
+        and timestamp - datetime.timedelta(seconds=window)
+        <= latest.timestamp <= timestamp
+        and (await session.execute(
+            response_since(response_slot_id, latest.timestamp)
+        )).first() is None
+    ):
+        await session.execute(
+            update(Presentation)
+            .where(Presentation.id == latest.id)
+            .values(timestamp=timestamp, count=Presentation.count + 1)
+            .execution_options(synchronize_session=False)
+        )
+    else:
+        session.add(Presentation(
+            response_slot_id=response_slot_id,
+            timestamp=timestamp,
+            first_timestamp=timestamp,
+        ))
+
+
+def coalesce(presentations, response_timestamps, window):
+    """
+    Group one slot's presentations, in timestamp order, into runs which
+    add_presentation() would have coalesced. Yields (kept id, total count,
+    first timestamp, ids to delete) for each run of more than one.
+    """
+    window = datetime.timedelta(seconds=window)
+    runs = []
+    for presentation in presentations:
+        if runs:
+            last = runs[-1][-1]
+            # Any response at or after the last presentation of the run
+            # and at or before this one splits them
+            idx = bisect.bisect_left(response_timestamps, last.timestamp)
+            answered = (
+                idx < len(response_timestamps)
+                and response_timestamps[idx] <= presentation.timestamp
+            )
+            if presentation.timestamp - last.timestamp <= window and not answered:
+                runs[-1].append(presentation)
+                continue
+        runs.append([presentation])
+    for run in runs:
+        if len(run) > 1:
+            yield (
+                run[-1].id,
+                sum(presentation.count for presentation in run),
+                run[0].first_timestamp,
+                [presentation.id for presentation in run[:-1]],
+            )
+
+
+def compact(session, participant_id, window):
+    """
+    Coalesce a participant's existing presentations. Returns the number of
+    rows deleted.
+    """
+    presentations = session.execute(
+        select(
+            Presentation.id,
+            Presentation.response_slot_id,
+            Presentation.timestamp,
+            Presentation.count,
+            Presentation.first_timestamp,
+        ).join(ResponseSlot).where(
+            ResponseSlot.participant_id == participant_id
+        ).order_by(Presentation.response_slot_id, Presentation.timestamp)
+    ).all()
+    response_timestamps = {}
+    for slot_id, timestamp in session.execute(
+        select(Response.response_slot_id, Response.timestamp).join(
+            ResponseSlot
+        ).where(
+            ResponseSlot.participant_id == participant_id
+        ).order_by(Response.response_slot_id, Response.timestamp)
+    ):
+        response_timestamps.setdefault(slot_id, []).append(timestamp)
+    kept = []
+    deleted = []
+    for slot_id, slot_presentations in groupby(
+        presentations, lambda presentation: presentation.response_slot_id
+    ):
+        for kept_id, count, first_timestamp, delete_ids in coalesce(
+            slot_presentations, response_timestamps.get(slot_id, []), window
+        ):
+            kept.append({
+                "kept_id": kept_id,
+                "new_count": count,
+                "new_first_timestamp": first_timestamp,
+            })
+            deleted.extend(delete_ids)
+    if kept:
+        session.execute(
+            update(Presentation.__table__)
+            .where(Presentation.__table__.c.id == bindparam("kept_id"))
+            .values(
+                count=bindparam("new_count"),
+                first_timestamp=bindparam("new_first_timestamp"),
+            ),
+            kept
+        )
+        for start in range(0, len(deleted), DELETE_CHUNK):
+            session.execute(delete(Presentation).where(
+                Presentation.id.in_(deleted[start:start + DELETE_CHUNK])
+            ))
+    return len(deleted)
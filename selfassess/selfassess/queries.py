@@ -1,42 +1,54 @@
 import quart.flask_patch  # noqa
-from .database import Response, ResponseSlot, ParticipantLanguage, Participant
-from sqlalchemy import select, desc, func
-from sqlalchemy.orm import contains_eager, joinedload, aliased, lazyload
-
-
-def _recent_responses():
-    subq = select(
-        Response,
-        func.row_number().over(
-            partition_by=Response.response_slot_id,
-            order_by=desc(Response.timestamp)
-        ).label("rownb")
-    )
-    subq = subq.subquery(name="subq")
-    aliased_responses = aliased(Response, alias=subq)
-    return subq, aliased_responses
+from .database import (
+    Response, ResponseSlot, ParticipantLanguage, Participant, Word,
+    MiniexamSlot, MiniexamResponse, LatestResponse, WordListVersion,
+    Presentation, ParticipantSession
+)
+from sqlalchemy import select, update, func, bindparam
+from sqlalchemy.orm import contains_eager, joinedload, lazyload
+
+
+# The id of the only row of word_list_version
+WORD_LIST_VERSION_ID = 1
 
 
 def recent_responses():
-    subq, aliased_responses = _recent_responses()
     return (
-        select(aliased_responses)
-        .options(joinedload(aliased_responses.slot))
-        .filter(subq.c.rownb == 1)
+        select(Response)
+        .join(LatestResponse, LatestResponse.response_id == Response.id)
+        .options(joinedload(Response.slot))
     )
 
 
 def recent_responses_for_participant(participant):
-    subq, aliased_responses = _recent_responses()
     return (
-        select(aliased_responses)
-        .join(aliased_responses.slot)
-        .options(contains_eager(aliased_responses.slot))
-        .filter(ResponseSlot.participant_id == participant.id)
-        .filter(subq.c.rownb == 1)
+        select(Response)
+        .join(LatestResponse, LatestResponse.response_id == Response.id)
+        .join(Response.slot)
+        .options(contains_eager(Response.slot))
+        .filter(LatestResponse.participant_id == participant.id)
     )
 
 
+def miniexam_pool_sizes(participant_id):
+    return select(LatestResponse.rating, func.count()).where(
+        LatestResponse.participant_id == participant_id
+    ).group_by(LatestResponse.rating)
+
+
+def miniexam_pool_sample(participant_id, rating, count):
+    """
+    A uniform random sample of `count` word ids out of those the participant
+    currently gives `rating`.
+    """
+    return select(ResponseSlot.word_id).join(
+        LatestResponse, LatestResponse.response_slot_id == ResponseSlot.id
+    ).where(
+        (LatestResponse.participant_id == participant_id)
+        & (LatestResponse.rating == rating)
+    ).order_by(LatestResponse.sample_key).limit(count)
+
+
 def native_language(user):
     return select(ParticipantLanguage).filter(
         ParticipantLanguage.primary_native.is_(True) &
@@ -60,5 +72,130 @@ def participant_timeline_query():
             joinedload(ResponseSlot.responses),
             joinedload(ResponseSlot.presentations)
         ),
-        lazyload(Participant.session_log_entries)
+        lazyload(Participant.session_log_entries),
+        lazyload(Participant.activity_intervals),
+        lazyload(Participant.participant_sessions)
+    )
+
+
+def participant_for_token(token):
+    return select(Participant).filter_by(token=token)
+
+
+def word_list_version():
+    return select(WordListVersion.version).where(
+        WordListVersion.id == WORD_LIST_VERSION_ID
+    )
+
+
+def all_words():
+    return select(Word.id, Word.word)
+
+
+def upcoming_response_slots(participant_id, start, count):
+    return select(
+        ResponseSlot.id,
+        ResponseSlot.word_id,
+        ResponseSlot.response_order
+    ).where(
+        (ResponseSlot.participant_id == participant_id)
+        & (ResponseSlot.response_order >= start)
+        & (ResponseSlot.response_order < start + count)
+    ).order_by(ResponseSlot.response_order)
+
+
+def response_slot_id_at(participant_id, response_order):
+    return select(ResponseSlot.id).filter_by(
+        participant_id=participant_id,
+        response_order=response_order,
+    )
+
+
+def response_at(participant_id, word_id, timestamp):
+    return select(Response.id).join(
+        ResponseSlot, Response.response_slot_id == ResponseSlot.id
+    ).where(
+        (ResponseSlot.participant_id == participant_id)
+        & (ResponseSlot.word_id == word_id)
+        & (Response.timestamp == timestamp)
+    ).limit(1)
+
+
+def participant_position(participant_id):
+    return select(Participant.next_response, Participant.undo).where(
+        Participant.id == participant_id
+    )
+
+
+def latest_presentation(response_slot_id):
+    return select(Presentation.id, Presentation.timestamp).where(
+        Presentation.response_slot_id == response_slot_id
+    ).order_by(Presentation.timestamp.desc()).limit(1)
+
+
+def response_since(response_slot_id, timestamp):
+    return select(Response.id).where(
+        (Response.response_slot_id == response_slot_id)
+        & (Response.timestamp >= timestamp)
+    ).limit(1)
+
+
+def miniexam_slot_ids(user):
+    return select(MiniexamSlot.word_id, MiniexamSlot.id).where(
+        MiniexamSlot.participant_id == user.id
+    ).order_by(MiniexamSlot.id)
+
+
+def miniexam_word_ids(user):
+    return select(MiniexamSlot.word_id).where(
+        MiniexamSlot.participant_id == user.id
+    ).order_by(
+        MiniexamSlot.miniexam_order
+    )
+
+
+def participant_miniexam_query(user):
+    return select(Participant).filter_by(id=user.id).options(
+        joinedload(Participant.miniexam_slots).options(
+            joinedload(MiniexamSlot.word),
+            joinedload(MiniexamSlot.responses)
+        ),
     )
+
+
+def update_miniexam_responses():
+    """
+    An UPDATE to be executed with a list of parameter dicts with keys resp_id,
+    timestamp, response_lang, response_type and response.
+    """
+    table = MiniexamResponse.__table__
+    return update(table).where(
+        table.c.id == bindparam("resp_id")
+    ).values(
+        timestamp=bindparam("timestamp"),
+        response_lang=bindparam("response_lang"),
+        response_type=bindparam("response_type"),
+        response=bindparam("response"),
+    )
+
+
+def sessions_between(participant_id, kind, start, end):
+    """
+    A participant's sessions of a kind which overlap start to end.
+    """
+    return select(ParticipantSession).where(
+        (ParticipantSession.participant_id == participant_id)
+        & (ParticipantSession.kind == kind)
+        & (ParticipantSession.start_time <= end)
+        & (ParticipantSession.end_time >= start)
+    ).order_by(ParticipantSession.start_time)
+
+
+def lock_participants(participant_ids):
+    """
+    Lock participants' rows until the end of the transaction, in order of id
+    so that two transactions cannot each wait for a row the other has.
+    """
+    return select(Participant.id).where(
+        Participant.id.in_(participant_ids)
+    ).order_by(Participant.id).with_for_update()
@@ -0,0 +1,124 @@
+"""
+Rebuild the participant_session table, which the website keeps up to date as
+it writes activity (see selfassess.sessions), with the batch algorithm of
+selfassess.export.utils, e.g. to fill it after upgrading. With --verify, only
+compare the two and exit with status 1 if any participant's sessions differ.
+
+    $ python -m selfassess.rebuild_sessions
+    $ python -m selfassess.rebuild_sessions --verify
+"""
+import sys
+from collections import Counter
+
+import click
+from sqlalchemy import delete, insert
+
+from .database import DEVICES, Participant, ParticipantSession
+from .export.utils import get_participant_sessions_by_kind
+from .queries import participant_timeline_query
+from .utils import get_session
+
+
+COLUMNS = (
+    "kind",
+    "start_time",
+    "end_time",
+    "response_count",
+    *(f"{device}_count" for device in DEVICES),
+)
+
+
+def batch_rows(participant):
+    rows = []
+    for kind, sessions in get_participant_sessions_by_kind(participant).items():
+        for part_session in sessions:
+            devices = Counter(part_session["devices"])
+            rows.append(dict(
+                participant_id=participant.id,
+                kind=kind,
+                start_time=part_session["first_timestamp"],
+                end_time=part_session["last_timestamp"],
+                response_count=len(part_session["response"]),
+                **{f"{device}_count": devices[device] for device in DEVICES}
+            ))
+    return rows
+
+
+def row_key(row):
+    return (row["kind"].value, row["start_time"])
+
+
+def fmt_row(row):
+    return " ".join(
+        f"{column}={getattr(row[column], 'name', row[column])}"
+        for column in COLUMNS
+    )
+
+
+def compare(participant, rebuilt):
+    stored = sorted((
+        {column: getattr(part_session, column) for column in COLUMNS}
+        for part_session in participant.participant_sessions
+    ), key=row_key)
+    rebuilt = sorted((
+        {column: row[column] for column in COLUMNS}
+        for row in rebuilt
+    ), key=row_key)
+    if stored == rebuilt:
+        return True
+    print(
+        f"{participant.email}: {len(stored)} sessions in the table, "
+        f"{len(rebuilt)} rebuilt"
+    )
+    for row in stored:
+        if row not in rebuilt:
+            print("  - " + fmt_row(row))
+    for row in rebuilt:
+        if row not in stored:
+            print("  + " + fmt_row(row))
+    return False
+
+
+@click.command()
+@click.option("--verify", is_flag=True)
+@click.argument("email", nargs=-1)
+def main(verify, email):
+    """
+    Rebuild the participant_session table from the session log, activity
+    intervals, responses and presentations. Without any emails, do this for
+    every participant.
+    """
+    session = get_session(read_only=verify)
+    query = participant_timeline_query().order_by(Participant.id)
+    if email:
+        query = query.where(Participant.email.in_(email))
+    participants = session.execute(query).scalars().all()
+    differ = 0
+    sessions = 0
+    for participant in participants:
+        rows = batch_rows(participant)
+        sessions += len(rows)
+        if verify:
+            if not compare(participant, rows):
+                differ += 1
+            continue
+        session.execute(delete(ParticipantSession).where(
+            ParticipantSession.participant_id == participant.id
+        ))
+        if rows:
+            session.execute(insert(ParticipantSession), rows)
+        # One transaction per participant so the website is not held up
+        session.commit()
+    if verify:
+        print(
+            f"{len(participants) - differ}/{len(participants)} participants' "
+            "sessions match"
+        )
+        if differ:
+            sys.exit(1)
+    else:
+        print(f"Rebuilt {sessions} sessions of {len(participants)} participants")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Participant sessions kept up to date as activity is written.
+
+The reporting tools used to build every participant's sessions from scratch
+by sorting all of their session log entries, activity intervals, responses
+and presentations and splitting them wherever there was a gap of more than
+SESSION_TIMEOUT seconds (selfassess.export.utils.events_to_sessions). Instead
+every transaction which writes any of these collects them in an Activity,
+which merges them into the participant_session table: an event joins all of
+the participant's sessions of the same kind within SESSION_TIMEOUT of it into
+one, or starts a new session if there are none. This does not depend on the
+order the events arrive in, so it gives the same sessions as the batch
+algorithm even though e.g. activity intervals are only written once they end.
+
+Sessions are kept separately for the self-assessment, the mini-exam and the
+overview page since most of the reports only want one of them.
+merge_sessions() joins them back together.
+
+Coalescing a repeated presentation (see selfassess.presentations) moves it
+on to the later time but keeps the first as first_timestamp, and the batch
+algorithm counts it from one to the other, so it still covers the times which
+the table has already counted. `python -m selfassess.rebuild_sessions`
+rebuilds the table with the batch algorithm or, with --verify, compares them.
+"""
+import bisect
+import datetime
+from collections import Counter
+
+from .database import (
+    DEVICES, ActivityInterval, ParticipantSession, SessionEvent, SessionKind,
+    SessionLogEntry
+)
+from .queries import lock_participants, sessions_between
+
+
+# Seconds
+SESSION_TIMEOUT = 300
+
+SESSION_EVENT_KINDS = {
+    SessionEvent.overview_hit: SessionKind.other,
+    SessionEvent.selfassess_hit: SessionKind.selfassess,
+    SessionEvent.selfassess_focus: SessionKind.selfassess,
+    SessionEvent.selfassess_blur: SessionKind.selfassess,
+    SessionEvent.selfassess_input: SessionKind.selfassess,
+    SessionEvent.miniexam_focus: SessionKind.miniexam,
+    SessionEvent.miniexam_blur: SessionKind.miniexam,
+    SessionEvent.miniexam_input: SessionKind.miniexam,
+}
+
+
+def event_kind(event):
+    """
+    The kind of session a session log entry, activity interval, response or
+    presentation belongs to.
+    """
+    if isinstance(event, SessionLogEntry):
+        return SESSION_EVENT_KINDS[event.type]
+    elif isinstance(event, ActivityInterval):
+        return SessionKind[event.kind.name]
+    else:
+        return SessionKind.selfassess
+
+
+class _Span:
+    def __init__(self, start_time, end_time):
+        self.start_time = start_time
+        self.end_time = end_time
+        self.response_count = 0
+        self.device_counts = Counter()
+
+
+def _absorb(participant_session, other):
+    participant_session.start_time = min(
+        participant_session.start_time, other.start_time
+    )
+    participant_session.end_time = max(
+        participant_session.end_time, other.end_time
+    )
+    participant_session.response_count += other.response_count
+    for device, count in other.device_counts.items():
+        column = f"{device}_count"
+        setattr(
+            participant_session,
+            column,
+            getattr(participant_session, column) + count
+        )
+
+
+async def merge_span(session, participant_id, kind, span):
+    timeout = datetime.timedelta(seconds=SESSION_TIMEOUT)
+    touching = (await session.execute(sessions_between(
+        participant_id, kind, span.start_time - timeout, span.end_time + timeout
+    ))).scalars().all()
+    if touching:
+        participant_session, *merged = touching
+    else:
+        participant_session = ParticipantSession(
+            participant_id=participant_id,
+            kind=kind,
+            start_time=span.start_time,
+            end_time=span.end_time,
+            response_count=0,
+            **{f"{device}_count": 0 for device in DEVICES}
+        )
+        session.add(participant_session)
+        merged = []
+    for other in merged:
+        _absorb(participant_session, other)
+        await session.delete(other)
+    _absorb(participant_session, span)
+
+
+class Activity:
+    """
+    The activity written by one transaction. Events are grouped into spans
+    with no gaps longer than SESSION_TIMEOUT first so that e.g. a response
+    and the next presentation only look up the participant's sessions once.
+    """
+
+    def __init__(self):
+        self._events = {}
+
+    def add(
+        self,
+        participant_id,
+        kind,
+        start_time,
+        end_time=None,
+        responses=0,
+        device=None,
+        device_count=1,
+    ):
+        self._events.setdefault((participant_id, kind), []).append((
+            start_time,
+            end_time or start_time,
+            responses,
+            {device: device_count} if device is not None else {},
+        ))
+
+    def response(self, participant_id, timestamp):
+        self.add(participant_id, SessionKind.selfassess, timestamp, responses=1)
+
+    def presentation(self, participant_id, timestamp):
+        self.add(participant_id, SessionKind.selfassess, timestamp)
+
+    def spans(self):
+        timeout = datetime.timedelta(seconds=SESSION_TIMEOUT)
+        for key, events in self._events.items():
+            events.sort(key=lambda event: event[0])
+            span = None
+            for start_time, end_time, responses, devices in events:
+                if span is None or start_time - span.end_time > timeout:
+                    if span is not None:
+                        yield key, span
+                    span = _Span(start_time, end_time)
+                span.end_time = max(span.end_time, end_time)
+                span.response_count += responses
+                span.device_counts.update(devices)
+            yield key, span
+
+    async def write(self, session):
+        if not self._events:
+            return
+        # Reading a participant's sessions and merging into them must not
+        # interleave with another transaction doing the same, which on
+        # PostgreSQL could otherwise leave two overlapping sessions or lose
+        # one's counts. SQLite transactions already take the write lock when
+        # they begin (see selfassess.utils).
+        await session.execute(lock_participants(sorted({
+            participant_id for participant_id, _ in self._events
+        })))
+        for (participant_id, kind), span in self.spans():
+            await merge_span(session, participant_id, kind, span)
+
+
+def sessions_of_kind(participant, kind):
+    return [
+        participant_session
+        for participant_session in participant.participant_sessions
+        if participant_session.kind == kind
+    ]
+
+
+def merge_sessions(sessions):
+    """
+    Join sessions of different kinds into sessions of all activity. Returns
+    a list of (start time, end time).
+    """
+    timeout = datetime.timedelta(seconds=SESSION_TIMEOUT)
+    merged = []
+    for participant_session in sorted(
+        sessions, key=lambda participant_session: participant_session.start_time
+    ):
+        if (
+            merged
+            and participant_session.start_time - merged[-1][1] <= timeout
+        ):
+            merged[-1][1] = max(merged[-1][1], participant_session.end_time)
+        else:
+            merged.append([
+                participant_session.start_time, participant_session.end_time
+            ])
+    return [(start_time, end_time) for start_time, end_time in merged]
+
+
+class SessionsOutOfDate(Exception):
+    """
+    The participant_session table is missing some of a participant's
+    activity, e.g. because it was written before the table was added.
+    """
+
+
+def session_index(sessions, timestamp):
+    """
+    The index of the session in `sessions`, which are of one kind and in
+    order, which `timestamp` falls in. Raises SessionsOutOfDate if it falls
+    in none of them.
+    """
+    idx = bisect.bisect_right(
+        [participant_session.start_time for participant_session in sessions],
+        timestamp
+    ) - 1
+    if idx < 0 or timestamp > sessions[idx].end_time:
+        raise SessionsOutOfDate(
+            f"No session contains the activity at {timestamp}. Run "
+            "python -m selfassess.rebuild_sessions to bring them up to date."
+        )
+    return idx
+
+
+def check_sessions(participant):
+    """
+    Raise SessionsOutOfDate unless all of a participant's responses are in
+    their stored self-assessment sessions, so that reports of the time they
+    spent do not quietly come up short.
+    """
+    selfassess_sessions = sessions_of_kind(participant, SessionKind.selfassess)
+    for slot in participant.response_slots:
+        for response in slot.responses:
+            session_index(selfassess_sessions, response.timestamp)
@@ -0,0 +1,219 @@
+"""
+Seeded word orders.
+
+Originally every participant got one ResponseSlot row per word at enrollment
+time, giving their (shuffled) word order. Participants enrolled with a seed
+instead only store `slot_seed` and `slot_words`, the number of words in the
+word list when they were enrolled. Their first `slot_words` response orders
+are mapped to words by a keyed pseudorandom permutation, and the ResponseSlot
+row for an order is only created once the word is actually shown. Since every
+slot with presentations or responses still has a row, the existing queries and
+exports work unchanged. Words added after enrollment (see extra_words) get
+ordinary rows with orders from `slot_words` onwards.
+"""
+import random
+from collections import namedtuple
+
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
+
+from .database import ResponseSlot, Word
+from .queries import upcoming_response_slots, response_slot_id_at
+
+
+# The parts of a Participant which determine their word order
+SlotOrder = namedtuple("SlotOrder", ["id", "slot_seed", "slot_words"])
+
+
+class Permutation:
+    """
+    A keyed permutation of range(size) built from a balanced Feistel network,
+    using cycle walking to stay within the range. Both directions are O(1).
+    """
+    ROUNDS = 6
+
+    def __init__(self, size, seed):
+        self.size = size
+        bits = max((size - 1).bit_length(), 2)
+        bits += bits % 2
+        self.half = bits // 2
+        self.mask = (1 << self.half) - 1
+        rng = random.Random(seed)
+        self.keys = [rng.getrandbits(32) for _ in range(self.ROUNDS)]
+
+    def _round(self, x, key):
+        x = ((x ^ key) * 0x45d9f3b) & 0xffffffff
+        x ^= x >> 16
+        return x & self.mask
+
+    def _encrypt(self, x):
+        left, right = x >> self.half, x & self.mask
+        for key in self.keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self.half) | right
+
+    def _decrypt(self, x):
+        left, right = x >> self.half, x & self.mask
+        for key in reversed(self.keys):
+            left, right = right ^ self._round(left, key), left
+        return (left << self.half) | right
+
+    def _walk(self, step, x):
+        if not 0 <= x < self.size:
+            raise IndexError(x)
+        x = step(x)
+        while x >= self.size:
+            x = step(x)
+        return x
+
+    def __call__(self, idx):
+        return self._walk(self._encrypt, idx)
+
+    def inverse(self, idx):
+        return self._walk(self._decrypt, idx)
+
+    def __len__(self):
+        return self.size
+
+
+def is_seeded(participant):
+    return participant.slot_seed is not None
+
+
+def participant_permutation(participant):
+    return Permutation(participant.slot_words, participant.slot_seed)
+
+
+def assign_seed(session, participant, num_words=None):
+    """
+    Give a new participant a seeded word order over the current word list.
+    """
+    if num_words is None:
+        num_words = session.execute(
+            select(func.count()).select_from(Word)
+        ).scalar()
+    participant.slot_seed = random.getrandbits(31)
+    participant.slot_words = num_words
+
+
+_word_ids = []
+
+
+def _load_word_ids(rows):
+    global _word_ids
+    _word_ids = [word_id for word_id, in rows]
+
+
+def _word_ids_query():
+    return select(Word.id).order_by(Word.id)
+
+
+def word_ids_sync(session, min_words):
+    """
+    All word ids in ascending order. New words always get bigger ids, so the
+    first n of these are the word list as it was when it had n words. The web
+    app gets them from its WordList instead.
+    """
+    if len(_word_ids) < min_words:
+        _load_word_ids(session.execute(_word_ids_query()))
+    return _word_ids
+
+
+def seeded_word_ids(participant, all_word_ids, start, stop):
+    """
+    Word ids for response orders range(start, stop) clipped to the seeded part
+    of the participant's order.
+    """
+    perm = participant_permutation(participant)
+    return [
+        (response_order, all_word_ids[perm(response_order)])
+        for response_order in range(start, min(stop, participant.slot_words))
+    ]
+
+
+def slot_order(participant):
+    return SlotOrder(
+        participant.id,
+        participant.slot_seed,
+        participant.slot_words
+    )
+
+
+async def upcoming_words(session, word_list, participant, start, count):
+    """
+    Rows of (slot id, word id, word, response order) for the response orders
+    range(start, start + count). The slot id is None for seeded slots which
+    have not been created yet. Only ids come from the database and the words
+    from `word_list`.
+    """
+    rows = {
+        response_order: (slot_id, word_id)
+        for slot_id, word_id, response_order in await session.execute(
+            upcoming_response_slots(participant.id, start, count)
+        )
+    }
+    store = (await word_list.get(session, participant.slot_words or 0)).words
+    if is_seeded(participant) and start < participant.slot_words:
+        for response_order, word_id in seeded_word_ids(
+            participant, store.ids, start, start + count
+        ):
+            rows.setdefault(response_order, (None, word_id))
+    if any(word_id not in store for _, word_id in rows.values()):
+        # Words added since the snapshot was taken
+        store = (await word_list.reload(session)).words
+    return [
+        (slot_id, word_id, store[word_id], response_order)
+        for response_order, (slot_id, word_id) in sorted(rows.items())
+    ]
+
+
+async def ensure_slot(session, participant_id, response_order, word_id):
+    """
+    Get the id of a participant's slot for `response_order`, creating it if
+    this is the first time the word is needed.
+    """
+    query = response_slot_id_at(participant_id, response_order)
+    slot_id = (await session.execute(query)).scalar()
+    if slot_id is not None:
+        return slot_id
+    slot = ResponseSlot(
+        participant_id=participant_id,
+        response_order=response_order,
+        word_id=word_id,
+    )
+    try:
+        async with session.begin_nested():
+            session.add(slot)
+    except IntegrityError:
+        # Created concurrently by another request
+        return (await session.execute(query)).scalar()
+    return slot.id
+
+
+def materialise(session, participant):
+    """
+    Create all missing ResponseSlot rows for a seeded participant, giving the
+    same rows as a participant enrolled the old way.
+    """
+    existing = {
+        response_order
+        for response_order, in session.execute(
+            select(ResponseSlot.response_order)
+            .filter_by(participant_id=participant.id)
+        )
+    }
+    all_word_ids = word_ids_sync(session, participant.slot_words)
+    rows = [
+        dict(
+            participant_id=participant.id,
+            response_order=response_order,
+            word_id=word_id,
+        )
+        for response_order, word_id in seeded_word_ids(
+            participant, all_word_ids, 0, participant.slot_words
+        )
+        if response_order not in existing
+    ]
+    if rows:
+        session.execute(ResponseSlot.__table__.insert(), rows)
+    return len(rows)
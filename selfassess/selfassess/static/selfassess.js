@@ -0,0 +1,282 @@
+// Shows self-assessment words from a local buffer filled by /selfassess/batch
+// and sends the ratings in the background, so there is no round trip between
+// words. Without JavaScript the form falls back to posting each rating.
+(function () {
+    var script = document.currentScript;
+    var batchUrl = script.dataset.batchUrl;
+    var overviewUrl = script.dataset.overviewUrl;
+    // Send ratings once this many have built up or the oldest is this old
+    var FLUSH_SIZE = 10;
+    var FLUSH_DELAY = 5000;
+    // Fetch more words once fewer than this many are left in the buffer
+    var LOW_WATER = 5;
+    var MAX_RETRY_DELAY = 30000;
+
+    var form = document.getElementById("selfassessform");
+    // Take the form over before htmx binds it
+    form.removeAttribute("hx-post");
+    var wordinfo = document.getElementById("wordinfo");
+    var progress = document.getElementById("progress");
+
+    var state = {
+        ready: false,
+        leaving: false,
+        // response order -> {word_id, word}
+        words: new Map(),
+        position: 0,
+        undo: false,
+        totalWords: 0,
+        complete: Number(form.elements.complete.value),
+        target: form.elements.count ? Number(form.elements.count.value) : null,
+        // The word on the page was rendered by /selfassess, which recorded
+        // its presentation
+        presentedAt: null,
+        pending: [],
+        inflight: null,
+        flushTimer: null,
+        retryDelay: 1000,
+        nextUndo: false,
+        // Set once the requested number of words have been rated
+        doneBatch: null,
+        // How far the server's clock is ahead of this one, which the times
+        // sent with the ratings are in
+        clockOffset: 0
+    };
+
+    function serverNow() {
+        return Date.now() + state.clockOffset;
+    }
+
+    function escapeHtml(text) {
+        var div = document.createElement("div");
+        div.textContent = text;
+        return div.innerHTML;
+    }
+
+    function render() {
+        var entry = state.words.get(state.position);
+        var html = "";
+        if (!state.undo && state.position > 0) {
+            html += '<button type="button" name="undo" class="absolute left-0 top-0">← undo</button>';
+        }
+        html += '<h3 class="tr ma0 normal f4 f3-ns">' + (state.complete + 1) + "/" +
+            (state.target !== null ? state.target : "unlimited") + "</h3>";
+        if (entry === undefined) {
+            html += '<h1 class="f2 f1-ns">…</h1>';
+        } else {
+            var size = entry.word.length >= 18 ? "f3" : "f2";
+            html += '<h1 class="' + size + ' f1-ns">' + escapeHtml(entry.word) + "</h1>";
+        }
+        wordinfo.innerHTML = html;
+        progress.textContent = (state.undo ? "(undo) " : "") +
+            Math.min(state.position + 1, state.totalWords) + "/" + state.totalWords;
+    }
+
+    function leave(url) {
+        state.leaving = true;
+        window.location = url;
+    }
+
+    function applyState(data) {
+        if (data.redirect) {
+            leave(data.redirect);
+            return;
+        }
+        state.clockOffset = data.now - Date.now();
+        data.words.forEach(function (entry, idx) {
+            state.words.set(data.start + idx, entry);
+        });
+        state.totalWords = data.total_words;
+        if (!state.ready) {
+            state.position = data.position;
+            state.undo = data.undo;
+            state.ready = true;
+        }
+        // Only the previous word is needed for undo
+        state.words.forEach(function (_, order) {
+            if (order < state.position - 1) {
+                state.words.delete(order);
+            }
+        });
+        render();
+    }
+
+    function bufferedAhead() {
+        var count = 0;
+        while (state.words.has(state.position + count)) {
+            count++;
+        }
+        return count;
+    }
+
+    function needsWords() {
+        var ahead = bufferedAhead();
+        return ahead < LOW_WATER && state.position + ahead < state.totalWords;
+    }
+
+    function scheduleFlush() {
+        if (
+            state.doneBatch !== null ||
+            state.pending.length >= FLUSH_SIZE ||
+            needsWords() ||
+            !state.words.has(state.position)
+        ) {
+            flush();
+        } else if (state.flushTimer === null && state.pending.length) {
+            state.flushTimer = setTimeout(flush, FLUSH_DELAY);
+        }
+    }
+
+    function flush(options) {
+        options = options || {};
+        if (state.flushTimer !== null) {
+            clearTimeout(state.flushTimer);
+            state.flushTimer = null;
+        }
+        if (state.inflight !== null) {
+            return;
+        }
+        state.inflight = {records: state.pending, doneBatch: state.doneBatch};
+        state.pending = [];
+        send(options.keepalive);
+    }
+
+    function send(keepalive) {
+        var url = batchUrl;
+        if (state.inflight.doneBatch !== null) {
+            url += "?done_batch=" + state.inflight.doneBatch;
+        }
+        fetch(url, {
+            method: "POST",
+            headers: {"Content-Type": "application/json"},
+            body: JSON.stringify(state.inflight.records),
+            credentials: "same-origin",
+            keepalive: !!keepalive
+        }).then(function (resp) {
+            // A 400 means the server will never take these ratings so there
+            // is no point in sending them again
+            if (resp.status === 401 || resp.status === 400) {
+                leave(overviewUrl);
+                return null;
+            }
+            if (!resp.ok && resp.status !== 409) {
+                throw new Error("HTTP " + resp.status);
+            }
+            return resp.json();
+        }).then(function (data) {
+            state.inflight = null;
+            if (data !== null && data.queued) {
+                // Offline, so the service worker has kept the ratings to send
+                // later. Only asking for more words needs trying again.
+                retryLater(scheduleFlush);
+                return;
+            }
+            state.retryDelay = 1000;
+            if (data !== null) {
+                applyState(data);
+            }
+            if (!state.leaving) {
+                scheduleFlush();
+            }
+        }).catch(function () {
+            // Retry the same records on their own so the server can spot a
+            // batch it already has
+            retryLater(function () {
+                send(false);
+            });
+        });
+    }
+
+    function retryLater(fn) {
+        setTimeout(fn, state.retryDelay);
+        state.retryDelay = Math.min(state.retryDelay * 2, MAX_RETRY_DELAY);
+    }
+
+    function rate(rating) {
+        var entry = state.words.get(state.position);
+        if (!state.ready || state.leaving || state.doneBatch !== null || entry === undefined) {
+            return;
+        }
+        // Answer times identify a batch which is sent twice so keep them
+        // distinct
+        var now = Math.max(serverNow(), (state.presentedAt || 0) + 1);
+        state.pending.push({
+            word_id: entry.word_id,
+            rating: rating,
+            presented_at: state.presentedAt,
+            answered_at: now,
+            undo: state.nextUndo
+        });
+        state.nextUndo = false;
+        if (state.undo) {
+            state.undo = false;
+        } else {
+            state.complete++;
+        }
+        state.position++;
+        state.presentedAt = now;
+        if (state.target !== null && state.complete >= state.target) {
+            state.doneBatch = state.target;
+            flush();
+            return;
+        }
+        render();
+        scheduleFlush();
+    }
+
+    function undo() {
+        if (!state.ready || state.doneBatch !== null || state.undo || state.position === 0) {
+            return;
+        }
+        state.position--;
+        state.undo = true;
+        state.nextUndo = true;
+        state.presentedAt = serverNow();
+        render();
+    }
+
+    form.addEventListener("click", function (evt) {
+        var button = evt.target.closest("button");
+        if (button === null) {
+            return;
+        }
+        evt.preventDefault();
+        if (button.name === "undo") {
+            undo();
+        } else if (button.name === "rating") {
+            rate(Number(button.value));
+        }
+    });
+    wordinfo.addEventListener("touchstart", function (evt) {
+        if (evt.target.closest("button[name=undo]")) {
+            evt.preventDefault();
+            undo();
+        }
+    });
+    form.addEventListener("submit", function (evt) {
+        evt.preventDefault();
+    });
+    window.addEventListener("online", function () {
+        state.retryDelay = 1000;
+        if (state.ready && !state.leaving) {
+            scheduleFlush();
+        }
+    });
+    document.addEventListener("visibilitychange", function () {
+        if (document.visibilityState === "hidden" && state.pending.length) {
+            flush({keepalive: true});
+        }
+    });
+
+    fetch(batchUrl, {credentials: "same-origin"}).then(function (resp) {
+        if (resp.status === 401) {
+            leave(overviewUrl);
+            return null;
+        }
+        return resp.json();
+    }).then(function (data) {
+        if (data !== null) {
+            applyState(data);
+        }
+    });
+})();
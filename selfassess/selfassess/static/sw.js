@@ -1,3 +0,0 @@
-self.addEventListener('fetch', function() {
-    return;
-});
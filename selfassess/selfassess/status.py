@@ -1,9 +1,9 @@
 import click
 from selfassess.utils import get_session
-from selfassess.export.utils import gather_events, events_to_sessions
+from selfassess.sessions import SessionsOutOfDate, check_sessions, sessions_of_kind
 from sqlalchemy import select
 from sqlalchemy import func
-from selfassess.database import Word
+from selfassess.database import SessionKind, Word
 from selfassess.quali import num_to_cefr
 from selfassess.queries import participant_timeline_query, native_language, latest_selfassess_response
 from datetime import date
@@ -23,13 +23,17 @@ def participant_cefr(participant):
 
 
 def print_participant(lang, total_words, participant):
-    selfassess_events = gather_events(participant, only_selfassess=True)
-    miniexam_events = gather_events(participant, only_miniexam=True)
+    try:
+        check_sessions(participant)
+    except SessionsOutOfDate as exc:
+        raise click.ClickException(f"{participant.email}: {exc}")
+    selfassess_sessions = sessions_of_kind(participant, SessionKind.selfassess)
+    miniexam_sessions = sessions_of_kind(participant, SessionKind.miniexam)
     last_timestamp = None
-    if len(selfassess_events):
-        last_timestamp = selfassess_events[-1][0]
-    if len(miniexam_events):
-        last_timestamp = miniexam_events[-1][0]
+    if len(selfassess_sessions):
+        last_timestamp = selfassess_sessions[-1].end_time
+    if len(miniexam_sessions):
+        last_timestamp = miniexam_sessions[-1].end_time
     cefr = num_to_cefr(participant_cefr(participant))
     if participant.given_name:
         name = f" ({participant.given_name} {participant.surname})"
@@ -53,9 +57,8 @@ def print_participant(lang, total_words, participant):
             for line in participant.text_on_proof.split("\n")
         ))
     ))
-    selfassess_sessions = events_to_sessions(selfassess_events)
     total_mins = int(sum((
-        part_session["time"].total_seconds()
+        part_session.time.total_seconds()
         for part_session in selfassess_sessions
     )) // 60)
     completed_words = participant.next_response
@@ -260,7 +263,7 @@ def main(ignore, show_all, to_action):
         status_cls = ToActionStatus
     else:
         status_cls = NormalStatus
-    sqlite_sess = get_session()
+    sqlite_sess = get_session(read_only=True)
     participants = sqlite_sess.execute(participant_timeline_query()).scalars()
     grid_groups = GridAgg()
     status_groups = {status: [] for status in status_cls.STATUSES}
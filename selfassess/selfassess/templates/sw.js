@@ -0,0 +1,240 @@
+// Served from /sw.js by the app so that it controls the whole site.
+//
+// Static assets are served cache first. Their URLs carry a hash of their
+// contents (see static_url() in app.py) and VERSION is a hash of them all, so
+// a deploy which changes any of them installs a new worker which starts a new
+// cache and deletes the old ones.
+//
+// Ratings POSTed to /selfassess/batch which cannot reach the server are kept
+// in IndexedDB and replayed in order once it can be reached again, before any
+// newer ones. The server recognises a batch it has already written, so a
+// replay which did in fact get through the first time is harmless.
+var VERSION = {{ version | tojson }};
+var CACHE = "static-" + VERSION;
+var PRECACHE = {{ precache | tojson }};
+var STATIC_PREFIX = {{ static_prefix | tojson }};
+var BATCH_URL = {{ batch_url | tojson }};
+// Pinned versions so safe to cache forever
+var CDN_PREFIX = "https://unpkg.com/";
+var DB_NAME = "selfassess";
+var STORE = "pending_ratings";
+var SYNC_TAG = "selfassess-ratings";
+
+self.addEventListener("install", function (event) {
+    event.waitUntil(
+        caches.open(CACHE).then(function (cache) {
+            return cache.addAll(PRECACHE);
+        }).then(function () {
+            return self.skipWaiting();
+        })
+    );
+});
+
+self.addEventListener("activate", function (event) {
+    event.waitUntil(
+        caches.keys().then(function (names) {
+            return Promise.all(names.filter(function (name) {
+                return name.startsWith("static-") && name !== CACHE;
+            }).map(function (name) {
+                return caches.delete(name);
+            }));
+        }).then(function () {
+            return self.clients.claim();
+        })
+    );
+});
+
+function cacheFirst(request) {
+    return caches.open(CACHE).then(function (cache) {
+        return cache.match(request).then(function (cached) {
+            if (cached) {
+                return cached;
+            }
+            return fetch(request).then(function (resp) {
+                // Opaque CDN responses have status 0 but are fine to keep
+                if (resp.ok || resp.type === "opaque") {
+                    cache.put(request, resp.clone());
+                }
+                return resp;
+            });
+        });
+    });
+}
+
+function openDb() {
+    return new Promise(function (resolve, reject) {
+        var req = indexedDB.open(DB_NAME, 1);
+        req.onupgradeneeded = function () {
+            req.result.createObjectStore(STORE, {autoIncrement: true});
+        };
+        req.onsuccess = function () {
+            resolve(req.result);
+        };
+        req.onerror = function () {
+            reject(req.error);
+        };
+    });
+}
+
+function storeRequest(mode, fn) {
+    return openDb().then(function (db) {
+        return new Promise(function (resolve, reject) {
+            var tx = db.transaction(STORE, mode);
+            var result = fn(tx.objectStore(STORE));
+            tx.oncomplete = function () {
+                db.close();
+                resolve(result.result);
+            };
+            tx.onerror = tx.onabort = function () {
+                db.close();
+                reject(tx.error);
+            };
+        });
+    });
+}
+
+function enqueue(url, body) {
+    return storeRequest("readwrite", function (store) {
+        return store.add({url: url, body: body});
+    }).then(function () {
+        if (self.registration.sync) {
+            return self.registration.sync.register(SYNC_TAG).catch(function () {});
+        }
+    });
+}
+
+function oldest() {
+    return openDb().then(function (db) {
+        return new Promise(function (resolve, reject) {
+            var req = db.transaction(STORE).objectStore(STORE).openCursor();
+            req.onsuccess = function () {
+                db.close();
+                var cursor = req.result;
+                resolve(cursor ? {key: cursor.key, value: cursor.value} : null);
+            };
+            req.onerror = function () {
+                db.close();
+                reject(req.error);
+            };
+        });
+    });
+}
+
+function post(url, body) {
+    return fetch(url, {
+        method: "POST",
+        headers: {"Content-Type": "application/json"},
+        body: body,
+        credentials: "same-origin"
+    });
+}
+
+// Whether the server has dealt with a batch for good: it was written, or it
+// was rejected as malformed (400) or out of date (409) so sending it again
+// would not help. A server error, an opaque response or being redirected
+// e.g. to log in again means it should be kept and retried.
+function settled(resp) {
+    if (resp.redirected) {
+        return false;
+    }
+    return resp.ok || resp.status === 400 || resp.status === 409;
+}
+
+// Send the queued batches oldest first. Resolves to whether the queue is now
+// empty, stopping at the first one which cannot reach the server or which
+// the server has not settled, so that background sync tries it again later.
+function replay() {
+    return oldest().then(function (entry) {
+        if (entry === null) {
+            return true;
+        }
+        return post(entry.value.url, entry.value.body).then(function (resp) {
+            if (!settled(resp)) {
+                return false;
+            }
+            return storeRequest("readwrite", function (store) {
+                return store.delete(entry.key);
+            }).then(replay);
+        }, function () {
+            return false;
+        });
+    });
+}
+
+// Batches go out one at a time so they reach the server in order
+var lock = Promise.resolve();
+
+function serialise(fn) {
+    var result = lock.then(fn);
+    lock = result.catch(function () {});
+    return result;
+}
+
+function queued() {
+    return new Response(JSON.stringify({queued: true}), {
+        status: 202,
+        headers: {"Content-Type": "application/json"}
+    });
+}
+
+function sendBatch(request) {
+    return request.text().then(function (body) {
+        return serialise(function () {
+            return replay().then(function (empty) {
+                if (empty) {
+                    return post(request.url, body).catch(function () {
+                        return null;
+                    });
+                }
+                return null;
+            }).then(function (resp) {
+                if (resp !== null) {
+                    return resp;
+                }
+                // Requests for more words without ratings are not worth
+                // keeping
+                if (JSON.parse(body).length === 0) {
+                    return queued();
+                }
+                return enqueue(request.url, body).then(queued);
+            });
+        });
+    });
+}
+
+self.addEventListener("fetch", function (event) {
+    var request = event.request;
+    var url = new URL(request.url);
+    if (request.method === "POST") {
+        if (url.origin === self.location.origin && url.pathname === BATCH_URL) {
+            event.respondWith(sendBatch(request));
+        }
+        return;
+    }
+    if (request.method !== "GET") {
+        return;
+    }
+    if (
+        (url.origin === self.location.origin && url.pathname.startsWith(STATIC_PREFIX))
+        || request.url.startsWith(CDN_PREFIX)
+    ) {
+        event.respondWith(cacheFirst(request));
+    }
+});
+
+self.addEventListener("sync", function (event) {
+    if (event.tag === SYNC_TAG) {
+        event.waitUntil(serialise(replay).then(function (empty) {
+            if (!empty) {
+                // Ask the browser to try again later
+                throw new Error("Still offline");
+            }
+        }));
+    }
+});
+
+self.addEventListener("message", function (event) {
+    if (event.data === "replay") {
+        event.waitUntil(serialise(replay));
+    }
+});
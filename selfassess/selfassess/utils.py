@@ -9,22 +9,175 @@ def get_database_url(db=None, envvar="DATABASE_URL"):
     return db
 
 
-def get_session(db=None):
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+}
+
+
+def async_database_url(url):
+    """
+    The URL for the same database with the async driver used by the web app.
+    """
+    from sqlalchemy.engine import make_url
+
+    url = make_url(url)
+    backend = url.get_backend_name()
+    return url.set(
+        drivername=f"{backend}+{ASYNC_DRIVERS[backend]}"
+    ).render_as_string(hide_password=False)
+
+
+# Set on every new SQLite connection. Each can be overridden with an
+# environment variable, e.g. SQLITE_BUSY_TIMEOUT=10000. WAL lets readers such
+# as the CLI tools run alongside the web app without blocking it or each
+# other, and busy_timeout makes writers wait for each other rather than
+# failing with "database is locked".
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "mmap_size": 256 * 1024 * 1024,
+    # Negative means KiB rather than pages
+    "cache_size": -64 * 1024,
+}
+SQLITE_POOL_SIZE = 5
+SQLITE_MAX_OVERFLOW = 10
+# For PostgreSQL, per worker process. Can be overridden like the SQLite
+# settings, e.g. PG_POOL_SIZE=20.
+PG_POOL = {
+    "pool_size": 10,
+    "max_overflow": 10,
+    # Seconds
+    "pool_timeout": 30,
+    "pool_recycle": 1800,
+}
+
+
+def sqlite_pragmas(read_only=False):
+    pragmas = {
+        name: os.environ.get("SQLITE_" + name.upper(), default)
+        for name, default in SQLITE_PRAGMAS.items()
+    }
+    if read_only:
+        # Changing the journal mode needs a write. Readers get it from the
+        # database file anyway.
+        del pragmas["journal_mode"]
+        pragmas["query_only"] = "ON"
+    return pragmas
+
+
+def _set_sqlite_pragmas(engine, pragmas):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def pg_pool_options(writer=False):
+    options = {
+        name: int(os.environ.get("PG_" + name.upper(), default))
+        for name, default in PG_POOL.items()
+    }
+    if writer:
+        options.update(pool_size=1, max_overflow=0)
+    # Connections dropped by the server or a proxy are replaced rather than
+    # failing the request
+    options["pool_pre_ping"] = True
+    return options
+
+
+def _is_sqlite_file(url):
+    from sqlalchemy.engine import make_url
+
+    url = make_url(url)
+    return (
+        url.get_backend_name() == "sqlite"
+        and url.database not in (None, "", ":memory:")
+    )
+
+
+def _begin_immediate(engine):
+    from sqlalchemy import event
+
+    # The sqlite3 module only starts transactions implicitly before DML,
+    # which breaks SAVEPOINTs, so start them explicitly instead. IMMEDIATE
+    # takes the write lock straight away so the transaction cannot fail part
+    # way through because another connection started writing first.
+    @event.listens_for(engine, "connect")
+    def disable_implicit_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def begin_immediate(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def create_db_engine(url, is_async=False, read_only=False, writer=False):
+    """
+    Create an engine for `url`. SQLite file databases get the connection
+    pragmas in SQLITE_PRAGMAS and, for the web app, a pool of connections
+    which are kept open rather than the default of opening a new one for every
+    session. PostgreSQL databases get a pool sized by PG_POOL. With
+    `read_only` every statement which would write fails. A `writer` engine is
+    for selfassess.writer: it has a single connection and, with SQLite, its
+    transactions take the write lock as soon as they begin.
+    """
     from sqlalchemy import create_engine
+    from sqlalchemy.engine import make_url
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    kwargs = {"future": True}
+    sqlite_file = _is_sqlite_file(url)
+    if make_url(url).get_backend_name() == "postgresql":
+        kwargs.update(pg_pool_options(writer))
+        if read_only:
+            kwargs["execution_options"] = {"postgresql_readonly": True}
+    if sqlite_file and is_async:
+        from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+        if writer:
+            pool_size, max_overflow = 1, 0
+        else:
+            pool_size = int(os.environ.get("SQLITE_POOL_SIZE", SQLITE_POOL_SIZE))
+            max_overflow = int(os.environ.get(
+                "SQLITE_MAX_OVERFLOW", SQLITE_MAX_OVERFLOW
+            ))
+        kwargs.update(
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+        )
+    if is_async:
+        engine = create_async_engine(url, **kwargs)
+        sync_engine = engine.sync_engine
+    else:
+        engine = sync_engine = create_engine(url, **kwargs)
+    if sqlite_file:
+        _set_sqlite_pragmas(sync_engine, sqlite_pragmas(read_only))
+        if writer:
+            _begin_immediate(sync_engine)
+    return engine
+
+
+def get_session(db=None, read_only=False):
     from sqlalchemy.orm import scoped_session, sessionmaker
 
-    engine = create_engine(get_database_url(db), future=True)
+    engine = create_db_engine(get_database_url(db), read_only=read_only)
     session = sessionmaker(bind=engine, future=True)
     return scoped_session(session)
 
 
-def get_async_session(db=None):
+def get_async_session(db=None, writer=False):
     from sqlalchemy.ext.asyncio import AsyncSession
-    from sqlalchemy.ext.asyncio import create_async_engine
     from sqlalchemy.orm import sessionmaker
 
     url = get_database_url(db, "ASYNC_DATABASE_URL")
-    engine = create_async_engine(url, future=True)
+    engine = create_db_engine(url, is_async=True, writer=writer)
     async_session = sessionmaker(
         engine, expire_on_commit=False, class_=AsyncSession, future=True
     )
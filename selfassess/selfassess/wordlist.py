@@ -0,0 +1,134 @@
+"""
+Each web app worker's copy of the word list.
+
+Words are only ever added to the word list (by initdb and extra_words), and
+whatever adds them also increases the version in the word_list_version table
+in the same transaction. A worker loads the whole list at startup and then,
+at most every `check_interval` seconds, looks the version up by primary key.
+When it has changed the list is loaded again into a new snapshot, which
+replaces the old one in a single assignment, so a request never sees a
+half-loaded list.
+
+The words themselves are kept in a read-only WordStore so that the queries on
+the hot path only need to select integer ids and never join the word table.
+"""
+import sys
+import time
+from array import array
+from collections import namedtuple
+
+from sqlalchemy import update
+
+from .database import WordListVersion
+from .queries import all_words, word_list_version, WORD_LIST_VERSION_ID
+
+
+WordListSnapshot = namedtuple("WordListSnapshot", ["version", "count", "words"])
+
+# Stands in for a Word in templates
+StoredWord = namedtuple("StoredWord", ["id", "word"])
+
+
+class WordStore:
+    """
+    A read-only word list held in arrays: the ids in ascending order, and the
+    (interned) words indexed by id, with a reverse lookup from word to id.
+    Word ids are dense in practice so indexing by id wastes little space.
+    """
+
+    def __init__(self, rows):
+        rows = sorted(rows)
+        self.ids = array("q", (word_id for word_id, _ in rows))
+        self._words = [None] * (self.ids[-1] + 1 if rows else 0)
+        self._ids_by_word = {}
+        for word_id, word in rows:
+            word = sys.intern(word)
+            self._words[word_id] = word
+            self._ids_by_word[word] = word_id
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, word_id):
+        return 0 <= word_id < len(self._words) \
+            and self._words[word_id] is not None
+
+    def __getitem__(self, word_id):
+        """
+        The word with id `word_id`, raising KeyError if it is not in the list.
+        """
+        if word_id not in self:
+            raise KeyError(word_id)
+        return self._words[word_id]
+
+    def id_of(self, word):
+        return self._ids_by_word.get(word)
+
+    def entries(self, word_ids):
+        return [StoredWord(word_id, self[word_id]) for word_id in word_ids]
+
+
+class WordList:
+    def __init__(self, check_interval=5.0, clock=time.monotonic):
+        self.check_interval = check_interval
+        self.clock = clock
+        self.snapshot = None
+        self.loads = 0
+        self._checked = None
+
+    async def _load(self, session, version):
+        words = WordStore((await session.execute(all_words())).all())
+        self.loads += 1
+        return WordListSnapshot(version, len(words), words)
+
+    async def get(self, session, min_words=0):
+        """
+        The current snapshot of the word list, checking whether it has changed
+        if it has not been checked for `check_interval` seconds, or straight
+        away if it has fewer than `min_words` words.
+        """
+        now = self.clock()
+        if (
+            self.snapshot is not None
+            and now - self._checked < self.check_interval
+            and self.snapshot.count >= min_words
+        ):
+            return self.snapshot
+        return await self.reload(session)
+
+    async def reload(self, session):
+        """
+        Check whether the word list has changed now, e.g. because a word id
+        turned up which is newer than the snapshot.
+        """
+        self._checked = self.clock()
+        version = (await session.execute(word_list_version())).scalar()
+        if self.snapshot is None or self.snapshot.version != version:
+            # Concurrent reloads are harmless: the last one wins and they
+            # all load a complete list
+            self.snapshot = await self._load(session, version)
+        return self.snapshot
+
+    async def entries(self, session, word_ids):
+        """
+        StoredWords for `word_ids`, checking for new words if any of them are
+        not in the snapshot.
+        """
+        store = (await self.get(session)).words
+        if any(word_id not in store for word_id in word_ids):
+            store = (await self.reload(session)).words
+        return store.entries(word_ids)
+
+
+def bump_word_list_version(session):
+    """
+    Record that the word list has changed. Call this in the same transaction
+    as the change.
+    """
+    result = session.execute(
+        update(WordListVersion)
+        .where(WordListVersion.id == WORD_LIST_VERSION_ID)
+        .values(version=WordListVersion.version + 1)
+    )
+    if result.rowcount == 0:
+        session.add(WordListVersion(id=WORD_LIST_VERSION_ID, version=1))
@@ -0,0 +1,126 @@
+"""
+Prefetching of the upcoming self-assessment words for each participant.
+
+The order of a participant's words is fixed when they are enrolled, so the
+mapping response_order -> (slot, word) never changes. Only the participant's
+position (next_response/undo) moves, and that is always read from the
+database. Each worker keeps a window of upcoming slots for recently active
+participants keyed by response_order, so a position changed from another tab
+just selects a different key, or falls outside the window and causes a reload.
+"""
+import asyncio
+import logging
+from collections import OrderedDict, namedtuple
+
+from .slots import slot_order, upcoming_words
+
+
+logger = logging.getLogger(__name__)
+
+QueuedWord = namedtuple("QueuedWord", ["slot_id", "word_id", "word"])
+
+
+class _Window:
+    def __init__(self, participant, start, rows):
+        self.participant = participant
+        self.words = {}
+        self.hi = start
+        self.refilling = False
+        self.add(rows)
+
+    def add(self, rows):
+        for slot_id, word_id, word, response_order in rows:
+            self.words[response_order] = QueuedWord(slot_id, word_id, word)
+            self.hi = max(self.hi, response_order + 1)
+
+    def trim(self, response_order):
+        # Keep the previous word around since undo goes back one
+        for old in [k for k in self.words if k < response_order - 1]:
+            del self.words[old]
+
+
+class WordQueue:
+    def __init__(
+        self,
+        session_factory,
+        word_list,
+        size=50,
+        low_water=10,
+        max_participants=256
+    ):
+        self.session_factory = session_factory
+        self.word_list = word_list
+        self.size = size
+        self.low_water = low_water
+        self.max_participants = max_participants
+        self._windows = OrderedDict()
+        self._tasks = set()
+
+    async def _load(self, session, participant, start):
+        return await upcoming_words(
+            session, self.word_list, participant, start, self.size
+        )
+
+    async def get(self, session, participant, response_order):
+        """
+        Get the word at `response_order` for a participant, or None if there
+        is no such slot i.e. the participant has finished.
+        """
+        participant_id = participant.id
+        window = self._windows.get(participant_id)
+        if window is None or response_order not in window.words:
+            participant = slot_order(participant)
+            rows = await self._load(session, participant, response_order)
+            if not rows:
+                # Not cached so that words added later are picked up
+                return None
+            window = _Window(participant, response_order, rows)
+            self._windows[participant_id] = window
+            while len(self._windows) > self.max_participants:
+                self._windows.popitem(last=False)
+        self._windows.move_to_end(participant_id)
+        window.trim(response_order)
+        if (
+            window.hi - response_order <= self.low_water
+            and not window.refilling
+        ):
+            self._refill(participant_id, window)
+        return window.words[response_order]
+
+    def _refill(self, participant_id, window):
+        window.refilling = True
+        task = asyncio.ensure_future(self._do_refill(participant_id, window))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _do_refill(self, participant_id, window):
+        try:
+            async with self.session_factory() as session:
+                rows = await self._load(session, window.participant, window.hi)
+        except Exception:
+            logger.exception("Failed to prefetch words")
+            rows = []
+        # The window may have been replaced while we were waiting
+        if self._windows.get(participant_id) is window:
+            window.add(rows)
+        if rows:
+            window.refilling = False
+
+    def remember_slot(self, participant_id, response_order, slot_id):
+        """
+        Record the id of a slot which has been created since it was queued.
+        """
+        window = self._windows.get(participant_id)
+        if window is None or response_order not in window.words:
+            return
+        window.words[response_order] = \
+            window.words[response_order]._replace(slot_id=slot_id)
+
+    def forget(self, participant_id):
+        self._windows.pop(participant_id, None)
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._windows.clear()
@@ -0,0 +1,126 @@
+"""
+A single writer task for all of a worker's hot-path database writes.
+
+Rather than every request committing its own transaction, and all of them
+contending for the SQLite write lock, requests submit jobs: coroutine functions
+which take a session and make their changes with it. One background task runs
+whatever jobs have built up together in a single transaction (group commit)
+and then resolves each job's future, so a request which awaits `submit()`
+knows its changes are committed.
+
+Every job runs in its own SAVEPOINT, so a job which fails is rolled back on
+its own and its exception is raised in the request which submitted it without
+affecting the other jobs in the batch. Jobs must not commit or roll back the
+session themselves.
+"""
+import asyncio
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class Writer:
+    def __init__(self, session_factory, max_batch=100):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.jobs = 0
+        self.batches = 0
+        self._queue = None
+        self._task = None
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "jobs": self.jobs,
+            "batches": self.batches,
+        }
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """
+        Stop accepting jobs once those already submitted have been run.
+        """
+        if self._task is None:
+            return
+        queue = self._queue
+        self._queue = None
+        await queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, job, *args):
+        """
+        Run `await job(session, *args)` in the next transaction and return its
+        result once the transaction has been committed.
+        """
+        if self._queue is None:
+            raise RuntimeError("Writer is not running")
+        future = asyncio.get_event_loop().create_future()
+        await self._queue.put((job, args, future))
+        return await future
+
+    def _next_batch(self, queue, first):
+        # Take whatever built up while the last batch was being committed
+        batch = [first]
+        while len(batch) < self.max_batch:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _run(self):
+        queue = self._queue
+        done = False
+        while not done:
+            first = await queue.get()
+            if first is None:
+                break
+            batch, done = self._next_batch(queue, first)
+            await self._run_batch(batch)
+
+    async def _run_batch(self, batch):
+        outcomes = []
+        try:
+            async with self.session_factory() as session:
+                if len(batch) == 1:
+                    # No other jobs to protect so skip the SAVEPOINT
+                    job, args, future = batch[0]
+                    async with session.begin():
+                        result = await job(session, *args)
+                    outcomes.append((future, None, result))
+                else:
+                    async with session.begin():
+                        for job, args, future in batch:
+                            try:
+                                async with session.begin_nested():
+                                    result = await job(session, *args)
+                            except Exception as exc:
+                                outcomes.append((future, exc, None))
+                            else:
+                                outcomes.append((future, None, result))
+        except Exception as exc:
+            # A lone job's exception is reported by the request instead
+            if len(batch) > 1:
+                logger.exception("Failed to commit %d jobs", len(batch))
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        self.jobs += len(batch)
+        self.batches += 1
+        for future, exc, result in outcomes:
+            if future.done():
+                # The submitting request was cancelled
+                continue
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)